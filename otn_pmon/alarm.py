@@ -14,47 +14,314 @@
 ##
 
 import time
+import threading
 import otn_pmon.db as db
 from otn_pmon.common import *
 
 _alarms = {
     "FAN_FAIL"           : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "FAN CARD FAIL"},
-    "FAN_HIGH"           : {"severity" : "NOT_ALARMED", "service_affect" : "false", "text" : "FAN HIGH SPEED"},
-    "FAN_LOW"            : {"severity" : "NOT_ALARMED", "service_affect" : "false", "text" : "FAN LOW SPEED"},
+    "FAN_HIGH"           : {"severity" : "NOT_ALARMED", "service_affect" : "false", "text" : "FAN HIGH SPEED",
+                            "raise-delay" : 5, "clear-delay" : 10, "hysteresis" : 200},
+    "FAN_LOW"            : {"severity" : "NOT_ALARMED", "service_affect" : "false", "text" : "FAN LOW SPEED",
+                            "raise-delay" : 5, "clear-delay" : 10, "hysteresis" : 200},
     "CRD_MISS"           : {"severity" : "MAJOR",       "service_affect" : "true",  "text" : "CARD MISSING"},
     "PSU_MISMATCH"       : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "PSU CARD MISMATCH"},
     "CRD_MISMATCH"       : {"severity" : "CRITICAL",    "service_affect" : "true",  "text" : "SLOT CARD MISMATCH"},
     "CRD_UNKNOWN"        : {"severity" : "CRITICAL",    "service_affect" : "true",  "text" : "SLOT CARD UNKNOWN"},
     "DISK_FULL"          : {"severity" : "MINOR",       "service_affect" : "false", "text" : "DISK SPACE ALERT"},
-    "CHASSIS_TEMP_HIALM" : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "CHASSIS TEMPERATURE HIGH alarm"},
-    "CHASSIS_TEMP_LOALM" : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "CHASSIS TEMPERATURE LOW alarm"},
-    "CHASSIS_TEMP_HIWAR" : {"severity" : "MAJOR",       "service_affect" : "false", "text" : "CHASSIS TEMPERATURE HIGH warning"},
-    "CHASSIS_TEMP_LOWAR" : {"severity" : "MAJOR",       "service_affect" : "false", "text" : "CHASSIS TEMPERATURE LOW warning"},
+    "CHASSIS_TEMP_HIALM" : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "CHASSIS TEMPERATURE HIGH alarm",
+                            "raise-delay" : 5, "clear-delay" : 30, "hysteresis" : 2},
+    "CHASSIS_TEMP_LOALM" : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "CHASSIS TEMPERATURE LOW alarm",
+                            "raise-delay" : 5, "clear-delay" : 30, "hysteresis" : 2},
+    "CHASSIS_TEMP_HIWAR" : {"severity" : "MAJOR",       "service_affect" : "false", "text" : "CHASSIS TEMPERATURE HIGH warning",
+                            "raise-delay" : 5, "clear-delay" : 30, "hysteresis" : 2},
+    "CHASSIS_TEMP_LOWAR" : {"severity" : "MAJOR",       "service_affect" : "false", "text" : "CHASSIS TEMPERATURE LOW warning",
+                            "raise-delay" : 5, "clear-delay" : 30, "hysteresis" : 2},
     "MEM_USAGE_HIGH"     : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "MEMORY USAGE ALARM"},
     "CPU_USAGE_HIGH"     : {"severity" : "MAJOR",       "service_affect" : "false", "text" : "CPU USAGE ALARM"},
     "CRD_BOOT_FAIL"      : {"severity" : "CRITICAL",    "service_affect" : "true",  "text" : "CARD BOOT FAIL"},
-    "VOLTAGE_INPUT_HIGH" : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "VOLTAGE INPUT HIGH"},
-    "VOLTAGE_INPUT_LOW"  : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "VOLTAGE INPUT LOW"},
+    "VOLTAGE_INPUT_HIGH" : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "VOLTAGE INPUT HIGH",
+                            "raise-delay" : 3, "clear-delay" : 10},
+    "VOLTAGE_INPUT_LOW"  : {"severity" : "CRITICAL",    "service_affect" : "false", "text" : "VOLTAGE INPUT LOW",
+                            "raise-delay" : 3, "clear-delay" : 10},
 }
+# raise-delay/clear-delay (unit s): a condition must hold this long before the alarm is raised/cleared
+# hysteresis: margin, in the unit of the monitored value, by which a raised alarm is kept past its threshold
 
-def _moveCurAlarmToHisAlarm(dbs, id) :
-    # get current alarm info
-    ok, info = dbs[db.STATE_DB].get_entry(db.Table.CURRENT_ALARM, id)
-    if not ok or not info :
-        #alarm not exist
-        return
-    # delete current alarm
-    dbs[db.STATE_DB].delete_entry(db.Table.CURRENT_ALARM, id)
-    info_dict = dict(info)
-    time_created = info_dict.get('time-created','NA')
-    his_key = id + "_" + f"{time_created}"
+# unit s, a pending transition not seen again within its delay plus this gap is stale and starts over,
+# e.g. the periph was absent or its rpcs failed for a while in between
+ALARM_DEBOUNCE_GAP = 5
+
+class Debounce(object):
+    """raise and clear hold-off of the alarms, transitions not lasting their delay are suppressed"""
+    def __init__(self) :
+        self.lock = threading.Lock()
+        self.pending = {}  # alarm id -> (True if raising else False, since, last seen)
+        self.suppressed = 0
+
+    def allow(self, id, raising, active) :
+        type_id = id.split("#")[-1]
+        delay = _alarms.get(type_id, {}).get("raise-delay" if raising else "clear-delay", 0)
+        now = time.monotonic()
+        with self.lock :
+            p = self.pending.get(id)
+            # already in the wanted state, an opposite transition in progress is cancelled
+            if active == raising :
+                if p :
+                    del self.pending[id]
+                    self.suppressed += 1
+                return False
+            if delay <= 0 :
+                self.pending.pop(id, None)
+                return True
+            if not p or p[0] != raising or now - p[2] > delay + ALARM_DEBOUNCE_GAP :
+                self.pending[id] = (raising, now, now)
+                return False
+            self.pending[id] = (raising, p[1], now)
+            if now - p[1] >= delay :
+                del self.pending[id]
+                return True
+            return False
+
+    def cancel_raises(self, resource, pattern = None, keep = None) :
+        # the conditions of these alarms are gone, drop their pending raises
+        prefix = resource + "#"
+        with self.lock :
+            for id in [k for k, p in self.pending.items() if p[0] and k.startswith(prefix)] :
+                if id == keep or (pattern and pattern not in id) :
+                    continue
+                del self.pending[id]
+                self.suppressed += 1
+
+    def forget(self, ids) :
+        with self.lock :
+            for id in ids :
+                self.pending.pop(id, None)
+
+    def stats(self) :
+        with self.lock :
+            return {
+                "pending"    : len(self.pending),
+                "suppressed" : self.suppressed,
+            }
+
+_debounce = Debounce()
+
+def get_alarm_debounce_stats() :
+    return _debounce.stats()
+
+class CurrentAlarmIndex(object):
+    """ids of the current alarms of one STATE_DB by resource, loaded once then kept by notifications"""
+    def __init__(self, client) :
+        self.lock = threading.Lock()
+        self.by_resource = {}  # resource -> set of alarm ids
+        self.prefix = client.key_name(db.Table.CURRENT_ALARM, "")
+        self.watcher = db.KeyspaceWatcher(client, [self.prefix + "*"], on_key = self.__on_key)
+        self.watcher.resync()
+        self.watcher.start()
+
+    def __on_key(self, pattern, key, added) :
+        id = key[len(self.prefix):]
+        if added :
+            self.add(id)
+        else :
+            self.remove(id)
+
+    def add(self, id) :
+        resource = id.split("#")[0]
+        with self.lock :
+            self.by_resource.setdefault(resource, set()).add(id)
+
+    def remove(self, id) :
+        resource = id.split("#")[0]
+        with self.lock :
+            ids = self.by_resource.get(resource)
+            if ids :
+                ids.discard(id)
+
+    def has(self, id) :
+        resource = id.split("#")[0]
+        with self.lock :
+            return id in self.by_resource.get(resource, ())
+
+    def ids(self, resource) :
+        with self.lock :
+            return list(self.by_resource.get(resource, ()))
+
+_cur_alarm_indexes = {}
+_cur_alarm_indexes_lock = threading.Lock()
+
+def _get_cur_alarm_index(dbs) :
+    client = dbs[db.STATE_DB]
+    key = client.connector.redis_sock
+    with _cur_alarm_indexes_lock :
+        index = _cur_alarm_indexes.get(key)
+        if not index :
+            index = CurrentAlarmIndex(client)
+            _cur_alarm_indexes[key] = index
+        return index
+
+ALARM_EVENT_STREAM = "ALARM_EVENTS"
+ALARM_EVENT_MAXLEN = 10000  # events kept in the stream, older ones are trimmed on add
+
+# write a current alarm and publish its raise event in one atomic step
+# KEYS: current alarm key, event stream
+# ARGV: event stream length, then field/value pairs of the alarm
+_RAISE_ALARM_SCRIPT = """
+local info = {}
+for i = 2, #ARGV do
+    table.insert(info, ARGV[i])
+end
+redis.call('HMSET', KEYS[1], unpack(info))
+local event = {'event', 'raise'}
+for i = 1, #info, 2 do
+    if info[i] == 'id' or info[i] == 'resource' or info[i] == 'type-id' or
+       info[i] == 'severity' or info[i] == 'time-created' then
+        table.insert(event, info[i])
+        table.insert(event, info[i + 1])
+    end
+end
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*', unpack(event))
+"""
+
+HISTORY_ALARM_RETENTION = db.EXPIRE_7_DAYS # unit s
+HISTORY_ALARM_TRIM_LIMIT = 256   # history alarms removed at most per trim, the rest go with the next ones
+HISTORY_ALARM_ALL = "ALL"        # index of the history alarms of all resources, the others are per resource
+HISTORY_ALARM_TRIM_INTERVAL = 600 # unit s, expired history alarms are dropped at least this often
+
+# move current alarms to history in one atomic step, both dbs live in the same redis instance
+# the history alarms are indexed by time cleared (unit ms) in sorted sets, overall and per resource,
+# and those older than the retention are trimmed here instead of expiring one by one
+# KEYS: current alarm keys, none to only trim
+# ARGV: state db, history db, current key prefix, history key prefix, time cleared, event stream,
+#       event stream length, history index prefix, time cleared (unit ms), retention cutoff (unit ms), trim limit
+_CLEAR_ALARMS_SCRIPT = """
+local cleared = {}
+local all_index = ARGV[8] .. 'ALL'
+for _, key in ipairs(KEYS) do
+    local info = redis.call('HGETALL', key)
+    if #info > 0 then
+        redis.call('DEL', key)
+        local fields = {}
+        for i = 1, #info, 2 do
+            fields[info[i]] = info[i + 1]
+        end
+        local created = fields['time-created'] or 'NA'
+        local id = string.sub(key, string.len(ARGV[3]) + 1)
+        local resource = string.match(id, '^([^#]*)#') or id
+        local his_key = ARGV[4] .. id .. '_' .. created
+        redis.call('SELECT', ARGV[2])
+        redis.call('HMSET', his_key, unpack(info))
+        redis.call('HSET', his_key, 'time-cleared', ARGV[5])
+        redis.call('ZADD', all_index, ARGV[9], his_key)
+        redis.call('ZADD', ARGV[8] .. resource, ARGV[9], his_key)
+        redis.call('SELECT', ARGV[1])
+        redis.call('XADD', ARGV[6], 'MAXLEN', '~', ARGV[7], '*', 'event', 'clear', 'id', id,
+                   'resource', fields['resource'] or '', 'type-id', fields['type-id'] or '',
+                   'severity', fields['severity'] or '', 'time-created', created, 'time-cleared', ARGV[5])
+        table.insert(cleared, id)
+    end
+end
+redis.call('SELECT', ARGV[2])
+local expired = redis.call('ZRANGEBYSCORE', all_index, '-inf', '(' .. ARGV[10], 'LIMIT', 0, ARGV[11])
+for _, his_key in ipairs(expired) do
+    local id = string.sub(his_key, string.len(ARGV[4]) + 1)
+    local resource = string.match(id, '^([^#]*)#') or id
+    redis.call('DEL', his_key)
+    redis.call('ZREM', ARGV[8] .. resource, his_key)
+    redis.call('ZREM', all_index, his_key)
+end
+redis.call('SELECT', ARGV[1])
+return cleared
+"""
+
+def _run_clear_script(dbs, ids) :
+    state_db = dbs[db.STATE_DB]
+    his_db = dbs[db.HISTORY_DB]
+    cur_prefix = state_db.key_name(db.Table.CURRENT_ALARM, "")
+    his_prefix = his_db.key_name(db.Table.HISTORY_ALARM, "")
+    index_prefix = his_db.key_name(db.Table.HISTORY_ALARM_INDEX, "")
     cur_time = int(time.time() * 1000000000)
-    time_cleared = (('time-cleared', f"{cur_time}"),)
-    his_alm_info = info + time_cleared
-    # create histroy alarm
-    dbs[db.HISTORY_DB].set(db.Table.HISTORY_ALARM, his_key, his_alm_info)
-    dbs[db.HISTORY_DB].expire(db.Table.HISTORY_ALARM, his_key)
-    print(f"alarm {id} cleared")
+    cur_ms = cur_time // 1000000
+    cutoff = cur_ms - HISTORY_ALARM_RETENTION * 1000
+    # the script SELECTs the history db, get_dbs puts all the dbs of a resource on one redis instance
+    keys = [cur_prefix + id for id in ids]
+    args = [db.STATE_DB, db.HISTORY_DB, cur_prefix, his_prefix, cur_time, ALARM_EVENT_STREAM, ALARM_EVENT_MAXLEN,
+            index_prefix, cur_ms, cutoff, HISTORY_ALARM_TRIM_LIMIT]
+    return state_db.run_script(_CLEAR_ALARMS_SCRIPT, keys, args)
+
+def _clearCurAlarms(dbs, ids) :
+    if not ids :
+        return
+    cleared = _run_clear_script(dbs, ids)
+    index = _get_cur_alarm_index(dbs)
+    for id in ids :
+        index.remove(id)
+    for id in cleared :
+        print(f"alarm {id} cleared")
+
+_last_trim = {} # history db socket -> monotonic time of its last trim
+
+def trim_history_alarms(resource = "CHASSIS-1", force = False) :
+    # drop the history alarms older than the retention from the dbs of the resource,
+    # once per HISTORY_ALARM_TRIM_INTERVAL for all the resources sharing the dbs
+    dbs = db.get_dbs(resource, [db.STATE_DB, db.HISTORY_DB])
+    sock = dbs[db.HISTORY_DB].connector.redis_sock
+    now = time.monotonic()
+    if not force and sock in _last_trim and now - _last_trim[sock] < HISTORY_ALARM_TRIM_INTERVAL :
+        return
+    _last_trim[sock] = now
+    _run_clear_script(dbs, [])
+
+def query_history_alarms(resource = None, start = None, end = None, severity = None, offset = 0, count = 100,
+                         scope = "CHASSIS-1") :
+    """history alarms cleared in [start, end] (unit s since epoch), newest first
+
+    resource: alarms of this resource only, otherwise those of all resources in the dbs of scope
+    severity: a severity or a list of them to keep
+    offset, count: paging over the matching alarms
+    """
+    his_db = db.get_dbs(resource or scope, [db.HISTORY_DB])[db.HISTORY_DB]
+    r = his_db.connector.redis()
+    index = his_db.key_name(db.Table.HISTORY_ALARM_INDEX, resource or HISTORY_ALARM_ALL)
+    cutoff = int(time.time() * 1000) - HISTORY_ALARM_RETENTION * 1000
+    low = cutoff if start is None else max(cutoff, int(start * 1000))
+    high = "+inf" if end is None else int(end * 1000)
+    if severity and not isinstance(severity, (list, tuple, set)) :
+        severity = [severity]
+
+    alarms = []
+    pos = 0
+    chunk = max(count, 64)
+    while len(alarms) < count :
+        if not severity :
+            # every indexed alarm matches, page in the index directly
+            keys = r.zrevrangebyscore(index, high, low, start = offset + pos, num = count - len(alarms))
+        else :
+            keys = r.zrevrangebyscore(index, high, low, start = pos, num = chunk)
+        if not keys :
+            break
+        pos += len(keys)
+        p = r.pipeline(transaction = False)
+        for k in keys :
+            p.hgetall(k)
+        for info in p.execute() :
+            # trimmed since read from the index
+            if not info :
+                continue
+            if severity :
+                if info.get("severity") not in severity :
+                    continue
+                if offset > 0 :
+                    offset -= 1
+                    continue
+            alarms.append(info)
+            if len(alarms) == count :
+                break
+    return alarms
+
+def _moveCurAlarmToHisAlarm(dbs, id) :
+    _clearCurAlarms(dbs, [id])
 
 class Alarm(object):
     def __init__(self, resource, type_id, serverity = None, sa = None, text = None) :
@@ -80,14 +347,25 @@ class Alarm(object):
         dbs = db.get_dbs(resource, [db.STATE_DB, db.HISTORY_DB])
         if not dbs :
             return
-        keys = dbs[db.STATE_DB].get_keys(db.Table.CURRENT_ALARM)
-        for k in keys :
-            if resource not in k :
-                continue
+        _debounce.cancel_raises(resource, pattern)
+        ids = []
+        for k in _get_cur_alarm_index(dbs).ids(resource) :
             if pattern and pattern not in k :
                 continue
+            if not _debounce.allow(k, False, True) :
+                continue
+            ids.append(k)
 
-            _moveCurAlarmToHisAlarm(dbs, k)
+        _clearCurAlarms(dbs, ids)
+
+    @staticmethod
+    def is_active(resource, type_id) :
+        dbs = db.get_dbs(resource, [db.STATE_DB, db.HISTORY_DB])
+        return _get_cur_alarm_index(dbs).has(f"{resource}#{type_id}")
+
+    @staticmethod
+    def hysteresis(type_id) :
+        return _alarms.get(type_id, {}).get("hysteresis", 0)
 
     def create(self):
         # time_created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -102,26 +380,94 @@ class Alarm(object):
             ("service-affect", f"{self.service_affect}"),
         ]
 
-        if not self.dbs[db.STATE_DB].exists(db.Table.CURRENT_ALARM, self.id) :
-            self.dbs[db.STATE_DB].set(db.Table.CURRENT_ALARM, self.id, alarm_data)
+        index = _get_cur_alarm_index(self.dbs)
+        if _debounce.allow(self.id, True, index.has(self.id)) :
+            state_db = self.dbs[db.STATE_DB]
+            keys = [state_db.key_name(db.Table.CURRENT_ALARM, self.id), ALARM_EVENT_STREAM]
+            args = [ALARM_EVENT_MAXLEN] + [v for field in alarm_data for v in field]
+            state_db.run_script(_RAISE_ALARM_SCRIPT, keys, args)
+            index.add(self.id)
             LOG.log_warning(f"alarm {self.id} created")
 
     def createAndClearOthers(self, pattern = None) :
-        keys = self.dbs[db.STATE_DB].get_keys(db.Table.CURRENT_ALARM)
-        for k in keys :
-            # alarm does not belong to the resource
-            if self.resource not in k :
-                continue
+        _debounce.cancel_raises(self.resource, pattern, self.id)
+        self.create()
+        # the others are replaced once this alarm is raised, without their own clear delay
+        index = _get_cur_alarm_index(self.dbs)
+        if not index.has(self.id) :
+            return
+        ids = []
+        for k in index.ids(self.resource) :
             # the alarm already existed
             if self.id == k :
                 continue
             # clear as the k has the pattern
             if pattern and pattern not in k :
                 continue
+            ids.append(k)
 
-            _moveCurAlarmToHisAlarm(self.dbs, k)
-
-        self.create()
+        _debounce.forget(ids)
+        _clearCurAlarms(self.dbs, ids)
 
     def clear(self) :
-        _moveCurAlarmToHisAlarm(self.dbs, self.id)
\ No newline at end of file
+        if not _debounce.allow(self.id, False, _get_cur_alarm_index(self.dbs).has(self.id)) :
+            return
+        _moveCurAlarmToHisAlarm(self.dbs, self.id)
+
+class AlarmTypeIndex(object):
+    """whether any of some slots has an alarm of a type, answered from memory"""
+    def __init__(self, slots, types) :
+        self.types = list(types)
+        self.lock = threading.Lock()
+        self.counts = {t : 0 for t in self.types}
+        self.watchers = {}  # slot -> watcher of the STATE_DB of the linecard
+        for slot in slots :
+            client = db.get_dbs(f"LINECARD-1-{slot}", [db.STATE_DB])[db.STATE_DB]
+            self.watchers[slot] = db.KeyspaceWatcher(client, [f"*{t}*" for t in self.types], self.__on_change)
+
+    def __on_change(self, pattern, delta) :
+        with self.lock :
+            self.counts[pattern.strip("*")] += delta
+
+    def start(self) :
+        for w in self.watchers.values() :
+            w.start()
+        return self
+
+    def stop(self) :
+        for w in self.watchers.values() :
+            w.stop.set()
+
+    def synced(self) :
+        return all(w.synced for w in self.watchers.values())
+
+    def unsynced(self) :
+        # slots whose alarms are unknown, e.g. their redis is unreachable or the card is absent
+        return [slot for slot, w in self.watchers.items() if not w.synced]
+
+    def active(self, type) :
+        with self.lock :
+            return self.counts[type] > 0
+
+class AlarmEventReader(object):
+    """raise/clear events of the alarms in the STATE_DB of a resource, read from the event stream"""
+    def __init__(self, resource, last_id = "$") :
+        dbs = db.get_dbs(resource, [db.STATE_DB])
+        self.redis = dbs[db.STATE_DB].connector.redis()
+        # "$" reads only the events added from now on, "0" replays the whole stream
+        self.last_id = last_id
+
+    def read(self, count = 100, block_ms = 1000) :
+        # blocks for up to block_ms until an event arrives, returns [(event id, {field : value})]
+        result = self.redis.xread({ALARM_EVENT_STREAM : self.last_id}, count = count, block = block_ms)
+        if not result :
+            return []
+        events = result[0][1]
+        self.last_id = events[-1][0]
+        return events
+
+    def follow(self, stop = None) :
+        # yields events as they arrive until the stop event is set
+        while not (stop and stop.is_set()) :
+            for event in self.read() :
+                yield event
@@ -0,0 +1,181 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import threading
+
+# unit s, data of these rpcs only changes when a card is swapped or upgraded
+RPC_CACHE_TTL = {
+    "inventory"      : 60 * 60,
+    "speed_spec"     : 60 * 60,
+    "periph_version" : 10 * 60,
+    "system_version" : 10 * 60,
+}
+
+# unit s, the serial number of a present periph is read again this often to catch a card swap
+# that happened between two presence checks
+RPC_SERIAL_CHECK_INTERVAL = 60
+
+# unit s, a finished call is shared with callers arriving within this window after it, by call type
+SINGLE_FLIGHT_FRESHNESS = {
+    "inlet_temp"  : 1,
+    "outlet_temp" : 1,
+    "temperature" : 0.5,
+    "fan_speed"   : 0.5,
+}
+
+class RpcCache(object):
+    """cache of rpc results keyed by (periph_type, id), invalidated on presence or serial number change"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}   # (periph_type, id) -> {name : (expiry, value)}
+        self.presence = {}  # (periph_type, id) -> last seen presence
+        self.serial = {}    # (periph_type, id) -> last seen serial number
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, name, fetch):
+        now = time.monotonic()
+        with self.lock :
+            entry = self.entries.get(key, {}).get(name)
+            if entry and entry[0] > now :
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = fetch()
+        # failed rpcs are not cached, they are retried on next call
+        if value is not None :
+            with self.lock :
+                self.entries.setdefault(key, {})[name] = (now + RPC_CACHE_TTL.get(name, 0), value)
+        return value
+
+    def refresh(self, key, name, fetch, age):
+        # as get, but an entry cached more than age ago is fetched again
+        now = time.monotonic()
+        with self.lock :
+            entry = self.entries.get(key, {}).get(name)
+            if entry and entry[0] - RPC_CACHE_TTL.get(name, 0) + age > now :
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = fetch()
+        if value is not None :
+            with self.lock :
+                self.entries.setdefault(key, {})[name] = (now + RPC_CACHE_TTL.get(name, 0), value)
+        return value
+
+    def invalidate(self, key = None):
+        with self.lock :
+            if key is None :
+                self.entries.clear()
+            elif key in self.entries :
+                del self.entries[key]
+            self.invalidations += 1
+
+    def update_presence(self, key, presence):
+        with self.lock :
+            last = self.presence.get(key)
+            self.presence[key] = presence
+        if last is not None and last != presence :
+            self.invalidate(key)
+
+    def last_presence(self, key):
+        # as last seen by the periph synchronization, None if not seen yet
+        with self.lock :
+            return self.presence.get(key)
+
+    def update_serial(self, key, serial):
+        with self.lock :
+            last = self.serial.get(key)
+            self.serial[key] = serial
+        if last is not None and last != serial :
+            self.invalidate(key)
+
+    def stats(self):
+        with self.lock :
+            return {
+                "entries"       : sum(len(e) for e in self.entries.values()),
+                "hits"          : self.hits,
+                "misses"        : self.misses,
+                "invalidations" : self.invalidations,
+            }
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.done_at = 0
+
+class SingleFlight(object):
+    """concurrent callers of the same key share one in flight call, key[0] is the call type"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, func):
+        freshness = SINGLE_FLIGHT_FRESHNESS.get(key[0], 0)
+        with self.lock :
+            call = self.calls.get(key)
+            if call and (not call.event.is_set() or time.monotonic() - call.done_at < freshness) :
+                self.shared += 1
+                leader = False
+            else :
+                call = _Call()
+                self.calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader :
+            call.event.wait()
+            if call.error :
+                raise call.error
+            return call.value
+
+        try :
+            call.value = func()
+        except BaseException as e :
+            call.error = e
+            raise
+        finally :
+            call.done_at = time.monotonic()
+            call.event.set()
+            # failures and calls without freshness window are not shared after completion
+            if call.error or freshness <= 0 :
+                with self.lock :
+                    if self.calls.get(key) is call :
+                        del self.calls[key]
+        return call.value
+
+    def stats(self):
+        with self.lock :
+            return {
+                "executed" : self.executed,
+                "shared"   : self.shared,
+            }
+
+rpc_cache = RpcCache()
+single_flight = SingleFlight()
+
+def get_rpc_cache_stats():
+    return rpc_cache.stats()
+
+def get_single_flight_stats():
+    return single_flight.stats()
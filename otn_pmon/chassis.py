@@ -13,12 +13,12 @@
 #   permissions and limitations under the License.
 ##
 
-import psutil
 from otn_pmon.common import *
 from otn_pmon.alarm import Alarm
 import otn_pmon.public as public
 import otn_pmon.periph as periph
 import otn_pmon.db as db
+import otn_pmon.host as host
 from functools import lru_cache
 from otn_pmon.thrift_api.ttypes import led_color, periph_type
 
@@ -72,10 +72,10 @@ class Chassis(periph.Periph):
 
     def update_pm(self) :
         temp = self.get_temperature()
-        super().update_pm("Temperature", temp)
+        super().update_pm([("Temperature", temp)])
 
     def __get_disk_usage(self) :
-        return psutil.disk_usage("/").percent
+        return host.get_disk("/").percent
 
     def update_alarm(self) :
         alarm = Alarm(self.name, "DISK_FULL")
@@ -87,13 +87,25 @@ class Chassis(periph.Periph):
 
         alarm = None
         temp = self.get_temperature()
-        if temp > Chassis.TEMP_HIGH_ALARM_THRESH :
+        hi_alm, hi_war = Chassis.TEMP_HIGH_ALARM_THRESH, Chassis.TEMP_HIGH_WARN_THRESH
+        lo_war, lo_alm = Chassis.TEMP_LOW_WARN_THRESH, Chassis.TEMP_LOW_ALARM_THRESH
+        # a raised alarm is kept until the temperature is back past its threshold by the hysteresis
+        if Alarm.is_active(self.name, "CHASSIS_TEMP_HIALM") :
+            hi_alm -= Alarm.hysteresis("CHASSIS_TEMP_HIALM")
+        elif Alarm.is_active(self.name, "CHASSIS_TEMP_HIWAR") :
+            hi_war -= Alarm.hysteresis("CHASSIS_TEMP_HIWAR")
+        elif Alarm.is_active(self.name, "CHASSIS_TEMP_LOWAR") :
+            lo_war += Alarm.hysteresis("CHASSIS_TEMP_LOWAR")
+        elif Alarm.is_active(self.name, "CHASSIS_TEMP_LOALM") :
+            lo_alm += Alarm.hysteresis("CHASSIS_TEMP_LOALM")
+
+        if temp > hi_alm :
             alarm = Alarm(self.name, "CHASSIS_TEMP_HIALM")
-        elif Chassis.TEMP_HIGH_WARN_THRESH <= temp <= Chassis.TEMP_HIGH_ALARM_THRESH :
+        elif hi_war <= temp <= hi_alm :
             alarm = Alarm(self.name, "CHASSIS_TEMP_HIWAR")
-        elif Chassis.TEMP_LOW_ALARM_THRESH <= temp <= Chassis.TEMP_LOW_WARN_THRESH :
+        elif lo_alm <= temp <= lo_war :
             alarm = Alarm(self.name, "CHASSIS_TEMP_LOWAR")
-        elif temp < Chassis.TEMP_LOW_ALARM_THRESH :
+        elif temp < lo_alm :
             alarm = Alarm(self.name, "CHASSIS_TEMP_LOALM")
 
         if alarm :
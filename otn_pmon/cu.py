@@ -13,41 +13,76 @@
 #   permissions and limitations under the License.
 ##
 
-import psutil
 from functools import lru_cache
 from otn_pmon.common import *
 from otn_pmon.alarm import Alarm
-from otn_pmon.pm import Pm
+from otn_pmon.pm import get_pms, update_pms, get_pm_generation
 import otn_pmon.periph as periph
 import otn_pmon.db as db
+import otn_pmon.host as host
 from otn_pmon.thrift_api.ttypes import led_color, periph_type
 
+CPU_PM_LOGICAL = False # per core cpu pms of the logical cores instead of the physical ones
+
 class CoreCollector() :
-    def __init__(self) :
-        self.count = psutil.cpu_count(logical = False)
-
-    def execute(self) :
-        def gen_pm(tname, kname, pm_name, val) :
-            pm15 = Pm(tname, kname, pm_name, Pm.PM_TYPE_15)
-            pm24 = Pm(tname, kname, pm_name, Pm.PM_TYPE_24)
-            pm15.update(val)
-            pm24.update(val)
-
-        times_percent = psutil.cpu_times_percent(percpu=True)
-        if not times_percent :
+    """per core cpu pms, all cores sampled and written as one batch per cycle"""
+    FIELDS = host.CPU_FIELDS
+    METRICS = ("Total", "User", "Kernel", "Nice", "Idle", "Wait")
+
+    def __init__(self, logical = None) :
+        self.logical = CPU_PM_LOGICAL if logical is None else logical
+        self.count = host.get_cpu_count(self.logical)
+        self.last = None       # per core cpu times of the previous cycle
+        self.last_time = None  # time of the host cpu snapshot they came from
+        self.pms = []          # per core, per metric, the pms fed
+        self.generation = None
+
+    def __load_pms(self) :
+        # looked up once, again only if the registry evicted pms or the pm mode changed
+        generation = get_pm_generation()
+        if generation == self.generation :
+            return
+        self.pms = [[get_pms("CPU", f"CPU-{i}", m) for m in CoreCollector.METRICS] for i in range(self.count)]
+        # loading may itself evict pms when the registry is smaller than the cpu table, the list is
+        # then loaded again next cycle, its evicted handles are dropped by the engine meanwhile
+        self.generation = generation if get_pm_generation() == generation else None
+
+    @staticmethod
+    def percents(last, cur) :
+        # per field percentages of the time between two samples, as psutil.cpu_times_percent did
+        deltas = [max(c - l, 0) for l, c in zip(last, cur)]
+        # guest time is already part of user time
+        total = sum(deltas) - deltas[8] - deltas[9]
+        if total <= 0 :
+            return [0.0] * len(deltas)
+        return [min(round(d * 100 / total, 1), 100.0) for d in deltas]
+
+    def execute(self, times = None) :
+        # times: per core tuples in FIELDS order, from the host sampler if not given
+        if times is None :
+            snapshot = host.get_cpu()
+            # nothing elapsed since the snapshot used last cycle
+            if snapshot.time == self.last_time :
+                return
+            self.last_time = snapshot.time
+            times = snapshot.percpu
+        times = times[:self.count]
+        last, self.last = self.last, times
+        if not last or len(last) != len(times) :
             return
 
-        for i in range(self.count) :
-            cpu = times_percent[i]
-            total = cpu.user + cpu.nice + cpu.system + cpu.iowait + cpu.irq +\
-                    cpu.softirq + cpu.steal + cpu.guest + cpu.guest_nice
+        self.__load_pms()
+        pms = []
+        values = []
+        for i, (l, c) in enumerate(zip(last, times)) :
+            user, nice, system, idle, iowait, irq, softirq, steal, guest, guest_nice = CoreCollector.percents(l, c)
+            total = user + nice + system + iowait + irq + softirq + steal + guest + guest_nice
             # the type of percentage is uint8
-            gen_pm("CPU", f"CPU-{i}", "Total",  int(total))
-            gen_pm("CPU", f"CPU-{i}", "User",   int(cpu.user))
-            gen_pm("CPU", f"CPU-{i}", "Kernel", int(cpu.system))
-            gen_pm("CPU", f"CPU-{i}", "Nice",   int(cpu.nice))
-            gen_pm("CPU", f"CPU-{i}", "Idle",   int(cpu.idle))
-            gen_pm("CPU", f"CPU-{i}", "Wait",   int(cpu.iowait))
+            for feed, val in zip(self.pms[i], (int(total), int(user), int(system), int(nice), int(idle), int(iowait))) :
+                pms.extend(feed)
+                values.extend([val] * len(feed))
+        # all cores in one engine update, written in one batch
+        update_pms(pms, values)
 
 @lru_cache()
 class Cu(periph.Periph):
@@ -56,6 +91,7 @@ class Cu(periph.Periph):
 
     def __init__(self, id):
         super().__init__(periph_type.CU, id)
+        self.core_collector = CoreCollector()
     
     def initialize_state(self):
         inv = self.get_inventory()
@@ -79,7 +115,7 @@ class Cu(periph.Periph):
 
     def __get_memory(self) :
         memory = {}
-        tmp = psutil.virtual_memory()
+        tmp = host.get_memory()
         memory["utilized"] = tmp.used
         memory["available"] = tmp.available
         memory["percent"] = tmp.percent
@@ -87,16 +123,16 @@ class Cu(periph.Periph):
 
     def update_pm(self) :
         temp = self.get_temperature()
-        super().update_pm("Temperature", temp)
-
         memory = self.__get_memory()
-        super().update_pm("MemoryUtilized", memory["utilized"])
-        super().update_pm("MemoryAvailable", memory["available"])
-
-        percent = int(psutil.cpu_percent())
-        super().update_pm("CpuUtilization", percent)
+        percent = int(host.get_cpu().percent)
+        super().update_pm([
+            ("Temperature", temp),
+            ("MemoryUtilized", memory["utilized"]),
+            ("MemoryAvailable", memory["available"]),
+            ("CpuUtilization", percent),
+        ])
 
-        CoreCollector().execute()
+        self.core_collector.execute()
 
     def update_alarm(self) :
         memory_hi = Alarm(self.name, "MEM_USAGE_HIGH")
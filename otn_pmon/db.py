@@ -13,7 +13,13 @@
 #   permissions and limitations under the License.
 ##
 
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import redis
 from swsscommon import swsscommon
+from otn_pmon.common import LOG
 
 EXPIRE_7_DAYS = 7 * 24 * 60 * 60 #unit s
 EXPIRE_1_DAYS = 1 * 24 * 60 * 60 #unit s
@@ -22,6 +28,14 @@ CONFIG_DB   = swsscommon.CONFIG_DB
 STATE_DB    = swsscommon.STATE_DB
 COUNTERS_DB = swsscommon.COUNTERS_DB
 HISTORY_DB  = swsscommon.HISTORY_DB
+BATCH_MAX_WRITES = 256  # a write batch is flushed when this many writes are buffered
+BATCH_MAX_DELAY = 1     # unit s, or when its oldest buffered write is older than this
+SHADOW_DBS = [STATE_DB, COUNTERS_DB] # HISTORY_DB keys are written once, nothing to suppress there
+SHADOW_MAX_ENTRIES = 8192
+SHADOW_RESYNC_SECS = 300  # unit s, a key is fully rewritten at least this often to heal external changes
+KEYSPACE_RESYNC_SECS = 60 # unit s, a keyspace watcher rescans its keys this often in case notifications are lost
+KEYSPACE_RETRY_MAX = 30   # unit s, upper bound of the delay before a failed keyspace watcher reconnects
+KEYSPACE_LOG_SECS = 300   # unit s, a watcher that keeps failing logs its error this often
 
 def get_dbs(periph_name, db_types) :
     if not isinstance(db_types, list) or len(db_types) == 0 :
@@ -45,6 +59,286 @@ class Table() :
     CU = "CU"
     CURRENT_ALARM = "CURALARM"
     HISTORY_ALARM = "HISALARM"
+    HISTORY_ALARM_INDEX = "HISALARM_INDEX"
+    PM_INDEX = "PM_INDEX"
+
+class Shadow() :
+    """fields last written or read per (table, key), used to drop writes that change nothing"""
+    def __init__(self) :
+        self.entries = OrderedDict()  # (tname, kname) -> [synced time, {field : value}]
+        self.suppressed = 0
+        self.partial = 0
+        self.full = 0
+
+    def changed(self, tname, kname, data) :
+        # alarms are written once per raise, a partial write could recreate a cleared one
+        if tname == Table.CURRENT_ALARM :
+            return data
+        now = time.monotonic()
+        key = (tname, kname)
+        entry = self.entries.get(key)
+        if not entry or now - entry[0] >= SHADOW_RESYNC_SECS :
+            self.__put(key, now, data)
+            self.full += 1
+            return data
+
+        fields = entry[1]
+        changed = [(f, v) for f, v in data if fields.get(f) != v]
+        self.entries.move_to_end(key)
+        if not changed :
+            self.suppressed += 1
+            return changed
+        fields.update(changed)
+        self.partial += 1
+        return changed
+
+    def observe(self, tname, kname, fields, complete = False) :
+        # values read back from db win over what was written, they may be changed by others
+        key = (tname, kname)
+        entry = self.entries.get(key)
+        if complete :
+            self.__put(key, time.monotonic(), fields)
+        elif entry :
+            entry[1].update(fields)
+
+    def forget(self, tname, kname) :
+        self.entries.pop((tname, kname), None)
+
+    def __put(self, key, synced, fields) :
+        # the least recently used entries go beyond the bound
+        self.entries[key] = [synced, dict(fields)]
+        self.entries.move_to_end(key)
+        while len(self.entries) > SHADOW_MAX_ENTRIES :
+            self.entries.popitem(last = False)
+
+    def stats(self) :
+        return {
+            "entries"    : len(self.entries),
+            "suppressed" : self.suppressed,
+            "partial"    : self.partial,
+            "full"       : self.full,
+        }
+
+class Connector() :
+    """one redis connection per (redis socket, db index) shared by all clients of the process"""
+    def __init__(self, redis_sock, db_index) :
+        self.redis_sock = redis_sock
+        self.db_index = db_index
+        self.db = swsscommon.DBConnector(db_index, redis_sock, 0)
+        # the redis context is not thread safe, operations on it are serialized
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.refs = 0
+        self.pipelines = {} # thread id -> Pipeline used by the write batch of the thread
+        self.shadow = Shadow() if db_index in SHADOW_DBS else None
+        self.redis_client = None
+        self.redis_bytes_client = None
+        self.scripts = {}
+
+    def table(self, tname) :
+        t = self.tables.get(tname)
+        if not t :
+            t = swsscommon.Table(self.db, tname)
+            self.tables[tname] = t
+        return t
+
+    def redis(self) :
+        # redis-py client of the same db, for scripts and commands swsscommon does not wrap
+        with self.lock :
+            if not self.redis_client :
+                self.redis_client = redis.Redis(unix_socket_path = self.redis_sock, db = self.db_index,
+                                                decode_responses = True)
+            return self.redis_client
+
+    def redis_bytes(self) :
+        # redis-py client of the same db returning raw bytes, for binary values
+        with self.lock :
+            if not self.redis_bytes_client :
+                self.redis_bytes_client = redis.Redis(unix_socket_path = self.redis_sock, db = self.db_index)
+            return self.redis_bytes_client
+
+    def script(self, source) :
+        r = self.redis()
+        with self.lock :
+            s = self.scripts.get(source)
+            if not s :
+                s = r.register_script(source)
+                self.scripts[source] = s
+            return s
+
+    def pipeline(self) :
+        tid = threading.get_ident()
+        with self.lock :
+            p = self.pipelines.get(tid)
+            if not p :
+                p = Pipeline(self)
+                self.pipelines[tid] = p
+            return p
+
+class Pipeline() :
+    """buffered writes of one thread to one db, sent in a single round trip on flush"""
+    def __init__(self, connector) :
+        self.connector = connector
+        self.pipeline = swsscommon.RedisPipeline(connector.db, BATCH_MAX_WRITES)
+        self.raw = None     # redis-py pipeline of the commands swsscommon does not wrap
+        self.tables = {}
+        self.pending = {}   # tname -> set of keys written since last flush
+        self.writes = 0
+        self.since = 0
+
+    def table(self, tname) :
+        t = self.tables.get(tname)
+        if not t :
+            t = swsscommon.Table(self.pipeline, tname, True)
+            self.tables[tname] = t
+        return t
+
+    def write(self, tname, kname, op) :
+        if self.writes == 0 :
+            self.since = time.monotonic()
+        ret = op(self.table(tname))
+        self.pending.setdefault(tname, set()).add(kname)
+        self.__written()
+        return ret
+
+    def write_raw(self, op) :
+        if self.writes == 0 :
+            self.since = time.monotonic()
+        if not self.raw :
+            self.raw = self.connector.redis_bytes().pipeline(transaction = False)
+        op(self.raw)
+        self.__written()
+
+    def __written(self) :
+        self.writes += 1
+        if self.writes >= BATCH_MAX_WRITES or time.monotonic() - self.since >= BATCH_MAX_DELAY :
+            self.flush()
+
+    def pending_on(self, tname, kname = None) :
+        keys = self.pending.get(tname)
+        if not keys :
+            return False
+        return kname is None or kname in keys
+
+    def flush(self) :
+        if self.writes == 0 :
+            return
+        try :
+            self.pipeline.flush()
+            if self.raw :
+                self.raw.execute()
+            _batch_stats.record(self.writes)
+        except Exception :
+            # the shadow holds values which may not have reached the db, they are written in full next time
+            shadow = self.connector.shadow
+            if shadow :
+                with self.connector.lock :
+                    for tname, keys in self.pending.items() :
+                        for kname in keys :
+                            shadow.forget(tname, kname)
+            raise
+        finally :
+            self.pending.clear()
+            self.writes = 0
+
+class BatchStats() :
+    def __init__(self) :
+        self.lock = threading.Lock()
+        self.flushes = 0
+        self.writes = 0
+        self.max = 0
+        self.last = 0
+
+    def record(self, size) :
+        with self.lock :
+            self.flushes += 1
+            self.writes += size
+            self.max = max(self.max, size)
+            self.last = size
+
+    def stats(self) :
+        with self.lock :
+            return {
+                "flushes" : self.flushes,
+                "writes"  : self.writes,
+                "avg"     : round(self.writes / self.flushes, 1) if self.flushes else 0,
+                "max"     : self.max,
+                "last"    : self.last,
+            }
+
+_batch_stats = BatchStats()
+_batch = threading.local()
+
+def get_batch_stats() :
+    return _batch_stats.stats()
+
+@contextmanager
+def write_batch() :
+    # writes of this thread are buffered until the outermost batch exits, reads still see them
+    if not hasattr(_batch, "depth") :
+        _batch.depth = 0
+        _batch.pipelines = set()
+    _batch.depth += 1
+    try :
+        yield
+    finally :
+        _batch.depth -= 1
+        if _batch.depth == 0 :
+            # a db failing to flush does not hold back the writes to the others
+            pipelines, _batch.pipelines = _batch.pipelines, set()
+            error = None
+            for p in pipelines :
+                try :
+                    p.flush()
+                except Exception as e :
+                    error = error or e
+            if error :
+                raise error
+
+def _batch_pipeline(connector) :
+    if getattr(_batch, "depth", 0) == 0 :
+        return None
+    p = connector.pipeline()
+    _batch.pipelines.add(p)
+    return p
+
+_connectors = {}
+# reentrant, the garbage collector may run Client.__del__ in a thread holding it
+_connectors_lock = threading.RLock()
+
+def _acquire_connector(redis_sock, db_index) :
+    key = (redis_sock, db_index)
+    with _connectors_lock :
+        c = _connectors.get(key)
+        if not c :
+            c = Connector(redis_sock, db_index)
+            _connectors[key] = c
+        c.refs += 1
+        return c
+
+def _release_connector(c) :
+    # connectors are kept without reference, the next client of the db reuses them
+    with _connectors_lock :
+        c.refs -= 1
+
+def get_connector_stats() :
+    with _connectors_lock :
+        return {f"{sock}:{index}" : {"refs" : c.refs, "tables" : len(c.tables)}
+                for (sock, index), c in _connectors.items()}
+
+def get_shadow_stats() :
+    with _connectors_lock :
+        connectors = list(_connectors.items())
+    stats = {}
+    for (sock, index), c in connectors :
+        if c.shadow :
+            with c.lock :
+                stats[f"{sock}:{index}"] = c.shadow.stats()
+    return stats
+
+def close_connectors() :
+    with _connectors_lock :
+        _connectors.clear()
 
 class Client():
     def __init__(self, slot_id, db_index, multi_db = False) :
@@ -52,61 +346,260 @@ class Client():
             redis_sock = f"/var/run/redis{slot_id-1}/redis.sock"
         else:
             redis_sock = f"/var/run/redis/redis.sock"
-        self.db = swsscommon.DBConnector(db_index, redis_sock, 0)
+        self.connector = _acquire_connector(redis_sock, db_index)
+        self.db = self.connector.db
+
+    def close(self) :
+        if getattr(self, "connector", None) :
+            _release_connector(self.connector)
+            self.connector = None
+
+    def __del__(self) :
+        self.close()
+
+    def __table(self, tname) :
+        return self.connector.table(tname)
+
+    def __pipeline(self) :
+        return _batch_pipeline(self.connector)
+
+    def __sync(self, tname, kname = None) :
+        # flush buffered writes of the batch before reading them back
+        p = self.__pipeline()
+        if p and p.pending_on(tname, kname) :
+            p.flush()
+
+    def __changed(self, tname, kname, data) :
+        shadow = self.connector.shadow
+        if not shadow :
+            return data
+        with self.connector.lock :
+            return shadow.changed(tname, kname, data)
+
+    def __observe(self, tname, kname, fields, complete = False) :
+        shadow = self.connector.shadow
+        if shadow :
+            with self.connector.lock :
+                shadow.observe(tname, kname, fields, complete)
+
+    def __forget(self, tname, kname) :
+        shadow = self.connector.shadow
+        if shadow :
+            with self.connector.lock :
+                shadow.forget(tname, kname)
+
+    def key_name(self, tname, kname) :
+        # full redis key of a table entry, e.g. CURALARM|FAN-1-7#FAN_FAIL
+        with self.connector.lock :
+            return self.__table(tname).getKeyName(kname)
 
     def exists(self, tname, kname) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            return False
-        ok, _ = t.get(kname)
-        return ok
+        self.__sync(tname, kname)
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                return False
+            ok, _ = t.get(kname)
+            return ok
 
     def get_entry(self, tname, kname) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            return
-        return t.get(kname)
+        self.__sync(tname, kname)
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                return
+            ok, fvs = t.get(kname)
+            if ok :
+                self.__observe(tname, kname, dict(fvs), True)
+            else :
+                self.__forget(tname, kname)
+            return ok, fvs
 
     def get_keys(self, tname) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            print(f"{tname} is not exist")
-            return
-        return t.getKeys()
+        self.__sync(tname)
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                print(f"{tname} is not exist")
+                return
+            return t.getKeys()
+
+    def keys(self, pattern) :
+        p = self.__pipeline()
+        if p :
+            p.flush()
+        with self.connector.lock :
+            return self.db.keys(pattern)
 
     def get_field(self, tname, kname, fname) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
+        self.__sync(tname, kname)
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                return
+            ok, value = t.hget(kname, fname)
+            self.__observe(tname, kname, {fname : value if ok else None})
+            return ok, value
+
+    def __set(self, tname, kname, data) :
+        data = self.__changed(tname, kname, data)
+        if not data :
             return
-        return t.hget(kname, fname)
+        p = self.__pipeline()
+        if p :
+            return p.write(tname, kname, lambda t : t.set(kname, swsscommon.FieldValuePairs(data)))
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                return
+            try :
+                return t.set(kname, swsscommon.FieldValuePairs(data))
+            except Exception :
+                # the shadow already holds the values which were not written
+                self.__forget(tname, kname)
+                raise
 
     def set(self, tname, kname, data) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            return
-        return t.set(kname, swsscommon.FieldValuePairs(data))
+        return self.__set(tname, kname, data)
 
     def set_field(self, tname, kname, fname, fval) :
-        data = [(fname, fval)]
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            return
-        return t.set(kname, swsscommon.FieldValuePairs(data))
+        return self.__set(tname, kname, [(fname, fval)])
     
     def expire(self, tname, kname, seconds = EXPIRE_7_DAYS) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            return
-        return t.expire(kname, seconds)
+        self.__forget(tname, kname)
+        p = self.__pipeline()
+        if p :
+            return p.write(tname, kname, lambda t : t.expire(kname, seconds))
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                return
+            return t.expire(kname, seconds)
 
     def delete_entry(self, tname, kname) :
-        t = swsscommon.Table(self.db, tname)
-        if not t :
-            return
-        return t.delete(kname)
+        self.__forget(tname, kname)
+        p = self.__pipeline()
+        if p :
+            return p.write(tname, kname, lambda t : t.delete(kname))
+        with self.connector.lock :
+            t = self.__table(tname)
+            if not t :
+                return
+            return t.delete(kname)
+
+    def append(self, key, value, seconds = 0) :
+        # append bytes to the string at the full redis key, which expires after seconds unless 0
+        def op(r) :
+            r.append(key, value)
+            if seconds :
+                r.expire(key, seconds)
+
+        p = self.__pipeline()
+        if p :
+            return p.write_raw(op)
+        r = self.connector.redis_bytes().pipeline(transaction = False)
+        op(r)
+        r.execute()
+
+    def run_script(self, source, keys = None, args = None) :
+        # a lua script runs atomically in one round trip, buffered writes are sent before it
+        p = self.__pipeline()
+        if p :
+            p.flush()
+        return self.connector.script(source)(keys = keys or [], args = args or [])
 
     def pub_sub(self) :
         pubsub = swsscommon.PubSub(self.db)
         if not pubsub :
             return
         return pubsub
+
+class KeyspaceWatcher(threading.Thread) :
+    """keys of one db matching some glob patterns, kept up to date from keyspace notifications"""
+    ADD_EVENTS = ("set", "hset", "hsetnx", "hmset", "sadd", "zadd", "rename_to", "restore")
+    DEL_EVENTS = ("del", "expired", "evicted", "rename_from")
+
+    def __init__(self, client, patterns, on_change = None, on_key = None) :
+        threading.Thread.__init__(self, daemon = True)
+        self.client = client
+        self.patterns = list(patterns)
+        self.on_change = on_change  # on_change(pattern, delta of matching keys)
+        self.on_key = on_key        # on_key(pattern, key, True if added else False)
+        self.lock = threading.Lock()
+        self.keys = {p : set() for p in self.patterns}
+        self.synced = False
+        self.failures = 0
+        self.logged_at = -KEYSPACE_LOG_SECS
+        self.stop = threading.Event()
+        prefix = f"__keyspace@{client.connector.db_index}__:"
+        self.channels = {prefix + p : p for p in self.patterns}
+
+    def count(self, pattern) :
+        with self.lock :
+            return len(self.keys[pattern])
+
+    def __update(self, pattern, keys) :
+        with self.lock :
+            old = self.keys[pattern]
+            self.keys[pattern] = keys
+            added = keys - old
+            removed = old - keys
+            if self.on_key :
+                for k in added :
+                    self.on_key(pattern, k, True)
+                for k in removed :
+                    self.on_key(pattern, k, False)
+        delta = len(added) - len(removed)
+        if delta and self.on_change :
+            self.on_change(pattern, delta)
+
+    def __apply(self, pattern, key, event) :
+        with self.lock :
+            keys = self.keys[pattern]
+            before = len(keys)
+            if event in KeyspaceWatcher.ADD_EVENTS :
+                keys.add(key)
+            elif event in KeyspaceWatcher.DEL_EVENTS :
+                keys.discard(key)
+            delta = len(keys) - before
+            if delta and self.on_key :
+                self.on_key(pattern, key, delta > 0)
+        if delta and self.on_change :
+            self.on_change(pattern, delta)
+
+    def resync(self) :
+        for p in self.patterns :
+            self.__update(p, set(self.client.keys(p)))
+        self.synced = True
+
+    def run(self) :
+        while not self.stop.is_set() :
+            try :
+                pubsub = self.client.pub_sub()
+                for channel in self.channels :
+                    pubsub.psubscribe(channel)
+                # subscribe first then scan, so that no change is lost in between
+                self.resync()
+                synced_at = time.monotonic()
+                if self.failures :
+                    LOG.log_notice(f"keyspace watcher of {self.client.connector.redis_sock} db "
+                                   f"{self.client.connector.db_index} recovered")
+                    self.failures = 0
+                    self.logged_at = -KEYSPACE_LOG_SECS
+                while not self.stop.is_set() :
+                    msg = pubsub.get_message(1)
+                    if msg and msg.get("type") == "pmessage" and msg.get("pattern") in self.channels :
+                        key = msg["channel"].split(":", 1)[1]
+                        self.__apply(self.channels[msg["pattern"]], key, msg["data"])
+                    if time.monotonic() - synced_at >= KEYSPACE_RESYNC_SECS :
+                        self.resync()
+                        synced_at = time.monotonic()
+            except Exception as e :
+                self.synced = False
+                self.failures += 1
+                now = time.monotonic()
+                if now - self.logged_at >= KEYSPACE_LOG_SECS :
+                    LOG.log_warning(f"keyspace watcher of {self.client.connector.redis_sock} db "
+                                    f"{self.client.connector.db_index} failed {self.failures} times, error : {e}")
+                    self.logged_at = now
+                self.stop.wait(min(2 ** min(self.failures, 5), KEYSPACE_RETRY_MAX))
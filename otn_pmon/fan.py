@@ -15,13 +15,15 @@
 
 import threading
 from otn_pmon.common import *
-from otn_pmon.alarm import Alarm
+from otn_pmon.alarm import Alarm, AlarmTypeIndex
 import otn_pmon.periph as periph
 import otn_pmon.public as public
 import otn_pmon.db as db
 from functools import lru_cache
 from otn_pmon.thrift_api.ttypes import error_code, periph_type
-from otn_pmon.thrift_client import thrift_try
+from otn_pmon.thrift_client import thrift_try, thrift_available
+from thrift.Thrift import TException
+from otn_pmon.cache import rpc_cache, single_flight
 
 @lru_cache()
 class Fan(periph.Periph) :
@@ -81,7 +83,11 @@ class Fan(periph.Periph) :
         def inner(client) :
             return client.get_fan_speed(self.id)
 
-        result = thrift_try(inner)
+        snapshot = self.current_snapshot()
+        if snapshot and snapshot.speed :
+            result = snapshot.speed
+        else :
+            result = single_flight.do(("fan_speed", self.id), lambda : thrift_try(inner))
         if result.ret != error_code.OK :
             return None
         return result.speed
@@ -89,17 +95,20 @@ class Fan(periph.Periph) :
     def __get_speed_spec(self) :
         def inner(client) :
             return client.get_fan_speed_spec(self.id)
-        return thrift_try(inner)
+
+        snapshot = self.current_snapshot()
+        if snapshot and snapshot.speed_spec :
+            return snapshot.speed_spec
+        return rpc_cache.get((self.type, self.id), "speed_spec", lambda : thrift_try(inner))
 
     def update_pm(self) :
         temp = self.get_temperature()
-        super().update_pm("Temperature", temp)
+        samples = [("Temperature", temp)]
 
         speed = self.__get_speed()
-        if not speed :
-            return
-        super().update_pm("Speed", speed.front)
-        super().update_pm("Speed_2", speed.behind)
+        if speed :
+            samples += [("Speed", speed.front), ("Speed_2", speed.behind)]
+        super().update_pm(samples)
 
     def update_alarm(self) :
         alarm = None
@@ -112,12 +121,19 @@ class Fan(periph.Periph) :
         min_speed = speed.front if speed.front <= speed.behind else speed.behind
 
         speed_spec = self.__get_speed_spec()
-        if max_speed > speed_spec.max :
+        # a raised speed alarm is kept until the speed is back in the spec by the hysteresis
+        spec_max, spec_min = speed_spec.max, speed_spec.min
+        if Alarm.is_active(self.name, "FAN_HIGH") :
+            spec_max -= Alarm.hysteresis("FAN_HIGH")
+        if Alarm.is_active(self.name, "FAN_LOW") :
+            spec_min += Alarm.hysteresis("FAN_LOW")
+
+        if max_speed > spec_max :
             alarm = Alarm(self.name, "FAN_HIGH")
         elif max_speed == 0 or min_speed == 0 :
             alarm = Alarm(self.name, "FAN_FAIL")
             s_status = slot_status.UNKNOWN
-        elif min_speed < speed_spec.min  :
+        elif min_speed < spec_min  :
             alarm = Alarm(self.name, "FAN_LOW")
         
         if alarm :
@@ -150,6 +166,7 @@ class FanControl(threading.Thread) :
         self.interval = interval
         self.stop = threading.Event()
         self.list = self.__get_fan_list()
+        self.alarm_index = self.__get_alarm_index()
 
     def __get_fan_list(self) :
         list = []
@@ -161,6 +178,16 @@ class FanControl(threading.Thread) :
                 list.append(f)
         return list
 
+    def __get_alarm_index(self) :
+        linecard_num = periph.get_periph_number(periph_type.LINECARD)
+        start = public.get_first_slot_id(periph_type.LINECARD)
+        slots = range(start, linecard_num + 1)
+        return AlarmTypeIndex(slots, ["HIGH_TEMPERATURE_ALARM", "SLOT_COMM_FAIL"]).start()
+
+    def __linecard_present(self, slot) :
+        # as last seen by the linecard synchronization, present until known otherwise
+        return rpc_cache.last_presence((periph_type.LINECARD, slot)) != False
+
     def run_manual(self, rate) :
         for f in self.list :
             f.set_speed_rate(rate)
@@ -207,21 +234,23 @@ class FanControl(threading.Thread) :
         if fan_num != fan_presence_num :
             return True
 
-        # alarms exists
-        linecard_num = periph.get_periph_number(periph_type.LINECARD)
-        start = public.get_first_slot_id(periph_type.LINECARD)
-        for i in range (start, linecard_num + 1) :
-            dbc = db.Client(i, db.STATE_DB).db
-            # HIGH_TEMPERATURE_ALARM
-            if len(dbc.keys("*HIGH_TEMPERATURE_ALARM*")) != 0 :
-                return True
-            # SLOT_COMM_FAIL
-            if len(dbc.keys("*SLOT_COMM_FAIL*")) != 0 :
+        # the alarms of a present linecard are unknown, as a communication failure with it
+        for slot in self.alarm_index.unsynced() :
+            if self.__linecard_present(slot) :
                 return True
 
+        # alarms exists
+        if self.alarm_index.active("HIGH_TEMPERATURE_ALARM") :
+            return True
+        if self.alarm_index.active("SLOT_COMM_FAIL") :
+            return True
+
         return False
 
     def run_auto(self) :
+        if not thrift_available() :
+            return
+
         if self._need_full_speed() :
             self.run_manual(FanControl.SPEED_RATE_L6)
             return
@@ -237,4 +266,12 @@ class FanControl(threading.Thread) :
 
     def run(self) :
         while not self.stop.wait(self.interval) :
-            self.run_auto()
+            try :
+                self.run_auto()
+            except Exception as e :
+                # e.g. the circuit opened during the cycle, the fans run at full speed meanwhile
+                LOG.log_warning(f"fan control degraded to full speed: {e!r}")
+                try :
+                    self.run_manual(FanControl.SPEED_RATE_L6)
+                except TException :
+                    pass
@@ -0,0 +1,194 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import io
+import os
+import time
+import threading
+from collections import namedtuple
+
+# unit s, a snapshot is served from cache until it is this old
+HOST_CPU_INTERVAL = 1
+HOST_MEMORY_INTERVAL = 1
+HOST_DISK_INTERVAL = 60 # disk usage changes slowly
+
+# cpu times (unit s) in /proc/stat column order
+CPU_FIELDS = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal", "guest", "guest_nice")
+
+CpuSnapshot = namedtuple("CpuSnapshot", ["time", "total", "percpu", "percent"])
+MemorySnapshot = namedtuple("MemorySnapshot", ["time", "total", "available", "used", "free", "percent"])
+DiskSnapshot = namedtuple("DiskSnapshot", ["time", "total", "used", "free", "percent"])
+
+class ProcFile(object):
+    """a /proc file kept open and read again into the same buffer"""
+    def __init__(self, path, size = 4096) :
+        self.path = path
+        self.file = None
+        self.buf = bytearray(size)
+
+    def read(self) :
+        if not self.file :
+            self.file = io.FileIO(self.path, "r")
+        while True :
+            self.file.seek(0)
+            n = self.file.readinto(self.buf)
+            if n < len(self.buf) :
+                return self.buf[:n].decode()
+            # the content may not fit, read again with a larger buffer
+            self.buf = bytearray(len(self.buf) * 2)
+
+def _busy(times) :
+    # guest time is already part of user time, idle and iowait are not busy, as psutil
+    total = sum(times) - times[8] - times[9]
+    return total, total - times[3] - times[4]
+
+class HostSampler(object):
+    """cpu, memory and disk usage of the host, each sampled in one pass at its own cadence"""
+    def __init__(self) :
+        self.lock = threading.Lock()
+        self.stat = ProcFile("/proc/stat", 16384)
+        self.meminfo = ProcFile("/proc/meminfo")
+        self.clk_tck = os.sysconf("SC_CLK_TCK")
+        self.cpu_snapshot = None
+        self.memory_snapshot = None
+        self.disk_snapshots = {} # path -> DiskSnapshot
+        self.samples = 0
+        self.hits = 0
+
+    def __sample_cpu(self, now) :
+        total = None
+        percpu = []
+        for line in self.stat.read().splitlines() :
+            if not line.startswith("cpu") :
+                break
+            cols = line.split()
+            times = [int(v) / self.clk_tck for v in cols[1:len(CPU_FIELDS) + 1]]
+            times += [0.0] * (len(CPU_FIELDS) - len(times))
+            if cols[0] == "cpu" :
+                total = tuple(times)
+            else :
+                percpu.append(tuple(times))
+
+        percent = 0.0
+        last = self.cpu_snapshot
+        if last :
+            all_last, busy_last = _busy(last.total)
+            all_now, busy_now = _busy(total)
+            if all_now > all_last :
+                percent = min(max(round((busy_now - busy_last) * 100 / (all_now - all_last), 1), 0.0), 100.0)
+        return CpuSnapshot(now, total, percpu, percent)
+
+    def __sample_memory(self, now) :
+        info = {}
+        for line in self.meminfo.read().splitlines() :
+            name, _, value = line.partition(":")
+            fields = value.split()
+            if fields :
+                info[name] = int(fields[0]) * 1024
+        total = info.get("MemTotal", 0)
+        free = info.get("MemFree", 0)
+        cached = info.get("Cached", 0) + info.get("SReclaimable", 0)
+        # same accounting as psutil.virtual_memory
+        used = total - free - cached - info.get("Buffers", 0)
+        if used < 0 :
+            used = total - free
+        available = info.get("MemAvailable", free + cached)
+        percent = round((total - available) * 100 / total, 1) if total else 0.0
+        return MemorySnapshot(now, total, available, used, free, percent)
+
+    def __sample_disk(self, path, now) :
+        st = os.statvfs(path)
+        total = st.f_blocks * st.f_frsize
+        free = st.f_bavail * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        percent = round(used * 100 / (used + free), 1) if used + free else 0.0
+        return DiskSnapshot(now, total, used, free, percent)
+
+    def cpu(self) :
+        now = time.monotonic()
+        with self.lock :
+            if self.cpu_snapshot and now - self.cpu_snapshot.time < HOST_CPU_INTERVAL :
+                self.hits += 1
+                return self.cpu_snapshot
+            self.cpu_snapshot = self.__sample_cpu(now)
+            self.samples += 1
+            return self.cpu_snapshot
+
+    def memory(self) :
+        now = time.monotonic()
+        with self.lock :
+            if self.memory_snapshot and now - self.memory_snapshot.time < HOST_MEMORY_INTERVAL :
+                self.hits += 1
+                return self.memory_snapshot
+            self.memory_snapshot = self.__sample_memory(now)
+            self.samples += 1
+            return self.memory_snapshot
+
+    def disk(self, path = "/") :
+        now = time.monotonic()
+        with self.lock :
+            snapshot = self.disk_snapshots.get(path)
+            if snapshot and now - snapshot.time < HOST_DISK_INTERVAL :
+                self.hits += 1
+                return snapshot
+            snapshot = self.__sample_disk(path, now)
+            self.disk_snapshots[path] = snapshot
+            self.samples += 1
+            return snapshot
+
+    def stats(self) :
+        with self.lock :
+            return {
+                "samples" : self.samples,
+                "hits"    : self.hits,
+            }
+
+def _cpu_count(logical) :
+    # physical cores are the distinct (physical id, core id) pairs of /proc/cpuinfo
+    if logical :
+        return os.cpu_count()
+    cores = set()
+    physical_id = core_id = None
+    with open("/proc/cpuinfo") as f :
+        for line in f :
+            name, _, value = line.partition(":")
+            name = name.strip()
+            if name == "physical id" :
+                physical_id = value.strip()
+            elif name == "core id" :
+                core_id = value.strip()
+            elif not name and core_id is not None :
+                cores.add((physical_id, core_id))
+                physical_id = core_id = None
+    if core_id is not None :
+        cores.add((physical_id, core_id))
+    return len(cores) or os.cpu_count()
+
+_sampler = HostSampler()
+
+def get_cpu() :
+    return _sampler.cpu()
+
+def get_memory() :
+    return _sampler.memory()
+
+def get_disk(path = "/") :
+    return _sampler.disk(path)
+
+def get_cpu_count(logical = True) :
+    return _cpu_count(logical)
+
+def get_host_sampler_stats() :
+    return _sampler.stats()
@@ -94,7 +94,7 @@ class Linecard(periph.Periph):
 
     def update_pm(self) :
         temp = self.get_temperature()
-        super().update_pm("Temperature", temp)
+        super().update_pm([("Temperature", temp)])
 
     def update_alarm(self) :
         cur_status = self.get_slot_status()
@@ -14,13 +14,15 @@
 ##
 
 import json
-from threading import Timer
+from threading import Timer, local
+from thrift.Thrift import TApplicationException
 from otn_pmon.thrift_api.ttypes import periph_type, error_code
-from otn_pmon.thrift_client import thrift_try
+from otn_pmon.thrift_client import thrift_try, thrift_available, run_blocking
 from otn_pmon.common import *
 import otn_pmon.db as db
-from otn_pmon.alarm import Alarm
-from otn_pmon.pm import Pm, clearPmByName
+from otn_pmon.cache import rpc_cache, single_flight, RPC_SERIAL_CHECK_INTERVAL
+from otn_pmon.alarm import Alarm, trim_history_alarms
+from otn_pmon.pm import get_pms, clearPmByName, update_pms
 from sonic_py_common.device_info import get_path_to_platform_dir
 
 def get_dev_spec() :
@@ -44,6 +46,70 @@ def get_periph_expected_pn(type) :
         return spec["expected-pn"][type_name]
     return None
 
+_snapshot_supported = True
+
+def _snapshot_try(func) :
+    # devmgr without the snapshot rpcs answers UNKNOWN_METHOD, fall back to the per item rpcs then
+    global _snapshot_supported
+    if not _snapshot_supported :
+        return None
+
+    def inner(client):
+        try :
+            return func(client)
+        except TApplicationException as e :
+            if e.type != TApplicationException.UNKNOWN_METHOD :
+                raise e
+            return TApplicationException.UNKNOWN_METHOD
+
+    result = thrift_try(inner)
+    if result == TApplicationException.UNKNOWN_METHOD :
+        _snapshot_supported = False
+        LOG.log_notice("periph snapshot rpc is not supported by devmgr, use per item rpcs")
+        return None
+    return result
+
+def get_periph_snapshot(type, id) :
+    def inner(client):
+        return client.get_periph_snapshot(type, id)
+
+    snapshot = _snapshot_try(inner)
+    if not snapshot or snapshot.ret != error_code.OK :
+        return None
+    return snapshot
+
+def get_all_periph_snapshots() :
+    def inner(client):
+        return client.get_all_periph_snapshots()
+
+    snapshots = {}
+    for s in _snapshot_try(inner) or [] :
+        if s.ret == error_code.OK :
+            snapshots[(s.type, s.id)] = s
+    return snapshots
+
+def _fetch_periph_inventory(type, id) :
+    def inner(client):
+        return client.get_inventory(type, id)
+
+    result = thrift_try(inner)
+    if result.ret != error_code.OK :
+        return None
+    # a new serial number means the card was swapped, drop what is cached for the slot
+    rpc_cache.update_serial((type, id), result.inv.sn)
+    return result.inv
+
+def get_periph_inventory(type, id) :
+    return rpc_cache.get((type, id), "inventory", lambda : _fetch_periph_inventory(type, id))
+
+def check_periph_serial(type, id) :
+    # the inventory is read again once its serial number was last checked long enough ago
+    rpc_cache.refresh((type, id), "inventory", lambda : _fetch_periph_inventory(type, id), RPC_SERIAL_CHECK_INTERVAL)
+
+# the snapshots of the periphs being synchronized by this thread, (periph_type, id) -> snapshot,
+# other threads as the fan control see none and use the per item rpcs
+_synchronizing = local()
+
 class Periph(object):
     def __init__(self, type, id):
         self.type = type
@@ -61,18 +127,32 @@ class Periph(object):
             name = f"{type_string}-{self.id}"
         return name
 
-    def synchronize(self) :
+    def synchronize(self, snapshot = None) :
+        # skip this cycle rather than stall on a server known to be down
+        if not thrift_available() :
+            return
+        key = (self.type, self.id)
+        snapshots = _synchronizing.__dict__.setdefault("snapshots", {})
         try:
-            if self.presence() :
-                # self.initialize()
-                self.synchronize_presence()
-                # print("{} synchronize_presence done".format(self.name))
-            else :
-                self.synchronize_not_presence()
-                # print("{} synchronize_not_presence done".format(self.name))
+            # all db writes of the cycle are sent in one round trip per db
+            with db.write_batch() :
+                snapshots[key] = snapshot if snapshot else self.get_snapshot()
+                if self.presence() :
+                    # self.initialize()
+                    self.synchronize_presence()
+                    # print("{} synchronize_presence done".format(self.name))
+                else :
+                    self.synchronize_not_presence()
+                    # print("{} synchronize_not_presence done".format(self.name))
         except Exception as e :
             LOG.log_warning(f"Failed to synchronize {self.name} as error : {e}")
             # raise e
+        finally:
+            snapshots.pop(key, None)
+
+    async def synchronize_async(self, snapshot = None) :
+        # run in a worker so that the periphs of a chassis are synchronized concurrently
+        await run_blocking(self.synchronize, snapshot)
 
     def synchronize_presence(self) :
         if not self.state_initialized :
@@ -85,6 +165,8 @@ class Periph(object):
             # print("{} update_state doing".format(self.name))
             self.update_state()
             self.update_alarm()
+            # history alarms also expire when none are cleared for a while
+            trim_history_alarms(self.name)
             self.update_pm()
 
     def synchronize_not_presence(self):
@@ -118,11 +200,15 @@ class Periph(object):
         else :
             self.update_slot_status(slot_status.READY)
 
-    def update_pm(self, pm_name, value):
-        pm15 = Pm(self.table_name, self.name, pm_name, Pm.PM_TYPE_15)
-        pm24 = Pm(self.table_name, self.name, pm_name, Pm.PM_TYPE_24)
-        pm15.update(value)
-        pm24.update(value)
+    def update_pm(self, samples):
+        # the [(pm name, value)] of a cycle go to the pm engine in one call
+        pms = []
+        values = []
+        for pm_name, value in samples :
+            metric_pms = get_pms(self.table_name, self.name, pm_name)
+            pms += metric_pms
+            values += [value] * len(metric_pms)
+        update_pms(pms, values)
 
     def mismatch(self) :
         return False
@@ -151,13 +237,16 @@ class Periph(object):
         if not self.removable() :
             return
         state_db = self.dbs[db.STATE_DB]
+        # read both status in one round trip
+        _, fvs = state_db.get_entry(self.table_name, self.name)
+        entry = dict(fvs) if fvs else {}
          # compare with the slot-status in db
-        _, db_s_status = state_db.get_field(self.table_name, self.name, "slot-status")
+        db_s_status = entry.get("slot-status")
         if db_s_status and status != get_slot_status_value(db_s_status) :
             state_db.set_field(self.table_name, self.name, "slot-status", get_slot_status_name(status))
 
         # oper-status need to update with the updation of slot-status
-        _, db_o_status = state_db.get_field(self.table_name, self.name, "oper-status")
+        db_o_status = entry.get("oper-status")
         if db_o_status and db_o_status != slot_status_to_oper_status(status) :
             state_db.set_field(self.table_name, self.name, "oper-status", slot_status_to_oper_status(status))
     
@@ -171,21 +260,45 @@ class Periph(object):
             return client.initialize(self.type, self.id)
         return thrift_try(inner)
       
+    def get_snapshot(self):
+        return get_periph_snapshot(self.type, self.id)
+
+    def current_snapshot(self):
+        # telemetry fetched in one rpc at the start of the synchronize running in this thread
+        return getattr(_synchronizing, "snapshots", {}).get((self.type, self.id))
+
     def presence(self):
         def inner(client):
             return client.periph_presence(self.type, self.id)
-        return thrift_try(inner)
+
+        snapshot = self.current_snapshot()
+        if snapshot :
+            presence = snapshot.presence
+        else :
+            presence = thrift_try(inner)
+        rpc_cache.update_presence((self.type, self.id), presence)
+        if presence :
+            try :
+                check_periph_serial(self.type, self.id)
+            except Exception as e :
+                # keep the cached inventory, the serial number is checked again next cycle
+                LOG.log_warning(f"Failed to check the serial number of {self.name} as error : {e}")
+        return presence
 
     def get_version(self):
         def inner(client):
             return client.get_periph_version(self.type, self.id)
-        return thrift_try(inner)
+        return rpc_cache.get((self.type, self.id), "periph_version", lambda : thrift_try(inner))
 
     def get_temperature(self):
         def inner(client):
             return client.get_periph_temperature(self.type, self.id)
-        
-        temp = thrift_try(inner)
+
+        snapshot = self.current_snapshot()
+        if snapshot and snapshot.temperature :
+            temp = snapshot.temperature
+        else :
+            temp = single_flight.do(("temperature", self.type, self.id), lambda : thrift_try(inner))
         if temp.ret != error_code.OK :
             return INVALID_TEMPERATURE
 
@@ -200,14 +313,7 @@ class Periph(object):
         return None
 
     def get_inventory(self):
-        def inner(client):
-            return client.get_inventory(self.type, self.id)
-
-        result = thrift_try(inner)
-        if result.ret != error_code.OK :
-            return None
-
-        return result.inv
+        return get_periph_inventory(self.type, self.id)
 
     def set_led_color(self, type, id, color):
         def inner(client):
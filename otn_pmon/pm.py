@@ -14,136 +14,684 @@
 ##
 
 import time
-from functools import lru_cache
+import math
+import struct
+import threading
+from array import array
+from collections import OrderedDict
 import otn_pmon.db as db
 
+PM_FLUSH_INTERVAL = 0 # unit s, current pms are written this often, 0 writes them on every update
+PM_REGISTRY_MAX = 0   # pms kept at most, the least recently used is evicted beyond it, 0 for no bound
+PM_STATISTICS = True  # estimate the percentiles and the standard deviation of the bins
+PM_PERCENTILES = (0.5, 0.95, 0.99)
+PM_DERIVE_24 = False  # feed only the 15 minute pms, roll the 24 hour ones up from them (no percentiles)
+PM_HISTORY_FORMAT = "hash" # "hash": one hash per bin, "packed": bins appended to one blob per metric and day
+PM_HISTORY_EXPIRE = 0      # unit s, expiry of a packed day blob, 0 keeps it like the hashes
+
+class PmKeyIndex(object):
+    """current pm keys of each resource, kept in a set per resource in COUNTERS_DB"""
+    def __init__(self) :
+        self.lock = threading.Lock()
+        self.scanned = set()  # (redis sock, table) already scanned for keys written before the index
+        self.empty = set()    # resources known to have no current pm key
+
+    def key(self, client, base_key) :
+        return client.key_name(db.Table.PM_INDEX, base_key)
+
+    def add(self, client, base_key, table, kname) :
+        client.connector.redis().sadd(self.key(client, base_key), f"{table}|{kname}")
+        with self.lock :
+            self.empty.discard(base_key)
+
+    def scan_legacy(self, client, table) :
+        # one pass over a table for the keys of all its resources, written without index
+        scan = (client.connector.redis_sock, table)
+        with self.lock :
+            if scan in self.scanned :
+                return
+            self.scanned.add(scan)
+        p = client.connector.redis().pipeline(transaction = False)
+        for k in client.get_keys(table) or [] :
+            if "_pm_current" not in k :
+                continue
+            base_key = k.split("_")[0]
+            p.sadd(self.key(client, base_key), f"{table}|{k}")
+            with self.lock :
+                self.empty.discard(base_key)
+        p.execute()
+
+    def scan(self, client, table, base_key) :
+        # [(table, key)] of the resource found by a scan of the table, for keys the index misses
+        prefix = client.key_name(table, "")
+        keys = client.connector.redis().scan_iter(match = client.key_name(table, f"{base_key}_*"), count = 1000)
+        return sorted((table, k[len(prefix):]) for k in keys)
+
+    def members(self, client, base_key) :
+        # [(table, key)] of the resource
+        keys = client.connector.redis().smembers(self.key(client, base_key))
+        return sorted(tuple(k.split("|", 1)) for k in keys)
+
+    def is_empty(self, base_key) :
+        with self.lock :
+            return base_key in self.empty
+
+    def set_empty(self, base_key) :
+        with self.lock :
+            self.empty.add(base_key)
+
+_key_index = PmKeyIndex()
+
+def list_pm_keys(name) :
+    # [(table, key)] of the current pms of a resource
+    client = db.get_dbs(name, [db.COUNTERS_DB])[db.COUNTERS_DB]
+    _key_index.scan_legacy(client, name.split("-")[0])
+    return _key_index.members(client, name)
+
+def export_pm(name) :
+    # {key : {field : value}} of the current pms of a resource, read in one round trip
+    client = db.get_dbs(name, [db.COUNTERS_DB])[db.COUNTERS_DB]
+    _key_index.scan_legacy(client, name.split("-")[0])
+    keys = _key_index.members(client, name)
+    p = client.connector.redis().pipeline(transaction = False)
+    for table, k in keys :
+        p.hgetall(client.key_name(table, k))
+    return {k : fields for (_, k), fields in zip(keys, p.execute()) if fields}
+
 def clearPmByName(name) :
-    tname = name.split("-")[0]
+    """drop the pms of a resource, the accumulators go with the db keys so a re-inserted card starts over
+
+    Only the keys of the resource itself are deleted, "<name>_..." in the table of its type, as
+    listed by the key index. LINECARD-1-1 no longer takes the keys of LINECARD-1-10 along. When the
+    index has none, the table is scanned for them in case they were written around the index.
+    """
+    _registry.evict(name)
+    # nothing written since the last clear, the usual case of an empty slot
+    if _key_index.is_empty(name) :
+        return
     dbs = db.get_dbs(name, [db.COUNTERS_DB])
     if not dbs :
         return
-    keys = dbs[db.COUNTERS_DB].get_keys(tname)
-    for k in keys :
-        if name not in k :
-            continue
-        dbs[db.COUNTERS_DB].delete_entry(tname, k)
+    client = dbs[db.COUNTERS_DB]
+    table = name.split("-")[0]
+    _key_index.scan_legacy(client, table)
+    keys = _key_index.members(client, name)
+    if not keys :
+        keys = _key_index.scan(client, table, name)
+    with db.write_batch() :
+        for table, k in keys :
+            client.delete_entry(table, k)
+        client.delete_entry(db.Table.PM_INDEX, name)
+    _key_index.set_empty(name)
 
-@lru_cache()
-class Pm :
-    """PM class"""
-    PM_TYPE_15 = "15"
-    PM_TYPE_24 = "24"
-    def __init__(self, table, base_key, name, type) : 
-        self.table = table
-        self.base_key = base_key
-        self.name = name # PM name
-        self.type = type # PM type 15|24
-        self.dbs = db.get_dbs(base_key, [db.COUNTERS_DB, db.HISTORY_DB])
-
-        self.starttime = 0 
-        self.interval = self.__get_interval()
-        self.instant = 0 # current value
-        self.avg = 0
-        self.min = 0
-        self.max = 0
-        self.min_time = 0
-        self.max_time = 0
-        self.sum = 0    # sampling sum
-        self.count = 0  # sampling total count
-
-    def __get_interval(self) :
-        ns_unit = 1000000000
-        interval = 0
-        if self.type == Pm.PM_TYPE_15 :
-            interval = 15 * 60 * ns_unit
-        else :
-            interval = 24 * 60 * 60 * ns_unit
-        return interval
-
-    def __get_latest_sampling_timestamp(self, time) :
-        delta = self.__get_interval()
-        # timezone ???
-        return int(time / delta) * delta
-
-    def __need_reset(self, time) :
-        new_timestamp = self.__get_latest_sampling_timestamp(time)
-        if self.starttime != 0 and self.starttime != new_timestamp :
-            return True
-        return False
-
-    def __reset(self) :
-        # generate history pm then do reset
-        self.__save(db.HISTORY_DB)
- 
-        self.starttime = 0
-        self.instant = 0 # current value
-        self.avg = 0.0
-        self.min = 0.0
-        self.max = 0.0
-        self.min_time = 0
-        self.max_time = 0
-        self.sum = 0
-        self.count = 0 # accumulate times
-
-    def __get_key(self, type = db.COUNTERS_DB) :
-        if type == db.HISTORY_DB :
-            suffix = "15_pm_history"
-            if self.type != Pm.PM_TYPE_15 :
-                suffix = "24_pm_history"
+def _fmt(value, is_int) :
+    # keep the text of the values as written before, "5" for an int sample and "5.0" for a float one
+    return f"{int(value)}" if is_int else f"{value}"
+
+# a packed history bin, little endian: starttime, instant, avg, min, max, min-time, max-time, count,
+# then the percentiles and stddev, NaN when not estimated
+PACKED_FIELDS = ["starttime", "instant", "avg", "min", "max", "min-time", "max-time", "count"] + \
+                [f"p{round(p * 100):g}" for p in PM_PERCENTILES] + ["stddev"]
+_PACKED = struct.Struct("<qddddqqq" + "d" * (len(PM_PERCENTILES) + 1))
+_PACKED_INT_FIELDS = ("starttime", "min-time", "max-time", "count")
+_DAY_NS = 24 * 60 * 60 * 1000000000
+
+def _history_suffix(type) :
+    return "15_pm_history" if type == Pm.PM_TYPE_15 else "24_pm_history"
+
+def _packed_key(his_db, table, base_key, name, type, day) :
+    suffix = "15_pm_packed" if type == Pm.PM_TYPE_15 else "24_pm_packed"
+    return his_db.key_name(table, f"{base_key}_{name}:{suffix}_{day}")
+
+# extended P-square estimation of several quantiles in constant memory (Raatikainen), 2m+3 markers for
+# m quantiles: the min, the quantiles, the midpoints between them and the max
+_P2_MARKERS = 2 * len(PM_PERCENTILES) + 3
+_P2_DESIRED = [0.0]
+for _i, _p in enumerate(PM_PERCENTILES) :
+    _P2_DESIRED.append((_P2_DESIRED[-1] + _p) / 2 if _i else _p / 2)
+    _P2_DESIRED.append(_p)
+_P2_DESIRED += [(1 + PM_PERCENTILES[-1]) / 2, 1.0]
+del _i, _p
+
+def _p2_sorted_quantile(q, base, count, p) :
+    # the p quantile of the count sorted samples at base, linear between the closest ranks
+    pos = p * (count - 1)
+    lo = int(pos)
+    hi = min(lo + 1, count - 1)
+    return q[base + lo] + (q[base + hi] - q[base + lo]) * (pos - lo)
+
+def _p2_add(q, n, base, x, count) :
+    # q: marker heights, n: marker positions, of the row at base; count: samples including x
+    m = _P2_MARKERS
+    if count <= m :
+        # the first samples are kept sorted, the quantiles are exact from them
+        i = base + count - 1
+        while i > base and q[i - 1] > x :
+            q[i] = q[i - 1]
+            i -= 1
+        q[i] = x
+        return
+    if count == m + 1 :
+        # the markers start at the quantiles of the sorted samples, at their desired positions
+        heights = [_p2_sorted_quantile(q, base, m, _P2_DESIRED[i]) for i in range(m)]
+        for i in range(m) :
+            q[base + i] = heights[i]
+            n[base + i] = 1 + (m - 1) * _P2_DESIRED[i]
+
+    if x < q[base] :
+        q[base] = x
+        k = 0
+    elif x >= q[base + m - 1] :
+        q[base + m - 1] = x
+        k = m - 2
+    else :
+        k = 0
+        while x >= q[base + k + 1] :
+            k += 1
+    for i in range(base + k + 1, base + m) :
+        n[i] += 1
+
+    for i in range(1, m - 1) :
+        j = base + i
+        d = 1 + (count - 1) * _P2_DESIRED[i] - n[j]
+        if (d >= 1 and n[j + 1] - n[j] > 1) or (d <= -1 and n[j - 1] - n[j] < -1) :
+            d = 1 if d > 0 else -1
+            # parabolic prediction, linear if it leaves the neighbours
+            h = q[j] + d / (n[j + 1] - n[j - 1]) * (
+                (n[j] - n[j - 1] + d) * (q[j + 1] - q[j]) / (n[j + 1] - n[j]) +
+                (n[j + 1] - n[j] - d) * (q[j] - q[j - 1]) / (n[j] - n[j - 1]))
+            if not q[j - 1] < h < q[j + 1] :
+                h = q[j] + d * (q[j + d] - q[j]) / (n[j + d] - n[j])
+            q[j] = h
+            n[j] += d
+
+def _p2_quantile(q, n, base, count, index) :
+    # the index-th of PM_PERCENTILES
+    if count == 0 :
+        return 0
+    p = PM_PERCENTILES[index]
+    if count <= _P2_MARKERS :
+        return _p2_sorted_quantile(q, base, count, p)
+    # between the markers around its desired position, its own marker may lag it
+    pos = 1 + (count - 1) * p
+    i = base
+    while i < base + _P2_MARKERS - 2 and n[i + 1] < pos :
+        i += 1
+    return q[i] + (q[i + 1] - q[i]) * (pos - n[i]) / (n[i + 1] - n[i])
 
-            return  f"{self.base_key}_{self.name}:{suffix}_{self.starttime}"
+class PmEngine(object):
+    """accumulators of all pms in columns, one row per (table, base key, name, type)"""
+    NS_UNIT = 1000000000
+    INTERVALS = {"15" : 15 * 60 * NS_UNIT, "24" : 24 * 60 * 60 * NS_UNIT}
+
+    def __init__(self) :
+        self.lock = threading.RLock()
+        self.rows = {}       # (table, base_key, name, type) -> row
+        self.meta = []       # row -> (table, base_key, name, type), None if released
+        self.free = []       # released rows, reused first
+        self.dbs = {}        # base_key -> dbs
+        self.starttime = array('q')
+        self.instant = array('d')
+        self.min = array('d')
+        self.max = array('d')
+        self.min_time = array('q')
+        self.max_time = array('q')
+        self.sum = array('d')
+        self.count = array('q')
+        # running mean and sum of squared deviations (Welford), P-square markers, per row
+        self.mean = array('d')
+        self.m2 = array('d')
+        self.marker_q = array('d')
+        self.marker_n = array('d')
+        # whether the instant/min/max sample was an int, for the text written to db, and if rolled up
+        self.int_flags = array('b')
+        self.rollup = array('q')  # row -> the 24 hour row its closed bins are rolled up to, -1 if none
+        self.generation = array('q')  # row -> times released, a pm holding an older one is stale
+        self.dirty = set()
+        self.indexed = set() # rows whose current key is in the key index of their resource
+        self.last_flush = 0
+        self.updates = 0
+        self.writes = 0
+        self.stale = 0
+
+    def row(self, table, base_key, name, type) :
+        key = (table, base_key, name, type)
+        with self.lock :
+            r = self.rows.get(key)
+            if r is not None :
+                return r, self.generation[r]
+            if base_key not in self.dbs :
+                self.dbs[base_key] = db.get_dbs(base_key, [db.COUNTERS_DB, db.HISTORY_DB])
+            if self.free :
+                r = self.free.pop()
+                self.meta[r] = key
+            else :
+                r = len(self.meta)
+                self.meta.append(key)
+                for col in (self.starttime, self.min_time, self.max_time, self.count) :
+                    col.append(0)
+                for col in (self.instant, self.min, self.max, self.sum, self.mean, self.m2) :
+                    col.append(0.0)
+                self.marker_q.extend([0.0] * _P2_MARKERS)
+                self.marker_n.extend([0.0] * _P2_MARKERS)
+                self.int_flags.append(0)
+                self.rollup.append(-1)
+                self.generation.append(0)
+            self.rows[key] = r
+            return r, self.generation[r]
+
+    def release(self, r, flush = False) :
+        # the row is reset and reused by the next new pm, nothing is written unless flush:
+        # then its dirty current record and its bin in progress, as an incomplete one, go to db first
+        with self.lock, db.write_batch() :
+            key = self.meta[r]
+            if key is None :
+                return
+            if flush and self.starttime[r] != 0 :
+                if r in self.dirty :
+                    self.__save(r)
+                self.__save(r, db.HISTORY_DB, False)
+                if self.rollup[r] >= 0 :
+                    self.__roll_up(r, self.rollup[r], False)
+            del self.rows[key]
+            self.meta[r] = None
+            self.dirty.discard(r)
+            self.indexed.discard(r)
+            self.__reset(r)
+            self.rollup[r] = -1
+            self.generation[r] += 1
+            for i, up in enumerate(self.rollup) :
+                if up == r :
+                    self.rollup[i] = -1
+            self.free.append(r)
+
+    def link(self, r, up) :
+        # the closed bins of row r are rolled up to row up
+        with self.lock :
+            self.rollup[r] = up
+
+    def __reset(self, r) :
+        self.starttime[r] = 0
+        self.instant[r] = 0
+        self.min[r] = 0.0
+        self.max[r] = 0.0
+        self.min_time[r] = 0
+        self.max_time[r] = 0
+        self.sum[r] = 0
+        self.count[r] = 0
+        self.int_flags[r] = 0
+        self.mean[r] = 0.0
+        self.m2[r] = 0.0
+        base = r * _P2_MARKERS
+        for i in range(base, base + _P2_MARKERS) :
+            self.marker_q[i] = 0.0
+
+    def __get_key(self, r, type = db.COUNTERS_DB) :
+        table, base_key, name, pm_type = self.meta[r]
+        if type == db.HISTORY_DB :
+            return  f"{base_key}_{name}:{_history_suffix(pm_type)}_{self.starttime[r]}"
 
         suffix = "15_pm_current"
-        if self.type != Pm.PM_TYPE_15 :
+        if pm_type != Pm.PM_TYPE_15 :
             suffix = "24_pm_current"
-        return  f"{self.base_key}_{self.name}:{suffix}"
+        return  f"{base_key}_{name}:{suffix}"
+
+    def __statistics(self, r) :
+        if not PM_STATISTICS :
+            return []
+        base = r * _P2_MARKERS
+        stats = []
+        # the percentiles of a rolled up bin are not known from those of its bins, only its stddev is
+        if not self.int_flags[r] & 8 :
+            stats = [(f"p{round(p * 100):g}",
+                      round(_p2_quantile(self.marker_q, self.marker_n, base, self.count[r], i), 1))
+                     for i, p in enumerate(PM_PERCENTILES)]
+        stats.append(("stddev", round(math.sqrt(self.m2[r] / self.count[r]), 1)))
+        return stats
+
+    def __append_packed(self, r) :
+        table, base_key, name, pm_type = self.meta[r]
+        his_db = self.dbs[base_key][db.HISTORY_DB]
+        stats = dict(self.__statistics(r))
+        nan = float("nan")
+        record = _PACKED.pack(self.starttime[r], self.instant[r], round(self.sum[r] / self.count[r], 1),
+                              self.min[r], self.max[r], self.min_time[r], self.max_time[r], self.count[r],
+                              *[stats.get(f, nan) for f in PACKED_FIELDS[8:]])
+        key = _packed_key(his_db, table, base_key, name, pm_type, self.starttime[r] // _DAY_NS * _DAY_NS)
+        his_db.append(key, record, PM_HISTORY_EXPIRE)
+
+    def __save(self, r, type = db.COUNTERS_DB, complete = True) :
+        if self.starttime[r] == 0 :
+            return
 
-    def __save(self, type = db.COUNTERS_DB) :
-        if self.starttime == 0 :
+        if type == db.HISTORY_DB and PM_HISTORY_FORMAT == "packed" :
+            self.__append_packed(r)
+            self.writes += 1
             return
 
         validity = "incomplete"
-        if type == db.HISTORY_DB :
+        if type == db.HISTORY_DB and complete :
             validity = "complete"
 
+        table, base_key, name, pm_type = self.meta[r]
+        flags = self.int_flags[r]
         data = [
-            ("starttime", f"{self.starttime}"),
-            ("instant", f"{self.instant}"),
-            ("avg", f"{self.avg}"),
-            ("min", f"{self.min}"),
-            ("max", f"{self.max}"),
-            ("interval", f"{self.interval}"),
-            ("min-time", f"{self.min_time}"),
-            ("max-time", f"{self.max_time}"),
+            ("starttime", f"{self.starttime[r]}"),
+            ("instant", _fmt(self.instant[r], flags & 1)),
+            ("avg", f"{round(self.sum[r] / self.count[r], 1)}"),
+            ("min", _fmt(self.min[r], flags & 2)),
+            ("max", _fmt(self.max[r], flags & 4)),
+            ("interval", f"{PmEngine.INTERVALS[pm_type]}"),
+            ("min-time", f"{self.min_time[r]}"),
+            ("max-time", f"{self.max_time[r]}"),
             ("validity", validity),
         ]
+        data += [(f, f"{v}") for f, v in self.__statistics(r)]
 
-        key = self.__get_key(type)
-        if type not in self.dbs :
+        key = self.__get_key(r, type)
+        dbs = self.dbs[base_key]
+        if type not in dbs :
             print(f"save pm {key} to db failed as the type {type} is invalid")
             return
-        # print(f"set {self.table} {key}")
-        self.dbs[type].set(self.table, key, data)
+        dbs[type].set(table, key, data)
+        self.writes += 1
+        if type == db.COUNTERS_DB and r not in self.indexed :
+            _key_index.add(dbs[type], base_key, table, key)
+            self.indexed.add(r)
 
-    def update(self, value) :
+    def __update(self, r, value, cur_time) :
+        interval = PmEngine.INTERVALS[self.meta[r][3]]
+        starttime = cur_time // interval * interval
+        if self.starttime[r] != 0 and self.starttime[r] != starttime :
+            # the bin is over, it goes to history right away whatever the flush cadence
+            self.__save(r, db.HISTORY_DB)
+            if self.rollup[r] >= 0 :
+                self.__roll_up(r, self.rollup[r])
+            self.__reset(r)
+
+        is_int = isinstance(value, int)
+        flags = self.int_flags[r]
+        self.starttime[r] = starttime
+        self.instant[r] = value
+        flags = (flags | 1) if is_int else (flags & ~1)
+        if value < self.min[r] or self.min_time[r] == 0 :
+            self.min[r] = value
+            self.min_time[r] = cur_time
+            flags = (flags | 2) if is_int else (flags & ~2)
+        if value > self.max[r] or self.max_time[r] == 0 :
+            self.max[r] = value
+            self.max_time[r] = cur_time
+            flags = (flags | 4) if is_int else (flags & ~4)
+        self.int_flags[r] = flags
+        self.sum[r] += value
+        self.count[r] += 1
+        if PM_STATISTICS :
+            count = self.count[r]
+            delta = value - self.mean[r]
+            self.mean[r] += delta / count
+            self.m2[r] += delta * (value - self.mean[r])
+            _p2_add(self.marker_q, self.marker_n, r * _P2_MARKERS, value, count)
+        self.dirty.add(r)
+        self.updates += 1
+
+    def __roll_up(self, r, up, closed = True) :
+        # merge the closed bin of row r into the current bin of row up, exact for all but the percentiles,
+        # which are left out of the rolled up bins
+        interval = PmEngine.INTERVALS[self.meta[r][3]]
+        up_interval = PmEngine.INTERVALS[self.meta[up][3]]
+        starttime = self.starttime[r] // up_interval * up_interval
+        if self.starttime[up] != 0 and self.starttime[up] != starttime :
+            self.__save(up, db.HISTORY_DB)
+            self.__reset(up)
+
+        flags = self.int_flags[up] | 8
+        self.starttime[up] = starttime
+        self.instant[up] = self.instant[r]
+        flags = (flags & ~1) | (self.int_flags[r] & 1)
+        if self.min[r] < self.min[up] or self.min_time[up] == 0 :
+            self.min[up] = self.min[r]
+            self.min_time[up] = self.min_time[r]
+            flags = (flags & ~2) | (self.int_flags[r] & 2)
+        if self.max[r] > self.max[up] or self.max_time[up] == 0 :
+            self.max[up] = self.max[r]
+            self.max_time[up] = self.max_time[r]
+            flags = (flags & ~4) | (self.int_flags[r] & 4)
+        self.int_flags[up] = flags
+
+        n_a, n_b = self.count[up], self.count[r]
+        n = n_a + n_b
+        delta = self.mean[r] - self.mean[up]
+        self.mean[up] += delta * n_b / n
+        self.m2[up] += self.m2[r] + delta * delta * n_a * n_b / n
+        self.sum[up] += self.sum[r]
+        self.count[up] = n
+        self.dirty.add(up)
+
+        # the last bin of the day closes the day too, once over
+        if closed and (self.starttime[r] + interval) % up_interval == 0 :
+            self.__save(up, db.HISTORY_DB)
+            self.__save(up)
+            self.dirty.discard(up)
+            self.__reset(up)
+
+    def update(self, rows, generations, values) :
+        # samples of one cycle share a timestamp, their writes go in one batch
         cur_time = int(time.time() * 1000000000) # ns
+        with self.lock, db.write_batch() :
+            for r, generation, value in zip(rows, generations, values) :
+                # a row released, and maybe reused by another pm, while its pm was in hand
+                if self.generation[r] != generation :
+                    self.stale += 1
+                    continue
+                self.__update(r, value, cur_time)
+            if time.monotonic() - self.last_flush >= PM_FLUSH_INTERVAL :
+                self.flush()
+
+    def flush(self) :
+        # write the current pms updated since the last flush
+        with self.lock, db.write_batch() :
+            for r in self.dirty :
+                self.__save(r)
+            self.dirty.clear()
+            self.last_flush = time.monotonic()
+
+    def value(self, r, column) :
+        return getattr(self, column)[r]
+
+    def memory(self) :
+        # bytes held by the columns
+        cols = (self.starttime, self.instant, self.min, self.max, self.min_time, self.max_time,
+                self.sum, self.count, self.int_flags, self.mean, self.m2, self.marker_q, self.marker_n,
+                self.rollup, self.generation)
+        return sum(c.buffer_info()[1] * c.itemsize for c in cols)
+
+    def stats(self) :
+        with self.lock :
+            return {
+                "rows"    : len(self.meta) - len(self.free),
+                "free"    : len(self.free),
+                "bytes"   : self.memory(),
+                "dirty"   : len(self.dirty),
+                "updates" : self.updates,
+                "stale"   : self.stale,
+                "writes"  : self.writes,
+            }
+
+def _legacy_history(his_db, table, base_key, name, type) :
+    # bins of the hash history layout, [(starttime, {field : value})]
+    r = his_db.connector.redis()
+    pattern = his_db.key_name(table, f"{base_key}_{name}:{_history_suffix(type)}_*")
+    keys = list(r.scan_iter(match = pattern, count = 1000))
+    p = r.pipeline(transaction = False)
+    for k in keys :
+        p.hgetall(k)
+    bins = []
+    for k, info in zip(keys, p.execute()) :
+        if info and "starttime" in info :
+            bins.append((int(info["starttime"]), k, info))
+    return bins
+
+def query_pm_history(table, base_key, name, type, start, end, legacy = False) :
+    """history bins with starttime in [start, end] (unit ns), oldest first, as {field : array}
+
+    legacy: also scan the history db for bins in the hash layout, a bin in both layouts counts once.
+            Slow, bins written before the packed layout are better moved once by migrate_pm_history
+    """
+    his_db = db.get_dbs(base_key, [db.HISTORY_DB])[db.HISTORY_DB]
+    r = his_db.connector.redis_bytes()
+    days = list(range(start // _DAY_NS * _DAY_NS, end + 1, _DAY_NS))
+    p = r.pipeline(transaction = False)
+    for day in days :
+        p.get(_packed_key(his_db, table, base_key, name, type, day))
+    bins = {}
+    for blob in p.execute() :
+        if not blob :
+            continue
+        for record in _PACKED.iter_unpack(blob[:len(blob) - len(blob) % _PACKED.size]) :
+            if start <= record[0] <= end :
+                bins[record[0]] = record
+    nan = float("nan")
+    for starttime, _, info in (_legacy_history(his_db, table, base_key, name, type) if legacy else []) :
+        if start <= starttime <= end and starttime not in bins :
+            bins[starttime] = tuple(int(info.get(f, 0)) if f in _PACKED_INT_FIELDS else float(info.get(f, nan))
+                                    for f in PACKED_FIELDS)
+
+    result = {f : array('q' if f in _PACKED_INT_FIELDS else 'd') for f in PACKED_FIELDS}
+    for starttime in sorted(bins) :
+        for f, v in zip(PACKED_FIELDS, bins[starttime]) :
+            result[f].append(v)
+    return result
+
+def migrate_pm_history(table, base_key, name, type) :
+    # move the hash history bins of one metric to the packed layout, returns the bins moved
+    his_db = db.get_dbs(base_key, [db.HISTORY_DB])[db.HISTORY_DB]
+    r = his_db.connector.redis()
+    nan = float("nan")
+    moved = 0
+    for starttime, key, info in sorted(_legacy_history(his_db, table, base_key, name, type)) :
+        record = _PACKED.pack(*[int(info.get(f, 0)) if f in _PACKED_INT_FIELDS else float(info.get(f, nan))
+                                for f in PACKED_FIELDS])
+        p = r.pipeline(transaction = True)
+        p.append(_packed_key(his_db, table, base_key, name, type, starttime // _DAY_NS * _DAY_NS), record)
+        p.delete(key)
+        p.execute()
+        moved += 1
+    return moved
+
+class PmRegistry(object):
+    """the pms by (table, base key, name, type), evicted with their resource or beyond PM_REGISTRY_MAX"""
+    def __init__(self, engine) :
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.pms = OrderedDict()  # (table, base_key, name, type) -> Pm, least recently used first
+        self.by_resource = {}     # base_key -> set of (table, base_key, name, type)
+        self.evictions = 0
+
+    def get(self, table, base_key, name, type) :
+        key = (table, base_key, name, type)
+        with self.lock :
+            pm = self.pms.get(key)
+            if pm :
+                self.pms.move_to_end(key)
+                return pm
+            pm = Pm(table, base_key, name, type)
+            self.pms[key] = pm
+            self.by_resource.setdefault(base_key, set()).add(key)
+            if PM_REGISTRY_MAX and len(self.pms) > PM_REGISTRY_MAX :
+                # the samples of its bin in progress are kept in db, the pm may be in use still
+                self.__remove(next(iter(self.pms)), True)
+            return pm
+
+    def __remove(self, key, flush = False) :
+        pm = self.pms.pop(key)
+        keys = self.by_resource.get(key[1])
+        keys.discard(key)
+        if not keys :
+            del self.by_resource[key[1]]
+        self.engine.release(pm.row, flush)
+        self.evictions += 1
+
+    def lookup(self, base_key) :
+        with self.lock :
+            return [self.pms[k] for k in self.by_resource.get(base_key, ())]
 
-        if self.__need_reset(cur_time) :
-            # print(f"{self.name} {self.type} PM reset")
-            self.__reset()
-
-        self.starttime = self.__get_latest_sampling_timestamp(cur_time)
-        self.instant = value
-        if value < self.min or self.min_time == 0 :
-            self.min = value
-            self.min_time = cur_time
-        if value > self.max or self.max_time == 0 :
-            self.max = value
-            self.max_time = cur_time
-
-        self.sum += value
-        self.count += 1
-        self.avg = round(self.sum / self.count, 1)
-        
-        # save current pm to counters db
-        self.__save()
\ No newline at end of file
+    def evict(self, base_key) :
+        # the pms of a resource cleared, their accumulators are dropped with its keys
+        with self.lock :
+            for key in list(self.by_resource.get(base_key, ())) :
+                self.__remove(key)
+
+    def stats(self) :
+        with self.lock :
+            stats = {
+                "pms"       : len(self.pms),
+                "resources" : len(self.by_resource),
+                "evictions" : self.evictions,
+            }
+        stats["engine"] = self.engine.stats()
+        return stats
+
+_engine = PmEngine()
+_registry = PmRegistry(_engine)
+
+def get_pm_engine() :
+    return _engine
+
+def get_pm(table, base_key, name, type) :
+    return _registry.get(table, base_key, name, type)
+
+def get_pms(table, base_key, name) :
+    # the pms to feed with the samples of a metric
+    pm15 = get_pm(table, base_key, name, Pm.PM_TYPE_15)
+    pm24 = get_pm(table, base_key, name, Pm.PM_TYPE_24)
+    if PM_DERIVE_24 :
+        _engine.link(pm15.row, pm24.row)
+        return [pm15]
+    _engine.link(pm15.row, -1)
+    return [pm15, pm24]
+
+def get_pms_of(base_key) :
+    return _registry.lookup(base_key)
+
+def get_pm_generation() :
+    # changes when pms held by callers may be stale, after an eviction or a pm mode change
+    return (_registry.evictions, PM_DERIVE_24)
+
+def get_pm_stats() :
+    return _registry.stats()
+
+def flush_pm() :
+    _engine.flush()
+
+def update_pms(pms, values) :
+    # update several pms with the samples of one cycle
+    _engine.update([pm.row for pm in pms], [pm.generation for pm in pms], values)
+
+class Pm :
+    """PM class, a view of its row in the pm engine"""
+    PM_TYPE_15 = "15"
+    PM_TYPE_24 = "24"
+    def __init__(self, table, base_key, name, type) : 
+        self.table = table
+        self.base_key = base_key
+        self.name = name # PM name
+        self.type = type # PM type 15|24
+        self.interval = PmEngine.INTERVALS[type]
+        self.row, self.generation = _engine.row(table, base_key, name, type)
+
+    starttime = property(lambda self : _engine.value(self.row, "starttime"))
+    instant = property(lambda self : _engine.value(self.row, "instant"))
+    min = property(lambda self : _engine.value(self.row, "min"))
+    max = property(lambda self : _engine.value(self.row, "max"))
+    min_time = property(lambda self : _engine.value(self.row, "min_time"))
+    max_time = property(lambda self : _engine.value(self.row, "max_time"))
+    sum = property(lambda self : _engine.value(self.row, "sum"))
+    count = property(lambda self : _engine.value(self.row, "count"))
+
+    @property
+    def avg(self) :
+        count = self.count
+        return round(self.sum / count, 1) if count else 0
+
+    def update(self, value) :
+        _engine.update([self.row], [self.generation], [value])
@@ -32,7 +32,11 @@ class Psu(periph.Periph):
         def inner(client):
             return client.get_psu_info(self.id)
 
-        result = thrift_try(inner)
+        snapshot = self.current_snapshot()
+        if snapshot and snapshot.psu_info :
+            result = snapshot.psu_info
+        else :
+            result = thrift_try(inner)
         if result.ret != error_code.OK :
             return None
 
@@ -41,11 +45,19 @@ class Psu(periph.Periph):
     def __psu_vin_high(self) :
         def inner(client):
             return client.psu_vin_high(self.id)
+
+        snapshot = self.current_snapshot()
+        if snapshot and snapshot.vin_high is not None :
+            return snapshot.vin_high
         return thrift_try(inner)
 
     def __psu_vin_low(self) :
         def inner(client):
             return client.psu_vin_low(self.id)
+
+        snapshot = self.current_snapshot()
+        if snapshot and snapshot.vin_low is not None :
+            return snapshot.vin_low
         return thrift_try(inner)
 
     def __expected_psu(self, pn) :
@@ -85,23 +97,24 @@ class Psu(periph.Periph):
 
     def update_pm(self):
         temp = self.get_temperature()
-        super().update_pm("Temperature", temp)
+        samples = [("Temperature", temp)]
 
         psu_info = self.__get_psu_info()
-        if not psu_info :
-            return
-
-        super().update_pm("InputCurrent",  psu_info.iin)
-        super().update_pm("InputVoltage",  psu_info.vin)
-        super().update_pm("InputPower",    psu_info.pin)
-        super().update_pm("OutputCurrent", psu_info.iout)
-        super().update_pm("OutputPower",   psu_info.pout)
-        super().update_pm("OutputVoltage", psu_info.vout)
-
-        super().update_pm("AmbientTemperature", psu_info.ambient_temp)
-        super().update_pm("PrimaryTemperature", psu_info.primary_temp)
-        super().update_pm("SecondaryTemperature", psu_info.secondary_temp)
-        super().update_pm("FanSpeed", psu_info.fan)
+        if psu_info :
+            samples += [
+                ("InputCurrent",  psu_info.iin),
+                ("InputVoltage",  psu_info.vin),
+                ("InputPower",    psu_info.pin),
+                ("OutputCurrent", psu_info.iout),
+                ("OutputPower",   psu_info.pout),
+                ("OutputVoltage", psu_info.vout),
+
+                ("AmbientTemperature", psu_info.ambient_temp),
+                ("PrimaryTemperature", psu_info.primary_temp),
+                ("SecondaryTemperature", psu_info.secondary_temp),
+                ("FanSpeed", psu_info.fan),
+            ]
+        super().update_pm(samples)
 
     def mismatch(self) :
         psu_info = self.__get_psu_info()
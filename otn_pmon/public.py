@@ -13,9 +13,11 @@
 #   permissions and limitations under the License.
 ##
 
-from otn_pmon.thrift_api.ttypes import error_code, power_ctl_type, periph_type
-from otn_pmon.thrift_client import thrift_try
+from otn_pmon.thrift_api.ttypes import periph_type
+import asyncio
+from otn_pmon.thrift_client import thrift_try, run_blocking
 from otn_pmon.common import *
+from otn_pmon.cache import rpc_cache, single_flight
 import otn_pmon.periph as periph
 import otn_pmon.linecard as linecard
 import otn_pmon.fan as fan
@@ -46,42 +48,56 @@ def get_last_slot_id(type) :
 def get_system_version():
     def inner(client):
         return client.get_system_version()
-    return thrift_try(inner)
+    return rpc_cache.get((periph_type.CHASSIS, 1), "system_version", lambda : thrift_try(inner))
 
 def get_product_name() :
     name = ""
-    def inner(client):
-        return client.get_inventory(periph_type.CHASSIS, 1)
-
-    result = thrift_try(inner)
-    if result.ret != error_code.OK :
+    inv = periph.get_periph_inventory(periph_type.CHASSIS, 1)
+    if not inv :
         return name
 
-    return result.inv.model_name
+    return inv.model_name
 
 def get_chassis_mac() :
-    def inner(client):
-        return client.get_inventory(periph_type.CHASSIS, 1)
-
-    result = thrift_try(inner)
-    if result.ret != error_code.OK :
+    inv = periph.get_periph_inventory(periph_type.CHASSIS, 1)
+    if not inv :
         return None
 
-    return result.inv.mac_addr
+    return inv.mac_addr
+
+async def synchronize_all_async(periphs) :
+    snapshots = await run_blocking(periph.get_all_periph_snapshots)
+    await asyncio.gather(*[p.synchronize_async(snapshots.get((p.type, p.id))) for p in periphs])
 
 def set_power_control(slot_id, type) :
     pass
 
-def get_inlet_temp() :
-    card_temp = INVALID_TEMPERATURE
+def _max_temp(temps) :
+    max_temp = INVALID_TEMPERATURE
+    for tmp in temps :
+        if tmp and tmp > max_temp :
+            max_temp = tmp
+    return max_temp
+
+def _inlet_periphs() :
     start = get_first_slot_id(periph_type.LINECARD)
     end = get_last_slot_id(periph_type.LINECARD)
-    for i in range (start, end + 1) :
-        card = linecard.Linecard(i)
-        tmp = card.get_temperature()
-        if tmp and tmp > card_temp :
-            card_temp = tmp
+    return [linecard.Linecard(i) for i in range (start, end + 1)]
+
+def _outlet_periphs() :
+    start = get_first_slot_id(periph_type.FAN)
+    end = get_last_slot_id(periph_type.FAN)
+    return [fan.Fan(i) for i in range (start, end + 1)]
+
+def get_inlet_temp() :
+    # called from the poll loop and the FanControl thread, share one sweep between them
+    return single_flight.do(("inlet_temp",), _get_inlet_temp)
 
+def get_outlet_temp() :
+    return single_flight.do(("outlet_temp",), _get_outlet_temp)
+
+def _get_inlet_temp() :
+    card_temp = _max_temp([card.get_temperature() for card in _inlet_periphs()])
     if card_temp != INVALID_TEMPERATURE :
         return card_temp
 
@@ -89,16 +105,22 @@ def get_inlet_temp() :
     c = cu.Cu(1)
     return c.get_temperature()
 
-def get_outlet_temp() :
-    temp = INVALID_TEMPERATURE
-    start = get_first_slot_id(periph_type.FAN)
-    end = get_last_slot_id(periph_type.FAN)
-    for i in range (start, end + 1) :
-        f = fan.Fan(i)
-        tmp = f.get_temperature()
-        if tmp and tmp > temp :
-            temp = tmp
-    return temp
+def _get_outlet_temp() :
+    return _max_temp([f.get_temperature() for f in _outlet_periphs()])
+
+async def get_inlet_temp_async() :
+    temps = await asyncio.gather(*[run_blocking(card.get_temperature) for card in _inlet_periphs()])
+    card_temp = _max_temp(temps)
+    if card_temp != INVALID_TEMPERATURE :
+        return card_temp
+
+    # all linecards are absent
+    c = cu.Cu(1)
+    return await run_blocking(c.get_temperature)
+
+async def get_outlet_temp_async() :
+    temps = await asyncio.gather(*[run_blocking(f.get_temperature) for f in _outlet_periphs()])
+    return _max_temp(temps)
 
 def get_reboot_type() :
     def inner(client):
@@ -138,6 +138,20 @@ struct fan_speed_spec {
 2: i32 min;
 }
 
+struct periph_snapshot {
+1:  ret_code ret;
+2:  periph_type type;
+3:  i8 id;
+4:  bool presence;
+5:  ret_temp temperature;
+6:  optional ret_fan_speed speed;            # FAN only
+7:  optional fan_speed_spec speed_spec;      # FAN only
+8:  optional ret_psu_info psu_info;          # PSU only
+9:  optional bool vin_high;                  # PSU only
+10: optional bool vin_low;                   # PSU only
+11: optional string reserve
+}
+
 service periph_rpc {
     // common APIs
     system_version get_system_version();
@@ -179,6 +193,12 @@ service periph_rpc {
     ret_code set_fan_speed_rate(1: i8 id, 2: i32 speed_rate);
 
     string get_fpga_version(1: i8 id);
+
+    // telemetry of one periph in one round trip
+    periph_snapshot get_periph_snapshot(1: periph_type type, 2: i8 id);
+
+    // telemetry of all periphs (every slot of every type) in one round trip
+    list<periph_snapshot> get_all_periph_snapshots();
 }
 
 
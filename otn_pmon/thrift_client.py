@@ -14,39 +14,389 @@
 ##
 
 import time
+import random
+import select
+import asyncio
+import threading
 import importlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from thrift.transport import TSocket
 from thrift.transport import TTransport
 from thrift.protocol import TBinaryProtocol
+from thrift.protocol import TCompactProtocol
+from thrift.server import TServer
 from thrift.Thrift import TException
+from otn_pmon.common import LOG
 
 THRIFT_SERVER = 'localhost'
 THRIFT_SERVER_PORT = 9092
+THRIFT_POOL_SIZE = 8            # max connections opened to the server at the same time
+THRIFT_POOL_ACQUIRE_TIMEOUT = 60 # unit s
+THRIFT_POOL_MAX_IDLE = 300      # unit s, idle connections older than this are reopened
+THRIFT_CALL_TIMEOUT = 5         # unit s, connect and per rpc socket deadline
+# the server must be configured with the same protocol and transport
+THRIFT_PROTOCOL = "binary"      # binary | binary-accelerated | compact | compact-accelerated
+THRIFT_TRANSPORT = "buffered"   # buffered | framed
+
+# accelerated protocols fall back to the pure python codec if thrift.protocol.fastbinary is missing
+_protocol_factories = {
+    "binary"              : TBinaryProtocol.TBinaryProtocolFactory,
+    "binary-accelerated"  : TBinaryProtocol.TBinaryProtocolAcceleratedFactory,
+    "compact"             : TCompactProtocol.TCompactProtocolFactory,
+    "compact-accelerated" : TCompactProtocol.TCompactProtocolAcceleratedFactory,
+}
+
+_transport_factories = {
+    "buffered" : TTransport.TBufferedTransportFactory,
+    "framed"   : TTransport.TFramedTransportFactory,
+}
+
+# bumped when the codec changes so that pooled connections are reopened with it
+_codec_generation = 0
+
+def get_protocol_factory(name = None) :
+    return _protocol_factories[name or THRIFT_PROTOCOL]()
+
+def get_transport_factory(name = None) :
+    return _transport_factories[name or THRIFT_TRANSPORT]()
+
+def set_thrift_codec(protocol = None, transport = None) :
+    global THRIFT_PROTOCOL, THRIFT_TRANSPORT, _codec_generation
+    if protocol and protocol not in _protocol_factories :
+        raise ValueError(f"unknown thrift protocol {protocol}")
+    if transport and transport not in _transport_factories :
+        raise ValueError(f"unknown thrift transport {transport}")
+    THRIFT_PROTOCOL = protocol or THRIFT_PROTOCOL
+    THRIFT_TRANSPORT = transport or THRIFT_TRANSPORT
+    _codec_generation += 1
+    _pool.clear()
+
+def create_server(handler, port = THRIFT_SERVER_PORT, host = None) :
+    # threaded periph_rpc server speaking the configured protocol and transport
+    processor = _get_periph_rpc().Processor(handler)
+    socket = TSocket.TServerSocket(host = host, port = port)
+    return TServer.TThreadedServer(processor, socket, get_transport_factory(), get_protocol_factory(), daemon = True)
+
+_periph_rpc = None
+
+def _get_periph_rpc() :
+    # the rpc module is generated at build time, import it on first use only
+    global _periph_rpc
+    if _periph_rpc is None :
+        _periph_rpc = importlib.import_module("otn_pmon.thrift_api.periph_rpc")
+    return _periph_rpc
 
 class ThriftClient(object):
+    def __init__(self):
+        self.socket = None
+        self.transport = None
+        self.pltfm_mgr = None
+        self.last_used = 0
+        self.generation = _codec_generation
+
     def open(self):
-        socket = TSocket.TSocket(THRIFT_SERVER, THRIFT_SERVER_PORT)
-        self.transport = TTransport.TBufferedTransport(socket)
-        bprotocol = TBinaryProtocol.TBinaryProtocol(self.transport)
+        self.socket = TSocket.TSocket(THRIFT_SERVER, THRIFT_SERVER_PORT)
+        self.set_timeout(THRIFT_CALL_TIMEOUT)
+        self.transport = get_transport_factory().getTransport(self.socket)
+        protocol = get_protocol_factory().getProtocol(self.transport)
 
-        periph_rpc = importlib.import_module("otn_pmon.thrift_api.periph_rpc")
-        self.pltfm_mgr = periph_rpc.Client(bprotocol)
+        periph_rpc = _get_periph_rpc()
+        self.pltfm_mgr = periph_rpc.Client(protocol)
 
         self.transport.open()
+        self.last_used = time.monotonic()
         return self
+    def set_timeout(self, seconds):
+        self.socket.setTimeout(seconds * 1000 if seconds else None)
     def close(self):
-        self.transport.close()
+        if self.transport :
+            self.transport.close()
+    def healthy(self):
+        if not self.transport or not self.transport.isOpen() :
+            return False
+        if self.generation != _codec_generation :
+            return False
+        if time.monotonic() - self.last_used > THRIFT_POOL_MAX_IDLE :
+            return False
+        # nothing is expected on an idle connection, readable means the peer closed it
+        try :
+            readable, _, _ = select.select([self.socket.handle], [], [], 0)
+        except (OSError, ValueError) :
+            return False
+        return not readable
     def __enter__(self):
         return self.open()
     def __exit__(self, exc_type, exc_value, tb):
         self.close()
 
-def thrift_try(func, attempts=35):
+class PoolExhaustedError(TTransport.TTransportException):
+    # every connection of the pool stayed in use, this tells nothing about the server
+    def __init__(self, message = None):
+        super().__init__(TTransport.TTransportException.TIMED_OUT, message)
+
+class ThriftClientPool(object):
+    def __init__(self, size = THRIFT_POOL_SIZE):
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+        self.reuses = 0
+        self.discards = 0
+        self.in_use = 0
+        self.exhausted = 0
+
+    def acquire(self, timeout = THRIFT_POOL_ACQUIRE_TIMEOUT):
+        if not self.slots.acquire(timeout = timeout) :
+            with self.lock :
+                self.exhausted += 1
+            raise PoolExhaustedError("no thrift connection available in pool")
+        try :
+            client = None
+            while True :
+                with self.lock :
+                    client = self.idle.pop() if self.idle else None
+                if not client or client.healthy() :
+                    break
+                self.__discard(client)
+
+            if client :
+                with self.lock :
+                    self.reuses += 1
+            else :
+                client = ThriftClient().open()
+                with self.lock :
+                    self.connects += 1
+            with self.lock :
+                self.in_use += 1
+            return client
+        except BaseException :
+            self.slots.release()
+            raise
+
+    def release(self, client, broken = False):
+        with self.lock :
+            self.in_use -= 1
+        if broken :
+            self.__discard(client)
+        else :
+            client.last_used = time.monotonic()
+            with self.lock :
+                self.idle.append(client)
+        self.slots.release()
+
+    def __discard(self, client):
+        try :
+            client.close()
+        except Exception :
+            pass
+        with self.lock :
+            self.discards += 1
+
+    @contextmanager
+    def connection(self, timeout = THRIFT_POOL_ACQUIRE_TIMEOUT):
+        client = self.acquire(timeout)
+        try :
+            yield client
+        except BaseException :
+            # the protocol state is unknown after a failure, do not reuse the connection
+            self.release(client, broken = True)
+            raise
+        self.release(client)
+
+    def clear(self):
+        with self.lock :
+            idle, self.idle = self.idle, []
+        for client in idle :
+            self.__discard(client)
+
+    def stats(self):
+        with self.lock :
+            return {
+                "size"      : self.size,
+                "idle"      : len(self.idle),
+                "in-use"    : self.in_use,
+                "connects"  : self.connects,
+                "reuses"    : self.reuses,
+                "discards"  : self.discards,
+                "exhausted" : self.exhausted,
+            }
+
+_pool = ThriftClientPool()
+
+def get_pool():
+    return _pool
+
+def get_pool_stats():
+    return _pool.stats()
+
+class RetryPolicy(object):
+    def __init__(self, attempts = 35, timeout = THRIFT_CALL_TIMEOUT, backoff = 0.2, backoff_max = 5,
+                 jitter = 0.2, budget = 35):
+        self.attempts = attempts        # max attempts of one call
+        self.timeout = timeout          # unit s, deadline of each attempt
+        self.backoff = backoff          # unit s, delay before the first retry, doubled for each retry
+        self.backoff_max = backoff_max  # unit s, upper bound of the delay between two attempts
+        self.jitter = jitter            # the delay is randomized by +/- this ratio
+        self.budget = budget            # unit s, max total time spent in one call
+
+    def delay(self, attempt):
+        delay = min(self.backoff_max, self.backoff * (2 ** attempt))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+class CircuitOpenError(TException):
+    pass
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold = 5, recovery_timeout = 10):
+        self.failure_threshold = failure_threshold  # consecutive failed attempts to open the circuit
+        self.recovery_timeout = recovery_timeout    # unit s, time in open state before probing
+        self.lock = threading.Lock()
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.opens = 0
+        self.rejects = 0
+
+    def __probe_due(self):
+        return time.monotonic() - self.opened_at >= self.recovery_timeout
+
+    def allow(self):
+        with self.lock :
+            if self.state == CircuitBreaker.CLOSED :
+                return True
+            # only one probe is in flight in half-open state
+            if self.state == CircuitBreaker.OPEN and self.__probe_due() :
+                self.state = CircuitBreaker.HALF_OPEN
+                return True
+            self.rejects += 1
+            return False
+
+    def available(self):
+        with self.lock :
+            return self.state == CircuitBreaker.CLOSED or \
+                   (self.state == CircuitBreaker.OPEN and self.__probe_due())
+
+    def record_success(self):
+        with self.lock :
+            if self.state != CircuitBreaker.CLOSED :
+                LOG.log_notice("thrift server recovered, circuit closed")
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+
+    def release_probe(self):
+        # the probe ended without an answer of the server, the next call probes again
+        with self.lock :
+            if self.state == CircuitBreaker.HALF_OPEN :
+                self.state = CircuitBreaker.OPEN
+
+    def record_failure(self):
+        with self.lock :
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or \
+               (self.state == CircuitBreaker.CLOSED and self.failures >= self.failure_threshold) :
+                if self.state == CircuitBreaker.CLOSED :
+                    LOG.log_warning(f"thrift server failed {self.failures} times, circuit opened")
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.monotonic()
+                self.opens += 1
+
+    def stats(self):
+        with self.lock :
+            return {
+                "state"    : self.state,
+                "failures" : self.failures,
+                "opens"    : self.opens,
+                "rejects"  : self.rejects,
+            }
+
+_retry_policy = RetryPolicy()
+_breaker = CircuitBreaker()
+
+def set_retry_policy(policy):
+    global _retry_policy
+    _retry_policy = policy
+
+def get_breaker():
+    return _breaker
+
+def get_breaker_state():
+    return _breaker.stats()["state"]
+
+def thrift_available():
+    # False while the server is known to be down, callers can skip their work instead of stalling
+    return _breaker.available()
+
+def thrift_try(func, attempts=None, pool=None, policy=None):
+    if pool is None :
+        pool = _pool
+    if policy is None :
+        policy = _retry_policy
+    if attempts is None :
+        attempts = policy.attempts
+
+    expiry = time.monotonic() + policy.budget
     for attempt in range(attempts):
+        if not _breaker.allow() :
+            raise CircuitOpenError("thrift server is unavailable, circuit is open")
         try:
-            with ThriftClient() as client:
-               return func(client.pltfm_mgr)
+            # wait for a pooled connection no longer than the budget left
+            with pool.connection(min(THRIFT_POOL_ACQUIRE_TIMEOUT, max(0, expiry - time.monotonic()))) as client:
+               client.set_timeout(policy.timeout)
+               result = func(client.pltfm_mgr)
+            _breaker.record_success()
+            return result
+        except PoolExhaustedError :
+            # the server was not reached, only a probe in flight is given back
+            _breaker.release_probe()
+            raise
         except TException as e:
-            if attempt + 1 == attempts:
+            _breaker.record_failure()
+            delay = policy.delay(attempt)
+            if attempt + 1 == attempts or time.monotonic() + delay >= expiry :
                raise e
-        time.sleep(1)
+        except Exception :
+            # a local error tells nothing about the server, only a probe in flight is given back
+            _breaker.release_probe()
+            raise
+        time.sleep(delay)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    # blocking rpcs of the asyncio api run here, one worker per pooled connection
+    global _executor
+    with _executor_lock :
+        if _executor is None :
+            _executor = ThreadPoolExecutor(max_workers = _pool.size, thread_name_prefix = "thrift")
+        return _executor
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), func, *args)
+
+async def thrift_try_async(func, attempts=None, pool=None, policy=None):
+    return await run_blocking(thrift_try, func, attempts, pool, policy)
+
+class AsyncThriftClient(object):
+    """asyncio client of periph_rpc, concurrent calls are in flight on separate pooled connections"""
+    def __init__(self, attempts=None, pool=None, policy=None):
+        self.attempts = attempts
+        self.pool = pool
+        self.policy = policy
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not hasattr(_get_periph_rpc().Iface, name) :
+            raise AttributeError(f"periph_rpc has no method {name}")
+
+        async def call(*args):
+            def inner(client):
+                return getattr(client, name)(*args)
+            return await thrift_try_async(inner, self.attempts, self.pool, self.policy)
+        return call
@@ -33,6 +33,7 @@ setup(
     tests_require = [
         'pytest',
         'pytest-cov',
+        'fakeredis[lua]',
     ],
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,90 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Round trips and latency of moving current alarms to history.
+# usage: python -m tests.bench_alarm_clear [--sock /var/run/redis/redis.sock] [--alarms 1000]
+# the alarms are written to two scratch dbs (14 and 15 by default) which are flushed first.
+
+import time
+import argparse
+import redis
+from otn_pmon.alarm import _CLEAR_ALARMS_SCRIPT, ALARM_EVENT_STREAM, ALARM_EVENT_MAXLEN
+
+CUR_PREFIX = "CURALARM|"
+HIS_PREFIX = "HISALARM|"
+INDEX_PREFIX = "HISALARM_INDEX|"
+EXPIRE = 7 * 24 * 60 * 60
+
+def raise_alarms(r, n) :
+    p = r.pipeline(transaction = False)
+    for i in range(n) :
+        id = f"FAN-1-{i}#FAN_FAIL"
+        p.hset(CUR_PREFIX + id, mapping = {"time-created" : time.time_ns(), "id" : id,
+               "resource" : f"FAN-1-{i}", "type-id" : "FAN_FAIL", "severity" : "CRITICAL"})
+    p.execute()
+    return [f"FAN-1-{i}#FAN_FAIL" for i in range(n)]
+
+def clear_legacy(state, history, ids) :
+    # what _moveCurAlarmToHisAlarm did before: get, delete, set, expire
+    for id in ids :
+        info = state.hgetall(CUR_PREFIX + id)
+        state.delete(CUR_PREFIX + id)
+        info["time-cleared"] = time.time_ns()
+        his_key = f"{HIS_PREFIX}{id}_{info['time-created']}"
+        history.hset(his_key, mapping = info)
+        history.expire(his_key, EXPIRE)
+    return 4 * len(ids)
+
+def clear_script(script, args, ids, batch) :
+    rtts = 0
+    for i in range(0, len(ids), batch) :
+        now = time.time_ns()
+        script(keys = [CUR_PREFIX + id for id in ids[i:i + batch]],
+               args = args + [now, ALARM_EVENT_STREAM, ALARM_EVENT_MAXLEN, INDEX_PREFIX, now // 1000000, 0, 256])
+        rtts += 1
+    return rtts
+
+def main() :
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sock", default = "/var/run/redis/redis.sock")
+    parser.add_argument("--state-db", type = int, default = 14)
+    parser.add_argument("--history-db", type = int, default = 15)
+    parser.add_argument("--alarms", type = int, default = 1000)
+    args = parser.parse_args()
+
+    state = redis.Redis(unix_socket_path = args.sock, db = args.state_db, decode_responses = True)
+    history = redis.Redis(unix_socket_path = args.sock, db = args.history_db, decode_responses = True)
+    script = state.register_script(_CLEAR_ALARMS_SCRIPT)
+    script_args = [args.state_db, args.history_db, CUR_PREFIX, HIS_PREFIX]
+
+    print(f"{'clear path':<20}{'alarms':>8}{'round trips':>14}{'us/alarm':>10}")
+    for name, clear in (("legacy", lambda ids : clear_legacy(state, history, ids)),
+                        ("script", lambda ids : clear_script(script, script_args, ids, 1)),
+                        ("script batch 16", lambda ids : clear_script(script, script_args, ids, 16))) :
+        state.flushdb()
+        history.flushdb()
+        ids = raise_alarms(state, args.alarms)
+        start = time.perf_counter()
+        rtts = clear(ids)
+        elapsed = time.perf_counter() - start
+        state.delete(ALARM_EVENT_STREAM)
+        assert state.dbsize() == 0 and len(history.keys(HIS_PREFIX + "*")) == args.alarms
+        print(f"{name:<20}{args.alarms:>8}{rtts:>14}{elapsed / args.alarms * 1e6:>10.1f}")
+
+    state.flushdb()
+    history.flushdb()
+
+if __name__ == "__main__" :
+    main()
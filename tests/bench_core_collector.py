@@ -0,0 +1,96 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Cost of one per core cpu pm cycle on 4/16/64 core hosts.
+# usage: python -m tests.bench_core_collector [cycles]
+# the cpu times are generated so any core count can be run on this host. The psutil baseline samples
+# the cores of this host, reused round robin beyond its core count, it is skipped without psutil.
+
+import sys
+import time
+import random
+import otn_pmon.pm as pm
+from otn_pmon.cu import CoreCollector
+
+try :
+    import psutil
+except ImportError :
+    psutil = None
+
+METRICS = ("Total", "User", "Kernel", "Nice", "Idle", "Wait")
+
+def gen_times(cores, last = None) :
+    times = []
+    for i in range(cores) :
+        base = last[i] if last else [0] * len(CoreCollector.FIELDS)
+        times.append(tuple(v + random.uniform(0, 1) for v in base))
+    return times
+
+def baseline_cycle(cores) :
+    # what CoreCollector did before: a psutil sample, then one update written per pm
+    times_percent = psutil.cpu_times_percent(percpu = True)
+    for i in range(cores) :
+        cpu = times_percent[i % len(times_percent)]
+        total = cpu.user + cpu.nice + cpu.system + cpu.iowait + cpu.irq + \
+                cpu.softirq + cpu.steal + cpu.guest + cpu.guest_nice
+        for name, val in zip(METRICS, (total, cpu.user, cpu.system, cpu.nice, cpu.idle, cpu.iowait)) :
+            for type in (pm.Pm.PM_TYPE_15, pm.Pm.PM_TYPE_24) :
+                pm.get_pm("CPU", f"CPU-{i}", name, type).update(int(val))
+
+def per_pm_cycle(collector, last, cur) :
+    # the generated times, with per core, per metric lookups and one engine update for each pm pair
+    for i in range(collector.count) :
+        p = CoreCollector.percents(last[i], cur[i])
+        total = sum(p) - p[3]
+        for name, val in zip(METRICS, (total, p[0], p[2], p[1], p[3], p[4])) :
+            pms = pm.get_pms("CPU", f"CPU-{i}", name)
+            pm.update_pms(pms, [int(val)] * len(pms))
+
+def main() :
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    random.seed(1)
+
+    print(f"{'cores':>6}{'psutil ms':>12}{'per-pm ms':>12}{'batched ms':>12}{'db writes':>12}")
+    for cores in (4, 16, 64) :
+        collector = CoreCollector()
+        collector.count = cores
+        samples = [gen_times(cores)]
+        for _ in range(cycles) :
+            samples.append(gen_times(cores, samples[-1]))
+
+        baseline = "-"
+        if psutil :
+            psutil.cpu_times_percent(percpu = True)
+            start = time.perf_counter()
+            for _ in range(cycles) :
+                baseline_cycle(cores)
+            baseline = f"{(time.perf_counter() - start) / cycles * 1000:.2f}"
+
+        start = time.perf_counter()
+        for last, cur in zip(samples, samples[1:]) :
+            per_pm_cycle(collector, last, cur)
+        per_pm = (time.perf_counter() - start) / cycles
+
+        collector.execute(samples[0])
+        writes = pm.get_pm_stats()["engine"]["writes"]
+        start = time.perf_counter()
+        for cur in samples[1:] :
+            collector.execute(cur)
+        batched = (time.perf_counter() - start) / cycles
+        writes = (pm.get_pm_stats()["engine"]["writes"] - writes) / cycles
+        print(f"{cores:>6}{baseline:>12}{per_pm * 1000:>12.2f}{batched * 1000:>12.2f}{writes:>12.0f}")
+
+if __name__ == "__main__" :
+    main()
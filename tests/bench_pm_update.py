@@ -0,0 +1,66 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Per-sample cost of the pm accumulators, with and without the percentile/stddev estimators.
+# usage: BENCH_PM_SAMPLES=100000 python -m pytest -q -s tests/bench_pm_update.py
+# the pms live in a fresh engine on fakeredis dbs (the pm_engine fixture), the flush is deferred
+# past the run so only the in-memory update is timed.
+
+import os
+import time
+import random
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+import otn_pmon.pm as pm
+
+def run(name, statistics, samples, values) :
+    pm.PM_STATISTICS = statistics
+    p = pm.get_pm("PSU", "PSU-1-1", name, pm.Pm.PM_TYPE_15)
+    start = time.perf_counter()
+    for v in values[:samples] :
+        p.update(v)
+    return (time.perf_counter() - start) / samples * 1e6
+
+def run_batch(name, statistics, samples, values, width = 24) :
+    # one update_pms call per cycle of width pms, like the per-core cpu pms
+    pm.PM_STATISTICS = statistics
+    pms = [pm.get_pm("CPU", f"CPU-{i}", name, pm.Pm.PM_TYPE_15) for i in range(width)]
+    cycles = samples // width
+    start = time.perf_counter()
+    for c in range(cycles) :
+        pm.update_pms(pms, values[c * width:(c + 1) * width])
+    return (time.perf_counter() - start) / (cycles * width) * 1e6
+
+def test_pm_update_cost(pm_engine, monkeypatch) :
+    samples = int(os.environ.get("BENCH_PM_SAMPLES", 100000))
+    random.seed(1)
+    values = [random.gauss(40, 5) for _ in range(samples)]
+    monkeypatch.setattr(pm, "PM_STATISTICS", pm.PM_STATISTICS)
+    monkeypatch.setattr(pm, "PM_FLUSH_INTERVAL", 24 * 60 * 60)
+    pm_engine.last_flush = time.monotonic()
+
+    print(f"\n{'update':<24}{'us/sample':>12}")
+    base = run("Base", False, samples, values)
+    print(f"{'min/max/avg':<24}{base:>12.2f}")
+    stats = run("Stats", True, samples, values)
+    print(f"{'+ p50/p95/p99/stddev':<24}{stats:>12.2f}  x{stats / base:.2f}")
+    base = run_batch("Base", False, samples, values)
+    print(f"{'batch min/max/avg':<24}{base:>12.2f}")
+    stats = run_batch("Stats", True, samples, values)
+    print(f"{'batch + statistics':<24}{stats:>12.2f}  x{stats / base:.2f}")
+    print(f"engine {pm.get_pm_stats()['engine']}")
@@ -0,0 +1,80 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Rpc cost of one chassis telemetry sweep against the periph_rpc stand-in.
+# usage: python -m tests.bench_poll_cycle [cycles] [latency_s]
+
+import sys
+import time
+import asyncio
+import otn_pmon.thrift_client as thrift_client
+from otn_pmon.thrift_client import thrift_try, AsyncThriftClient
+from otn_pmon.thrift_api.ttypes import periph_type
+from tests.mock_periph_server import default_chassis, start_server
+
+PORT = 19092
+
+def sweep_per_item(slots) :
+    for type, id in slots :
+        thrift_try(lambda c : c.periph_presence(type, id))
+        thrift_try(lambda c : c.get_periph_temperature(type, id))
+        if type == periph_type.FAN :
+            thrift_try(lambda c : c.get_fan_speed(id))
+            thrift_try(lambda c : c.get_fan_speed_spec(id))
+        elif type == periph_type.PSU :
+            thrift_try(lambda c : c.get_inventory(type, id))
+            thrift_try(lambda c : c.get_psu_info(id))
+            thrift_try(lambda c : c.psu_vin_high(id))
+            thrift_try(lambda c : c.psu_vin_low(id))
+
+def sweep_snapshot(slots) :
+    for type, id in slots :
+        thrift_try(lambda c : c.get_periph_snapshot(type, id))
+
+def sweep_all_snapshots(slots) :
+    thrift_try(lambda c : c.get_all_periph_snapshots())
+
+def sweep_async(slots) :
+    async def sweep() :
+        client = AsyncThriftClient()
+        await asyncio.gather(*[client.get_periph_snapshot(type, id) for type, id in slots])
+    asyncio.run(sweep())
+
+def main() :
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+
+    desc = default_chassis()
+    desc["latency"] = {"*" : latency}
+    handler, injector = start_server(desc, PORT)
+    thrift_client.THRIFT_SERVER_PORT = PORT
+    time.sleep(0.5)
+
+    slots = sorted(handler.slots)
+    print(f"{len(slots)} slots, {latency * 1000:.1f} ms server latency per rpc")
+    print(f"{'sweep':<16}{'rpcs':>8}{'ms/cycle':>12}")
+    for name, sweep in (("per-item", sweep_per_item), ("snapshot", sweep_snapshot),
+                        ("all-snapshots", sweep_all_snapshots), ("async", sweep_async)) :
+        calls = sum(injector.calls.values())
+        start = time.perf_counter()
+        for _ in range(cycles) :
+            sweep(slots)
+        elapsed = (time.perf_counter() - start) / cycles
+        rpcs = (sum(injector.calls.values()) - calls) / cycles
+        print(f"{name:<16}{rpcs:>8.0f}{elapsed * 1000:>12.2f}")
+    print(f"pool {thrift_client.get_pool_stats()}")
+
+if __name__ == "__main__" :
+    main()
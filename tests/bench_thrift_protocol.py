@@ -0,0 +1,73 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Serialization cost of the larger periph_rpc structs for each thrift protocol.
+# usage: python -m tests.bench_thrift_protocol [iterations]
+
+import sys
+import time
+from thrift.transport import TTransport
+from otn_pmon.thrift_client import get_protocol_factory, _protocol_factories
+from otn_pmon.thrift_api.ttypes import ret_psu_info, psu_info, ret_inventory, inventory
+
+def sample_structs() :
+    psu = ret_psu_info(ret = 0, info = psu_info(abs = 1, ambient_temp = 3125, primary_temp = 4250,
+                       secondary_temp = 3980, vout = 12050, vin = 220300, iout = 25400, iin = 1520,
+                       pout = 306000, pin = 334000, fan = 9800, capacity = 800))
+    inv = ret_inventory(ret = 0, inv = inventory(type = "E110C", model_name = "OTN-CHASSIS",
+                        pn = "OTN1100-PSU-800", sn = "AL21090012345", label = "PSU-1-11",
+                        hw_ver = "1.2", sw_ver = "3.4.5", mfg_date = "2021-09-01",
+                        mac_addr = "00:11:22:33:44:55"))
+    return [("ret_psu_info", psu), ("ret_inventory", inv)]
+
+def bench(protocol, obj, iterations) :
+    factory = get_protocol_factory(protocol)
+
+    wbuf = TTransport.TMemoryBuffer()
+    obj.write(factory.getProtocol(wbuf))
+    data = wbuf.getvalue()
+
+    start = time.perf_counter()
+    for _ in range(iterations) :
+        wbuf = TTransport.TMemoryBuffer()
+        obj.write(factory.getProtocol(wbuf))
+        wbuf.getvalue()
+    encode = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations) :
+        out = type(obj)()
+        out.read(factory.getProtocol(TTransport.TMemoryBuffer(data)))
+    decode = (time.perf_counter() - start) / iterations
+
+    assert out == obj
+    return len(data), encode, decode
+
+def main() :
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    try :
+        from thrift.protocol import fastbinary
+        print("fastbinary: available")
+    except ImportError :
+        print("fastbinary: missing, accelerated protocols fall back to pure python")
+
+    print(f"{'struct':<16}{'protocol':<22}{'bytes':>6}{'encode us':>12}{'decode us':>12}")
+    for name, obj in sample_structs() :
+        for protocol in _protocol_factories :
+            size, encode, decode = bench(protocol, obj, iterations)
+            print(f"{name:<16}{protocol:<22}{size:>6}{encode * 1e6:>12.2f}{decode * 1e6:>12.2f}")
+
+if __name__ == "__main__" :
+    main()
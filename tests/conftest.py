@@ -0,0 +1,174 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Fixtures to run otn_pmon off-box. otn_pmon still needs swsscommon, sonic_py_common and the generated
+# thrift_api to import, the tests skip without them.
+
+import time
+import types
+import socket
+import pytest
+
+def _free_port() :
+    with socket.socket() as s :
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def periph_server(monkeypatch) :
+    """returns start(desc = None, seed = 0), which serves tests.mock_periph_server on a free port and
+    points a fresh pool, breaker and fast retry policy of otn_pmon.thrift_client to it. desc is laid
+    over the default chassis, so it may hold the latency or error_rate sections only
+    """
+    thrift_client = pytest.importorskip("otn_pmon.thrift_client")
+    pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+    from tests.mock_periph_server import start_server, default_chassis
+
+    def start(desc = None, seed = 0) :
+        port = _free_port()
+        monkeypatch.setattr(thrift_client, "THRIFT_SERVER_PORT", port)
+        monkeypatch.setattr(thrift_client, "_pool", thrift_client.ThriftClientPool())
+        monkeypatch.setattr(thrift_client, "_breaker", thrift_client.CircuitBreaker())
+        monkeypatch.setattr(thrift_client, "_retry_policy",
+                            thrift_client.RetryPolicy(attempts = 3, timeout = 2, backoff = 0.01, backoff_max = 0.05,
+                                                      budget = 5))
+        handler, injector = start_server(dict(default_chassis(), **(desc or {})), port, seed)
+        deadline = time.monotonic() + 5
+        while True :
+            try :
+                socket.create_connection(("localhost", port), 0.1).close()
+                break
+            except OSError :
+                if time.monotonic() > deadline :
+                    raise
+                time.sleep(0.01)
+        return handler, injector
+
+    return start
+
+class FakeDBConnector(object):
+    """swsscommon.DBConnector on a fakeredis server per redis socket"""
+    def __init__(self, servers, db_index, redis_sock, timeout) :
+        import fakeredis
+        server = servers.setdefault(redis_sock, fakeredis.FakeServer())
+        self.r = fakeredis.FakeRedis(server = server, db = db_index, decode_responses = True)
+
+    def keys(self, pattern) :
+        return self.r.keys(pattern)
+
+class FakeRedisPipeline(object):
+    """swsscommon.RedisPipeline, the buffered commands are sent on flush"""
+    def __init__(self, db, size) :
+        self.r = db.r
+        self.pipe = db.r.pipeline(transaction = False)
+        self.flushes = 0
+
+    def flush(self) :
+        self.pipe.execute()
+        self.flushes += 1
+
+class FakeTable(object):
+    """swsscommon.Table, writes go to the pipeline when built on one"""
+    def __init__(self, db, tname, buffered = False) :
+        self.r = db.r
+        self.w = db.pipe if isinstance(db, FakeRedisPipeline) else db.r
+        self.tname = tname
+
+    def getKeyName(self, kname) :
+        return f"{self.tname}|{kname}"
+
+    def get(self, kname) :
+        fvs = self.r.hgetall(self.getKeyName(kname))
+        return bool(fvs), tuple(fvs.items())
+
+    def hget(self, kname, fname) :
+        value = self.r.hget(self.getKeyName(kname), fname)
+        return value is not None, value
+
+    def getKeys(self) :
+        prefix = self.getKeyName("")
+        return [k[len(prefix):] for k in self.r.keys(prefix + "*")]
+
+    def set(self, kname, fvs) :
+        self.w.hset(self.getKeyName(kname), mapping = dict(fvs))
+
+    def delete(self, kname) :
+        self.w.delete(self.getKeyName(kname))
+
+    def expire(self, kname, seconds) :
+        self.w.expire(self.getKeyName(kname), seconds)
+
+class FakePubSub(object):
+    """swsscommon.PubSub, messages are returned as dicts of strings"""
+    def __init__(self, db) :
+        self.p = db.r.pubsub()
+
+    def psubscribe(self, pattern) :
+        self.p.psubscribe(pattern)
+
+    def get_message(self, timeout = 0) :
+        msg = self.p.get_message(ignore_subscribe_messages = True, timeout = timeout)
+        if not msg :
+            return {}
+        return {k : str(v) for k, v in msg.items()}
+
+@pytest.fixture
+def swss_dbs(monkeypatch) :
+    """points the swsscommon classes and the redis-py client used by otn_pmon.db to fakeredis,
+    one fake redis server per socket; returns the db module
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    db = pytest.importorskip("otn_pmon.db")
+    servers = {}
+
+    swss = types.SimpleNamespace(
+        DBConnector = lambda db_index, redis_sock, timeout : FakeDBConnector(servers, db_index, redis_sock, timeout),
+        RedisPipeline = FakeRedisPipeline,
+        Table = FakeTable,
+        FieldValuePairs = list,
+        PubSub = FakePubSub)
+
+    def redis_client(unix_socket_path, db, decode_responses = False) :
+        server = servers.setdefault(unix_socket_path, fakeredis.FakeServer())
+        return fakeredis.FakeRedis(server = server, db = db, decode_responses = decode_responses)
+
+    monkeypatch.setattr(db, "swsscommon", swss)
+    monkeypatch.setattr(db, "redis", types.SimpleNamespace(Redis = redis_client))
+    monkeypatch.setattr(db, "_connectors", {})
+    monkeypatch.setattr(db, "_batch_stats", db.BatchStats())
+    return db
+
+@pytest.fixture
+def alarm_dbs(swss_dbs, monkeypatch) :
+    """otn_pmon.alarm on swss_dbs with a fresh debounce and fresh current alarm indexes; returns the alarm module"""
+    alarm = pytest.importorskip("otn_pmon.alarm")
+    pytest.importorskip("lupa") # lua scripts on fakeredis
+    indexes = {}
+    monkeypatch.setattr(alarm, "_debounce", alarm.Debounce())
+    monkeypatch.setattr(alarm, "_cur_alarm_indexes", indexes)
+    monkeypatch.setattr(alarm, "_last_trim", {})
+    yield alarm
+    for index in indexes.values() :
+        index.watcher.stop.set()
+
+@pytest.fixture
+def pm_engine(swss_dbs, monkeypatch) :
+    """a fresh pm engine, registry and key index of otn_pmon.pm on swss_dbs; returns the engine"""
+    pm = pytest.importorskip("otn_pmon.pm")
+    engine = pm.PmEngine()
+    monkeypatch.setattr(pm, "_engine", engine)
+    monkeypatch.setattr(pm, "_registry", pm.PmRegistry(engine))
+    monkeypatch.setattr(pm, "_key_index", pm.PmKeyIndex())
+    return engine
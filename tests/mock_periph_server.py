@@ -0,0 +1,313 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+# Stand-in of the devmgr periph_rpc server, driven by a chassis description.
+#
+# usage: python -m tests.mock_periph_server [--chassis chassis.json] [--port 9092]
+#            [--protocol binary] [--transport buffered] [--dev-spec dev_spec.json]
+#
+# chassis description, every section is optional:
+# {
+#     "linecard"   : {"1" : {"type" : "E110C", "temperature" : 42.5}, "2" : {"presence" : false}},
+#     "psu"        : {"5" : {"capacity" : 800, "vin" : 220000, "vin_high" : false}},
+#     "fan"        : {"7" : {"speed" : [9000, 8800], "spec" : [12000, 3000]}},
+#     "latency"    : {"*" : 0.001, "get_psu_info" : 0.005},  # unit s, per method
+#     "error_rate" : {"*" : 0.0, "get_fan_speed" : 0.01},   # ratio of calls failing
+#     "events"     : [{"at" : 30, "type" : "FAN", "id" : 7, "presence" : false}]  # hot-plug, unit s
+# }
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from thrift.Thrift import TApplicationException
+import otn_pmon.thrift_client as thrift_client
+from otn_pmon.thrift_api.ttypes import *
+
+DEFAULT_LINECARD_NUM = 4
+DEFAULT_PSU_NUM = 2
+DEFAULT_FAN_NUM = 5
+DEFAULT_PSU_PN = "PSU-800W-AC"
+DEFAULT_CHASSIS_PN = "OTN1100-CHASSIS"
+
+def default_chassis(linecards = DEFAULT_LINECARD_NUM, psus = DEFAULT_PSU_NUM, fans = DEFAULT_FAN_NUM) :
+    # slot ids follow otn_pmon.public.get_first_slot_id: linecards, then psus, then fans
+    desc = {"linecard" : {}, "psu" : {}, "fan" : {}}
+    for i in range(1, linecards + 1) :
+        desc["linecard"][str(i)] = {"type" : "E110C"}
+    for i in range(linecards + 1, linecards + psus + 1) :
+        desc["psu"][str(i)] = {}
+    for i in range(linecards + psus + 1, linecards + psus + fans + 1) :
+        desc["fan"][str(i)] = {}
+    return desc
+
+def dev_spec(desc) :
+    # dev_spec.json matching the description, see otn_pmon.periph.get_dev_spec
+    return {
+        "number" : {
+            "CHASSIS"  : 1,
+            "CU"       : 1,
+            "LINECARD" : len(desc.get("linecard", {})),
+            "PSU"      : len(desc.get("psu", {})),
+            "FAN"      : len(desc.get("fan", {})),
+        },
+        "expected-pn" : {
+            "CHASSIS" : DEFAULT_CHASSIS_PN,
+            "PSU"     : [DEFAULT_PSU_PN],
+        },
+    }
+
+class Slot(object):
+    def __init__(self, type, id, conf) :
+        self.type = type
+        self.id = id
+        self.presence = conf.get("presence", True)
+        self.temperature = conf.get("temperature", 35.0)
+        type_name = periph_type._VALUES_TO_NAMES[type]
+        self.inv = inventory(
+            type = conf.get("type", type_name),
+            model_name = conf.get("model_name", type_name),
+            pn = conf.get("pn", DEFAULT_PSU_PN if type == periph_type.PSU else f"{type_name}-PN"),
+            sn = conf.get("sn", f"SN{type}{id:04d}"),
+            label = f"{type_name}-{id}",
+            hw_ver = conf.get("hw_ver", "1.0"),
+            sw_ver = conf.get("sw_ver", "1.0.0"),
+            mfg_date = conf.get("mfg_date", "2021-01-01"),
+            mac_addr = conf.get("mac_addr", "00:00:00:00:00:00"))
+        if type == periph_type.CHASSIS :
+            self.inv.pn = conf.get("pn", DEFAULT_CHASSIS_PN)
+        # psu
+        self.psu = psu_info(abs = 1,
+            ambient_temp = conf.get("ambient_temp", 3000), primary_temp = conf.get("primary_temp", 4000),
+            secondary_temp = conf.get("secondary_temp", 3800), vout = conf.get("vout", 12000),
+            vin = conf.get("vin", 220000), iout = conf.get("iout", 20000), iin = conf.get("iin", 1200),
+            pout = conf.get("pout", 240000), pin = conf.get("pin", 264000), fan = conf.get("fan", 8000),
+            capacity = conf.get("capacity", 800))
+        self.vin_high = conf.get("vin_high", False)
+        self.vin_low = conf.get("vin_low", False)
+        # fan
+        front, behind = conf.get("speed", [9000, 8800])
+        self.speed = fan_speed(front = front, behind = behind)
+        spec_max, spec_min = conf.get("spec", [12000, 3000])
+        self.spec = fan_speed_spec(max = spec_max, min = spec_min)
+
+class MockPeriphHandler(object):
+    """periph_rpc service implementation backed by the chassis description"""
+    def __init__(self, desc = None) :
+        desc = desc or default_chassis()
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.slots[(periph_type.CHASSIS, 1)] = Slot(periph_type.CHASSIS, 1, desc.get("chassis", {}))
+        self.slots[(periph_type.CU, 1)] = Slot(periph_type.CU, 1, desc.get("cu", {}))
+        for section, type in (("linecard", periph_type.LINECARD), ("psu", periph_type.PSU), ("fan", periph_type.FAN)) :
+            for id, conf in desc.get(section, {}).items() :
+                self.slots[(type, int(id))] = Slot(type, int(id), conf)
+        self.reboot_type = reboot_type.COLD
+
+    def __slot(self, type, id) :
+        slot = self.slots.get((type, id))
+        if slot and slot.presence :
+            return slot
+        return None
+
+    def plug(self, type, id, presence = True) :
+        with self.lock :
+            slot = self.slots.get((type, id))
+            if slot :
+                slot.presence = presence
+
+    # common APIs
+    def get_system_version(self) :
+        return system_version(fpga = "1:v1.0", pcb = "A", bom = "1", devmgr = "mock", ucd90120 = "1.0")
+
+    def periph_presence(self, type, id) :
+        return self.__slot(type, id) is not None
+
+    def get_periph_version(self, type, id) :
+        slot = self.__slot(type, id)
+        return slot.inv.sw_ver if slot else ""
+
+    def get_periph_temperature(self, type, id) :
+        slot = self.__slot(type, id)
+        if not slot :
+            return ret_temp(ret = error_code.ERROR, temperature = 0)
+        return ret_temp(ret = error_code.OK, temperature = int(slot.temperature * 100))
+
+    def get_inventory(self, type, id) :
+        slot = self.__slot(type, id)
+        if not slot :
+            return ret_inventory(ret = error_code.ERROR, inv = inventory())
+        return ret_inventory(ret = error_code.OK, inv = slot.inv)
+
+    def get_psu_info(self, id) :
+        slot = self.__slot(periph_type.PSU, id)
+        if not slot :
+            return ret_psu_info(ret = error_code.ERROR, info = psu_info())
+        return ret_psu_info(ret = error_code.OK, info = slot.psu)
+
+    def psu_vin_high(self, id) :
+        slot = self.__slot(periph_type.PSU, id)
+        return bool(slot and slot.vin_high)
+
+    def psu_vin_low(self, id) :
+        slot = self.__slot(periph_type.PSU, id)
+        return bool(slot and slot.vin_low)
+
+    def set_led_state(self, type, id, state) :
+        return error_code.OK
+
+    def set_led_color(self, type, id, color) :
+        return error_code.OK
+
+    def get_reboot_type(self) :
+        return self.reboot_type
+
+    def periph_reboot(self, ptype, id, rtype) :
+        return error_code.OK if self.__slot(ptype, id) else error_code.ERROR
+
+    def get_power_control_version(self, slot_id) :
+        return "1.0"
+
+    def set_power_control(self, slot_id, type) :
+        return error_code.OK
+
+    def recover_linecard_default_config(self, id, type) :
+        return error_code.OK
+
+    def switch_slot_uart(self, id) :
+        return error_code.OK
+
+    def get_fan_speed(self, id) :
+        slot = self.__slot(periph_type.FAN, id)
+        if not slot :
+            return ret_fan_speed(ret = error_code.ERROR, speed = fan_speed(front = 0, behind = 0))
+        return ret_fan_speed(ret = error_code.OK, speed = slot.speed)
+
+    def get_fan_speed_spec(self, id) :
+        slot = self.slots.get((periph_type.FAN, id))
+        return slot.spec if slot else fan_speed_spec(max = 0, min = 0)
+
+    def set_fan_speed_rate(self, id, speed_rate) :
+        slot = self.__slot(periph_type.FAN, id)
+        if not slot :
+            return error_code.ERROR
+        speed = int(slot.spec.max * speed_rate / 100)
+        with self.lock :
+            slot.speed = fan_speed(front = speed, behind = speed)
+        return error_code.OK
+
+    def get_fpga_version(self, id) :
+        return "v1.0"
+
+    def get_periph_snapshot(self, type, id) :
+        snapshot = periph_snapshot(ret = error_code.OK, type = type, id = id,
+                                   presence = self.periph_presence(type, id),
+                                   temperature = self.get_periph_temperature(type, id))
+        if type == periph_type.FAN :
+            snapshot.speed = self.get_fan_speed(id)
+            snapshot.speed_spec = self.get_fan_speed_spec(id)
+        elif type == periph_type.PSU :
+            snapshot.psu_info = self.get_psu_info(id)
+            snapshot.vin_high = self.psu_vin_high(id)
+            snapshot.vin_low = self.psu_vin_low(id)
+        return snapshot
+
+    def get_all_periph_snapshots(self) :
+        return [self.get_periph_snapshot(type, id) for type, id in sorted(self.slots)]
+
+class FaultInjector(object):
+    """wraps a handler, delays and fails its methods as configured in the description"""
+    def __init__(self, handler, latency = None, error_rate = None, seed = None) :
+        self.handler = handler
+        self.latency = latency or {}
+        self.error_rate = error_rate or {}
+        self.random = random.Random(seed)
+        # the threaded server calls in from one thread per connection
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+
+    def __getattr__(self, name) :
+        method = getattr(self.handler, name)
+        latency = self.latency.get(name, self.latency.get("*", 0))
+        error_rate = self.error_rate.get(name, self.error_rate.get("*", 0))
+
+        def call(*args) :
+            with self.lock :
+                self.calls[name] = self.calls.get(name, 0) + 1
+                failed = error_rate and self.random.random() < error_rate
+                if failed :
+                    self.errors[name] = self.errors.get(name, 0) + 1
+            if latency :
+                time.sleep(latency)
+            if failed :
+                raise TApplicationException(TApplicationException.INTERNAL_ERROR, f"injected {name} failure")
+            return method(*args)
+        return call
+
+def schedule_events(handler, events) :
+    # hot-plug events, "at" is the delay in seconds since the server started
+    timers = []
+    for e in events :
+        type = periph_type._NAMES_TO_VALUES[e["type"]]
+        t = threading.Timer(e["at"], handler.plug, (type, e["id"], e.get("presence", True)))
+        t.daemon = True
+        t.start()
+        timers.append(t)
+    return timers
+
+def start_server(desc = None, port = thrift_client.THRIFT_SERVER_PORT, seed = None) :
+    # serve in a background thread, returns the handler to drive hot-plug and read call counters
+    desc = desc or default_chassis()
+    handler = MockPeriphHandler(desc)
+    injector = FaultInjector(handler, desc.get("latency"), desc.get("error_rate"), seed)
+    server = thrift_client.create_server(injector, port)
+    thread = threading.Thread(target = server.serve, daemon = True)
+    thread.start()
+    schedule_events(handler, desc.get("events", []))
+    return handler, injector
+
+def main() :
+    parser = argparse.ArgumentParser(description = "periph_rpc stand-in server")
+    parser.add_argument("--chassis", help = "chassis description json file")
+    parser.add_argument("--port", type = int, default = thrift_client.THRIFT_SERVER_PORT)
+    parser.add_argument("--protocol", default = thrift_client.THRIFT_PROTOCOL)
+    parser.add_argument("--transport", default = thrift_client.THRIFT_TRANSPORT)
+    parser.add_argument("--seed", type = int, help = "seed of the injected errors")
+    parser.add_argument("--dev-spec", help = "write the matching dev_spec.json to this path")
+    args = parser.parse_args()
+
+    desc = default_chassis()
+    if args.chassis :
+        with open(args.chassis, 'r', encoding='utf8') as fp :
+            desc = json.load(fp)
+    if args.dev_spec :
+        with open(args.dev_spec, 'w', encoding='utf8') as fp :
+            json.dump(dev_spec(desc), fp, indent = 4)
+
+    thrift_client.set_thrift_codec(args.protocol, args.transport)
+    handler, injector = start_server(desc, args.port, args.seed)
+    print(f"periph_rpc stand-in listening on port {args.port} ({args.protocol}/{args.transport})")
+    try :
+        while True :
+            time.sleep(60)
+            print(f"calls {injector.calls} errors {injector.errors}")
+    except KeyboardInterrupt :
+        return 0
+
+if __name__ == "__main__" :
+    sys.exit(main())
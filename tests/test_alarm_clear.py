@@ -0,0 +1,60 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("lupa") # lua scripts on fakeredis
+
+import otn_pmon.alarm as alarm
+
+def raise_alarm(state, id, severity = "CRITICAL") :
+    resource, type_id = id.split("#")
+    state.set("CURALARM", id, [("id", id), ("resource", resource), ("type-id", type_id),
+              ("severity", severity), ("time-created", str(time.time_ns()))])
+
+@pytest.fixture
+def dbs(swss_dbs) :
+    db = swss_dbs
+    return db.get_dbs("CHASSIS-1", [db.STATE_DB, db.HISTORY_DB])
+
+@pytest.mark.parametrize("resource", ["CHASSIS-1", "CU-1", "FAN-1-7", "PSU-1-5", "LINECARD-1-1", "LINECARD-1-4"])
+def test_state_and_history_dbs_share_an_instance(swss_dbs, resource) :
+    # the clear script relies on it to SELECT the history db
+    db = swss_dbs
+    dbs = db.get_dbs(resource, [db.STATE_DB, db.HISTORY_DB])
+    assert dbs[db.STATE_DB].connector.redis_sock == dbs[db.HISTORY_DB].connector.redis_sock
+
+def test_clear_moves_alarm_to_history(swss_dbs, dbs) :
+    state, history = dbs[swss_dbs.STATE_DB], dbs[swss_dbs.HISTORY_DB]
+    raise_alarm(state, "FAN-1-1#FAN_FAIL")
+    raise_alarm(state, "FAN-1-2#FAN_FAIL")
+
+    cleared = alarm._run_clear_script(dbs, ["FAN-1-1#FAN_FAIL", "PSU-1-1#PSU_MISMATCH"])
+
+    assert cleared == ["FAN-1-1#FAN_FAIL"]
+    assert not state.exists("CURALARM", "FAN-1-1#FAN_FAIL")
+    assert state.exists("CURALARM", "FAN-1-2#FAN_FAIL")
+    his_keys = history.get_keys("HISALARM")
+    assert len(his_keys) == 1 and his_keys[0].startswith("FAN-1-1#FAN_FAIL_")
+    _, fvs = history.get_entry("HISALARM", his_keys[0])
+    info = dict(fvs)
+    assert info["severity"] == "CRITICAL" and int(info["time-cleared"]) > 0
+
+    events = state.connector.redis().xrange(alarm.ALARM_EVENT_STREAM)
+    assert [e["event"] for _, e in events] == ["clear"]
+    assert events[0][1]["id"] == "FAN-1-1#FAN_FAIL"
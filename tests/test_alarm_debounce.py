@@ -0,0 +1,157 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import types
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+from otn_pmon.common import slot_status
+
+class Clock(object) :
+    def __init__(self) :
+        self.now = 1000.0
+
+    def __call__(self) :
+        return self.now
+
+@pytest.fixture
+def clock(alarm_dbs, monkeypatch) :
+    c = Clock()
+    monkeypatch.setattr(alarm_dbs, "time", types.SimpleNamespace(monotonic = c, time = time.time))
+    return c
+
+@pytest.fixture
+def debounce(alarm_dbs, clock) :
+    return alarm_dbs.Debounce()
+
+def allow_at(debounce, clock, id, raising, active, times) :
+    # whether the transition is allowed at each of the times, unit s since the clock start
+    start = clock.now
+    allowed = []
+    for t in times :
+        clock.now = start + t
+        allowed.append(debounce.allow(id, raising, active))
+    return allowed
+
+def test_raise_within_its_delay_is_suppressed(debounce, clock) :
+    # FAN_HIGH is raised after holding 5s
+    assert allow_at(debounce, clock, "FAN-1-7#FAN_HIGH", True, False, [0, 2, 4, 5]) == [False, False, False, True]
+    assert debounce.stats() == {"pending" : 0, "suppressed" : 0}
+
+def test_clear_within_its_delay_is_suppressed(debounce, clock) :
+    # FAN_HIGH is cleared after holding 10s
+    assert allow_at(debounce, clock, "FAN-1-7#FAN_HIGH", False, True, [0, 5, 9, 10]) == [False, False, False, True]
+
+def test_flapping_condition_cancels_the_transition(debounce, clock) :
+    id = "FAN-1-7#FAN_HIGH"
+    assert allow_at(debounce, clock, id, True, False, [0, 4]) == [False, False]
+    # the condition went away, the raise starts over when it is back
+    assert not debounce.allow(id, False, False)
+    assert debounce.stats() == {"pending" : 0, "suppressed" : 1}
+    assert allow_at(debounce, clock, id, True, False, [0, 4, 5]) == [False, False, True]
+
+def test_pending_transition_restarts_after_the_gap(alarm_dbs, debounce, clock) :
+    id = "FAN-1-7#FAN_HIGH"
+    gap = 5 + alarm_dbs.ALARM_DEBOUNCE_GAP
+    assert allow_at(debounce, clock, id, True, False, [0, 3]) == [False, False]
+    # not seen for longer than the delay and the gap, e.g. the fan rpcs failed meanwhile
+    assert allow_at(debounce, clock, id, True, False, [gap + 1, gap + 5, gap + 6]) == [False, False, True]
+
+def test_alarm_without_delay_is_immediate(debounce, clock) :
+    assert allow_at(debounce, clock, "FAN-1-7#FAN_FAIL", True, False, [0]) == [True]
+    assert allow_at(debounce, clock, "FAN-1-7#FAN_FAIL", False, True, [0]) == [True]
+
+def test_psu_input_voltage_alarm_is_debounced(alarm_dbs, clock) :
+    vin = alarm_dbs.Alarm("PSU-1-5", "VOLTAGE_INPUT_HIGH")
+    for t in (0, 2) :
+        clock.now = 1000 + t
+        vin.create()
+    assert not alarm_dbs.Alarm.is_active("PSU-1-5", "VOLTAGE_INPUT_HIGH")
+    clock.now = 1003
+    vin.create()
+    assert alarm_dbs.Alarm.is_active("PSU-1-5", "VOLTAGE_INPUT_HIGH")
+    assert vin.dbs[alarm_dbs.db.STATE_DB].exists("CURALARM", vin.id)
+
+    for t in (4, 13) :
+        clock.now = 1000 + t
+        vin.clear()
+    assert alarm_dbs.Alarm.is_active("PSU-1-5", "VOLTAGE_INPUT_HIGH")
+    clock.now = 1014
+    vin.clear()
+    assert not alarm_dbs.Alarm.is_active("PSU-1-5", "VOLTAGE_INPUT_HIGH")
+
+def build(cls, name, **attrs) :
+    # a periph without its rpcs, Chassis and Fan are lru_cached classes
+    p = object.__new__(getattr(cls, "__wrapped__", cls))
+    p.name = name
+    p.__dict__.update(attrs)
+    return p
+
+def run_for(clock, secs, update) :
+    # a synchronize cycle every second
+    for _ in range(secs + 1) :
+        update()
+        clock.now += 1
+
+def active(alarm, resource, *types) :
+    return [t for t in types if alarm.Alarm.is_active(resource, t)]
+
+def test_chassis_temperature_hysteresis(alarm_dbs, clock) :
+    chassis_mod = pytest.importorskip("otn_pmon.chassis")
+    temp = {"value" : 56.0}
+    chassis = build(chassis_mod.Chassis, "CHASSIS-1", get_temperature = lambda : temp["value"],
+                    _Chassis__get_disk_usage = lambda : 10.0)
+    types = ("CHASSIS_TEMP_HIALM", "CHASSIS_TEMP_HIWAR")
+    run_for(clock, 5, chassis.update_alarm)
+    assert active(alarm_dbs, "CHASSIS-1", *types) == ["CHASSIS_TEMP_HIALM"]
+
+    # below the 55 threshold but within the 2 of hysteresis, the alarm is kept
+    temp["value"] = 53.5
+    run_for(clock, 60, chassis.update_alarm)
+    assert active(alarm_dbs, "CHASSIS-1", *types) == ["CHASSIS_TEMP_HIALM"]
+
+    # past the hysteresis the warning replaces the alarm once raised
+    temp["value"] = 52.5
+    run_for(clock, 4, chassis.update_alarm)
+    assert active(alarm_dbs, "CHASSIS-1", *types) == ["CHASSIS_TEMP_HIALM"]
+    run_for(clock, 1, chassis.update_alarm)
+    assert active(alarm_dbs, "CHASSIS-1", *types) == ["CHASSIS_TEMP_HIWAR"]
+
+def test_fan_speed_hysteresis(alarm_dbs, clock) :
+    fan_mod = pytest.importorskip("otn_pmon.fan")
+    from otn_pmon.thrift_api.ttypes import fan_speed, fan_speed_spec
+    speed = {"value" : 12100}
+    fan = build(fan_mod.Fan, "FAN-1-7",
+                _Fan__get_speed = lambda : fan_speed(front = speed["value"], behind = speed["value"]),
+                _Fan__get_speed_spec = lambda : fan_speed_spec(max = 12000, min = 3000),
+                get_slot_status = lambda : slot_status.READY)
+    run_for(clock, 5, fan.update_alarm)
+    assert active(alarm_dbs, "FAN-1-7", "FAN_HIGH") == ["FAN_HIGH"]
+
+    # back in the spec but within the 200 of hysteresis, the alarm is kept
+    speed["value"] = 11900
+    run_for(clock, 30, fan.update_alarm)
+    assert active(alarm_dbs, "FAN-1-7", "FAN_HIGH") == ["FAN_HIGH"]
+
+    # past the hysteresis the alarm is cleared after its 10s clear delay
+    speed["value"] = 11700
+    run_for(clock, 9, fan.update_alarm)
+    assert active(alarm_dbs, "FAN-1-7", "FAN_HIGH") == ["FAN_HIGH"]
+    run_for(clock, 1, fan.update_alarm)
+    assert not active(alarm_dbs, "FAN-1-7", "FAN_HIGH")
@@ -0,0 +1,48 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+def test_raise_and_clear_publish_events(alarm_dbs) :
+    alarm = alarm_dbs
+    reader = alarm.AlarmEventReader("FAN-1-7", last_id = "0")
+    fail = alarm.Alarm("FAN-1-7", "FAN_FAIL")
+    fail.create()
+    fail.clear()
+
+    events = [e for _, e in reader.read(block_ms = 10)]
+    assert [e["event"] for e in events] == ["raise", "clear"]
+    raised, cleared = events
+    assert raised["id"] == cleared["id"] == "FAN-1-7#FAN_FAIL"
+    assert raised["resource"] == "FAN-1-7" and raised["type-id"] == "FAN_FAIL"
+    assert raised["severity"] == cleared["severity"]
+    assert cleared["time-created"] == raised["time-created"]
+    assert int(cleared["time-cleared"]) >= int(raised["time-created"])
+    # the raise holds only the identifying fields of the alarm
+    assert "text" not in raised
+
+    # the reader resumes after the last event read
+    assert reader.read(block_ms = 10) == []
+    alarm.Alarm("FAN-1-8", "FAN_FAIL").create()
+    assert [e["id"] for _, e in reader.read(block_ms = 10)] == ["FAN-1-8#FAN_FAIL"]
+
+def test_clear_of_an_inactive_alarm_publishes_nothing(alarm_dbs) :
+    alarm = alarm_dbs
+    reader = alarm.AlarmEventReader("FAN-1-7", last_id = "0")
+    alarm.Alarm("FAN-1-7", "FAN_FAIL").clear()
+    assert reader.read(block_ms = 10) == []
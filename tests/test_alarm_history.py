@@ -0,0 +1,109 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+def raise_alarm(state, id, severity = "CRITICAL") :
+    resource, type_id = id.split("#")
+    state.set("CURALARM", id, [("id", id), ("resource", resource), ("type-id", type_id),
+              ("severity", severity), ("time-created", str(time.time_ns()))])
+
+@pytest.fixture
+def dbs(alarm_dbs) :
+    db = alarm_dbs.db
+    return db.get_dbs("CHASSIS-1", [db.STATE_DB, db.HISTORY_DB])
+
+def clear(alarm, dbs, *ids) :
+    for id in ids :
+        alarm._run_clear_script(dbs, [id])
+
+def test_cleared_alarms_are_queried_by_resource_and_severity(alarm_dbs, dbs) :
+    alarm = alarm_dbs
+    state = dbs[alarm.db.STATE_DB]
+    raise_alarm(state, "FAN-1-7#FAN_FAIL")
+    raise_alarm(state, "PSU-1-5#PSU_MISMATCH", "MAJOR")
+    raise_alarm(state, "FAN-1-8#FAN_FAIL")
+    clear(alarm, dbs, "FAN-1-7#FAN_FAIL", "PSU-1-5#PSU_MISMATCH", "FAN-1-8#FAN_FAIL")
+
+    assert [a["id"] for a in alarm.query_history_alarms("FAN-1-7")] == ["FAN-1-7#FAN_FAIL"]
+    # newest first
+    assert [a["id"] for a in alarm.query_history_alarms()] == \
+        ["FAN-1-8#FAN_FAIL", "PSU-1-5#PSU_MISMATCH", "FAN-1-7#FAN_FAIL"]
+    assert [a["id"] for a in alarm.query_history_alarms(severity = "MAJOR")] == ["PSU-1-5#PSU_MISMATCH"]
+    assert [a["id"] for a in alarm.query_history_alarms(severity = ["CRITICAL"], offset = 1)] == ["FAN-1-7#FAN_FAIL"]
+    assert [a["id"] for a in alarm.query_history_alarms(offset = 1, count = 1)] == ["PSU-1-5#PSU_MISMATCH"]
+
+def test_query_keeps_to_its_time_range(alarm_dbs, dbs) :
+    alarm = alarm_dbs
+    state = dbs[alarm.db.STATE_DB]
+    raise_alarm(state, "FAN-1-7#FAN_FAIL")
+    clear(alarm, dbs, "FAN-1-7#FAN_FAIL")
+    now = time.time()
+    assert len(alarm.query_history_alarms(start = now - 60, end = now + 60)) == 1
+    assert alarm.query_history_alarms(start = now + 60) == []
+    assert alarm.query_history_alarms(end = now - 60) == []
+
+def test_query_skips_alarms_trimmed_since_indexed(alarm_dbs, dbs) :
+    alarm = alarm_dbs
+    state, history = dbs[alarm.db.STATE_DB], dbs[alarm.db.HISTORY_DB]
+    raise_alarm(state, "FAN-1-7#FAN_FAIL")
+    raise_alarm(state, "FAN-1-8#FAN_FAIL")
+    clear(alarm, dbs, "FAN-1-7#FAN_FAIL", "FAN-1-8#FAN_FAIL")
+    history.delete_entry("HISALARM", history.get_keys("HISALARM")[0])
+    assert len(alarm.query_history_alarms()) == 1
+
+def expire(history, alarm, his_id) :
+    his_key = history.key_name("HISALARM", his_id)
+    history.set("HISALARM", his_id, [("id", his_id.rsplit("_", 1)[0])])
+    expired = (int(time.time()) - alarm.HISTORY_ALARM_RETENTION - 60) * 1000
+    r = history.connector.redis()
+    for resource in (alarm.HISTORY_ALARM_ALL, "FAN-1-7") :
+        r.zadd(history.key_name("HISALARM_INDEX", resource), {his_key : expired})
+    return r
+
+def test_clear_trims_expired_history(alarm_dbs, dbs) :
+    alarm = alarm_dbs
+    history = dbs[alarm.db.HISTORY_DB]
+    r = expire(history, alarm, "FAN-1-7#FAN_FAIL_1")
+
+    alarm._run_clear_script(dbs, [])
+
+    assert r.dbsize() == 0
+
+def test_trim_is_limited_per_run(alarm_dbs, dbs, monkeypatch) :
+    alarm = alarm_dbs
+    monkeypatch.setattr(alarm, "HISTORY_ALARM_TRIM_LIMIT", 2)
+    history = dbs[alarm.db.HISTORY_DB]
+    for i in range(3) :
+        r = expire(history, alarm, f"FAN-1-7#FAN_FAIL_{i}")
+    alarm._run_clear_script(dbs, [])
+    assert len(history.get_keys("HISALARM")) == 1
+    alarm._run_clear_script(dbs, [])
+    assert r.dbsize() == 0
+
+def test_trim_runs_once_per_interval(alarm_dbs, dbs) :
+    alarm = alarm_dbs
+    history = dbs[alarm.db.HISTORY_DB]
+    alarm.trim_history_alarms()
+    expire(history, alarm, "FAN-1-7#FAN_FAIL_1")
+    # the dbs were trimmed within the interval, also through another resource sharing them
+    alarm.trim_history_alarms("FAN-1-7")
+    assert len(history.get_keys("HISALARM")) == 1
+    alarm.trim_history_alarms(force = True)
+    assert history.get_keys("HISALARM") == []
@@ -0,0 +1,131 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import threading
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+from otn_pmon.alarm import CurrentAlarmIndex
+
+def raise_alarm(client, id, notify = True) :
+    client.set("CURALARM", id, [("severity", "MAJOR")])
+    if notify :
+        # fakeredis sends no keyspace notification, publish the one redis would
+        client.db.r.publish(f"__keyspace@{client.connector.db_index}__:CURALARM|{id}", "hset")
+
+def clear_alarm(client, id) :
+    client.delete_entry("CURALARM", id)
+    client.db.r.publish(f"__keyspace@{client.connector.db_index}__:CURALARM|{id}", "del")
+
+def wait_for(cond, timeout = 3) :
+    deadline = time.monotonic() + timeout
+    while not cond() :
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+@pytest.fixture
+def state(swss_dbs) :
+    return swss_dbs.Client(0, swss_dbs.STATE_DB)
+
+@pytest.fixture
+def index(state) :
+    raise_alarm(state, "FAN-1-1#FAN_FAIL", False)
+    raise_alarm(state, "FAN-1-10#FAN_FAIL", False)
+    index = CurrentAlarmIndex(state)
+    yield index
+    index.watcher.stop.set()
+    index.watcher.join()
+
+def test_loaded_by_resource(index) :
+    assert index.watcher.synced
+    assert index.ids("FAN-1-1") == ["FAN-1-1#FAN_FAIL"]
+    assert index.has("FAN-1-10#FAN_FAIL")
+    assert not index.has("FAN-1-1#HIGH_TEMPERATURE_ALARM")
+
+def test_follows_notifications(index, state) :
+    # the watcher subscribes on start, wait until the subscription is in place
+    wait_for(lambda : state.db.r.pubsub_numpat() > 0)
+    raise_alarm(state, "FAN-1-1#HIGH_TEMPERATURE_ALARM")
+    wait_for(lambda : index.has("FAN-1-1#HIGH_TEMPERATURE_ALARM"))
+    clear_alarm(state, "FAN-1-1#FAN_FAIL")
+    wait_for(lambda : not index.has("FAN-1-1#FAN_FAIL"))
+    assert index.ids("FAN-1-1") == ["FAN-1-1#HIGH_TEMPERATURE_ALARM"]
+
+def test_resync_heals_lost_notifications(swss_dbs, state, monkeypatch) :
+    monkeypatch.setattr(swss_dbs, "KEYSPACE_RESYNC_SECS", 0.05)
+    index = CurrentAlarmIndex(state)
+    try :
+        raise_alarm(state, "PSU-1-5#PSU_FAIL", False)
+        wait_for(lambda : index.has("PSU-1-5#PSU_FAIL"))
+    finally :
+        index.watcher.stop.set()
+        index.watcher.join()
+
+class RecordedWait(threading.Event) :
+    """stop event of a watcher, records the retry delays instead of waiting them"""
+    def __init__(self, waits) :
+        super().__init__()
+        self.delays = []
+        self.waits = waits
+
+    def wait(self, timeout = None) :
+        self.delays.append(timeout)
+        if len(self.delays) >= self.waits :
+            self.set()
+        return self.is_set()
+
+def test_failing_watcher_backs_off(swss_dbs, state, monkeypatch) :
+    db = swss_dbs
+    logs = []
+    monkeypatch.setattr(db.LOG, "log_warning", lambda msg : logs.append(msg))
+    monkeypatch.setattr(db.LOG, "log_notice", lambda msg : logs.append(msg))
+    watcher = db.KeyspaceWatcher(state, ["CURALARM|*"])
+    watcher.stop = RecordedWait(7)
+
+    def unreachable() :
+        raise ConnectionError("redis is unreachable")
+
+    monkeypatch.setattr(state, "pub_sub", unreachable)
+    watcher.run()
+    assert watcher.stop.delays == [2, 4, 8, 16, 30, 30, 30]
+    assert watcher.failures == 7 and not watcher.synced
+    # one log per KEYSPACE_LOG_SECS
+    assert len(logs) == 1
+
+def test_watcher_recovers(swss_dbs, state, monkeypatch) :
+    db = swss_dbs
+    monkeypatch.setattr(db.LOG, "log_warning", lambda msg : None)
+    raise_alarm(state, "FAN-1-7#FAN_FAIL", False)
+    watcher = db.KeyspaceWatcher(state, ["CURALARM|*"])
+    watcher.stop = RecordedWait(2)
+    pub_sub = state.pub_sub
+    attempts = []
+
+    def flaky() :
+        attempts.append(1)
+        if len(attempts) == 1 :
+            raise ConnectionError("redis is unreachable")
+        return pub_sub()
+
+    monkeypatch.setattr(state, "pub_sub", flaky)
+    thread = threading.Thread(target = watcher.run, daemon = True)
+    thread.start()
+    wait_for(lambda : watcher.synced)
+    assert watcher.failures == 0 and watcher.count("CURALARM|*") == 1
+    watcher.stop.set()
+    thread.join()
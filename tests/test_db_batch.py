@@ -0,0 +1,119 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import threading
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+def stored(client, kname) :
+    # what redis holds, bypassing the client
+    return client.db.r.hgetall(f"FAN|{kname}")
+
+def test_writes_are_sent_when_the_batch_exits(swss_dbs) :
+    db = swss_dbs
+    state = db.Client(0, db.STATE_DB)
+    counters = db.Client(0, db.COUNTERS_DB)
+    with db.write_batch() :
+        for i in range(5) :
+            state.set("FAN", f"FAN-1-{i}", [("speed", "9000")])
+            counters.set("FAN", f"FAN-1-{i}", [("rpm", "9000")])
+        state.delete_entry("FAN", "FAN-1-0")
+        assert not stored(state, "FAN-1-1") and not stored(counters, "FAN-1-1")
+
+    assert not stored(state, "FAN-1-0")
+    assert stored(state, "FAN-1-1") == {"speed" : "9000"}
+    assert stored(counters, "FAN-1-4") == {"rpm" : "9000"}
+    # one round trip per db
+    assert state.connector.pipeline().pipeline.flushes == 1
+    assert counters.connector.pipeline().pipeline.flushes == 1
+    stats = db.get_batch_stats()
+    assert (stats["flushes"], stats["writes"], stats["max"]) == (2, 11, 6)
+
+def test_reads_see_the_buffered_writes(swss_dbs) :
+    db = swss_dbs
+    state = db.Client(0, db.STATE_DB)
+    with db.write_batch() :
+        state.set("FAN", "FAN-1-7", [("speed", "9000")])
+        # a read of another table does not flush
+        assert not state.exists("PSU", "PSU-1-5")
+        assert not stored(state, "FAN-1-7")
+        assert state.get_field("FAN", "FAN-1-7", "speed") == (True, "9000")
+        state.set("FAN", "FAN-1-7", [("speed", "8000")])
+        assert state.get_keys("FAN") == ["FAN-1-7"]
+    assert stored(state, "FAN-1-7") == {"speed" : "8000"}
+
+def test_nested_batches_flush_at_the_outermost_exit(swss_dbs) :
+    db = swss_dbs
+    state = db.Client(0, db.STATE_DB)
+    with db.write_batch() :
+        with db.write_batch() :
+            state.set("FAN", "FAN-1-7", [("speed", "9000")])
+        assert not stored(state, "FAN-1-7")
+    assert stored(state, "FAN-1-7")
+
+def test_full_batch_is_flushed(swss_dbs, monkeypatch) :
+    db = swss_dbs
+    monkeypatch.setattr(db, "BATCH_MAX_WRITES", 3)
+    state = db.Client(0, db.STATE_DB)
+    with db.write_batch() :
+        for i in range(4) :
+            state.set("FAN", f"FAN-1-{i}", [("speed", "9000")])
+        assert stored(state, "FAN-1-2") and not stored(state, "FAN-1-3")
+    assert db.get_batch_stats()["flushes"] == 2
+
+def test_appends_and_scripts_are_ordered_with_the_batch(swss_dbs) :
+    db = swss_dbs
+    history = db.Client(0, db.HISTORY_DB)
+    with db.write_batch() :
+        history.append("PMHIS|FAN-1-7", b"\x01\x02", 60)
+        history.set("FAN", "FAN-1-7", [("speed", "9000")])
+        assert not history.db.r.exists("PMHIS|FAN-1-7")
+        # buffered writes are sent before a script reads them
+        assert history.run_script("return redis.call('HGET', KEYS[1], 'speed')", ["FAN|FAN-1-7"]) == "9000"
+        history.append("PMHIS|FAN-1-7", b"\x03")
+    raw = history.connector.redis_bytes()
+    assert raw.get("PMHIS|FAN-1-7") == b"\x01\x02\x03"
+    assert 0 < raw.ttl("PMHIS|FAN-1-7") <= 60
+
+def test_other_threads_are_not_batched(swss_dbs) :
+    db = swss_dbs
+    state = db.Client(0, db.STATE_DB)
+    with db.write_batch() :
+        t = threading.Thread(target = state.set, args = ("FAN", "FAN-1-7", [("speed", "9000")]))
+        t.start()
+        t.join()
+        assert stored(state, "FAN-1-7")
+
+@pytest.mark.parametrize("broken_db", ["STATE_DB", "COUNTERS_DB"])
+def test_failed_flush_does_not_hold_back_other_dbs(swss_dbs, broken_db) :
+    db = swss_dbs
+    clients = {name : db.Client(0, getattr(db, name)) for name in ("STATE_DB", "COUNTERS_DB")}
+    pipeline = clients[broken_db].connector.pipeline().pipeline
+
+    def broken() :
+        pipeline.pipe.reset()
+        raise RuntimeError("redis went away")
+
+    pipeline.flush = broken
+    with pytest.raises(RuntimeError) :
+        with db.write_batch() :
+            for client in clients.values() :
+                client.set("FAN", "FAN-1-7", [("speed", "9000")])
+    for name, client in clients.items() :
+        assert bool(stored(client, "FAN-1-7")) == (name != broken_db)
+    # the failed pipeline is not left to the next batch
+    assert not db._batch.pipelines
@@ -0,0 +1,81 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import threading
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+def test_clients_of_a_db_share_one_connector(swss_dbs) :
+    db = swss_dbs
+    a = db.Client(0, db.STATE_DB)
+    b = db.Client(0, db.STATE_DB)
+    c = db.Client(0, db.COUNTERS_DB)
+    assert a.connector is b.connector and a.db is b.db
+    assert c.connector is not a.connector
+
+    stats = db.get_connector_stats()
+    assert stats[f"/var/run/redis/redis.sock:{db.STATE_DB}"]["refs"] == 2
+    assert stats[f"/var/run/redis/redis.sock:{db.COUNTERS_DB}"]["refs"] == 1
+
+def test_get_dbs_picks_the_linecard_instance(swss_dbs) :
+    db = swss_dbs
+    host = db.get_dbs("FAN-1-7", [db.STATE_DB])[db.STATE_DB]
+    linecard = db.get_dbs("LINECARD-1-2", [db.STATE_DB])[db.STATE_DB]
+    assert host.connector.redis_sock == "/var/run/redis/redis.sock"
+    assert linecard.connector.redis_sock == "/var/run/redis1/redis.sock"
+
+    host.set("FAN", "FAN-1-7", [("speed", "9000")])
+    assert not linecard.exists("FAN", "FAN-1-7")
+
+def test_table_handles_are_cached(swss_dbs) :
+    db = swss_dbs
+    a = db.Client(0, db.STATE_DB)
+    b = db.Client(0, db.STATE_DB)
+    a.set("FAN", "FAN-1-7", [("speed", "9000")])
+    b.set("FAN", "FAN-1-8", [("speed", "8000")])
+    assert a.connector.table("FAN") is b.connector.table("FAN")
+    assert len(a.connector.tables) == 1
+    assert b.get_entry("FAN", "FAN-1-7") == (True, (("speed", "9000"), ))
+    assert sorted(b.get_keys("FAN")) == ["FAN-1-7", "FAN-1-8"]
+
+def test_closed_clients_release_the_connector(swss_dbs) :
+    db = swss_dbs
+    a = db.Client(0, db.STATE_DB)
+    connector = a.connector
+    a.close()
+    a.close()
+    assert connector.refs == 0
+
+    # a later client reuses the connector kept without reference
+    b = db.Client(0, db.STATE_DB)
+    assert b.connector is connector and connector.refs == 1
+    del b
+    assert connector.refs == 0
+
+def test_client_collected_while_acquiring_a_connector(swss_dbs) :
+    db = swss_dbs
+
+    def collect() :
+        a = db.Client(0, db.STATE_DB)
+        # as a gc run in _acquire_connector collecting a client of an earlier cycle
+        with db._connectors_lock :
+            del a
+
+    t = threading.Thread(target = collect, daemon = True)
+    t.start()
+    t.join(5)
+    assert not t.is_alive()
@@ -0,0 +1,115 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+@pytest.fixture
+def state(swss_dbs) :
+    return swss_dbs.Client(0, swss_dbs.STATE_DB)
+
+def stored(client, kname, tname = "FAN") :
+    return client.db.r.hgetall(f"{tname}|{kname}")
+
+def tamper(client, kname, fields) :
+    # a change made behind the back of the shadow, overwritten only by a write which is not suppressed
+    client.db.r.hset(f"FAN|{kname}", mapping = fields)
+
+def test_unchanged_fields_are_not_written(state) :
+    state.set("FAN", "FAN-1-7", [("speed", "9000"), ("led", "green")])
+    tamper(state, "FAN-1-7", {"speed" : "0", "led" : "off"})
+    state.set("FAN", "FAN-1-7", [("speed", "9000"), ("led", "green")])
+    assert stored(state, "FAN-1-7") == {"speed" : "0", "led" : "off"}
+
+    state.set_field("FAN", "FAN-1-7", "led", "red")
+    assert stored(state, "FAN-1-7") == {"speed" : "0", "led" : "red"}
+    assert state.connector.shadow.stats() == {"entries" : 1, "suppressed" : 1, "partial" : 1, "full" : 1}
+
+def test_key_is_rewritten_in_full_after_resync_interval(swss_dbs, state, monkeypatch) :
+    state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    tamper(state, "FAN-1-7", {"speed" : "0"})
+    monkeypatch.setattr(swss_dbs, "SHADOW_RESYNC_SECS", 0)
+    state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    assert stored(state, "FAN-1-7") == {"speed" : "9000"}
+
+def test_reads_and_deletes_update_the_shadow(state) :
+    state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    tamper(state, "FAN-1-7", {"speed" : "0"})
+    assert state.get_entry("FAN", "FAN-1-7") == (True, (("speed", "0"), ))
+    state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    assert stored(state, "FAN-1-7") == {"speed" : "9000"}
+
+    state.delete_entry("FAN", "FAN-1-7")
+    state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    assert stored(state, "FAN-1-7") == {"speed" : "9000"}
+
+def test_current_alarms_are_always_written(state) :
+    state.set("CURALARM", "FAN-1-7#FAN_FAIL", [("severity", "MAJOR")])
+    state.db.r.delete("CURALARM|FAN-1-7#FAN_FAIL")
+    state.set("CURALARM", "FAN-1-7#FAN_FAIL", [("severity", "MAJOR")])
+    assert stored(state, "FAN-1-7#FAN_FAIL", "CURALARM") == {"severity" : "MAJOR"}
+
+def test_every_insert_is_bounded(swss_dbs, state, monkeypatch) :
+    monkeypatch.setattr(swss_dbs, "SHADOW_MAX_ENTRIES", 3)
+    for i in range(3) :
+        state.set("FAN", f"FAN-1-{i}", [("speed", "9000")])
+    # complete reads insert too
+    for i in range(3, 6) :
+        tamper(state, f"FAN-1-{i}", {"speed" : "9000"})
+        state.get_entry("FAN", f"FAN-1-{i}")
+    shadow = state.connector.shadow
+    assert list(shadow.entries) == [("FAN", f"FAN-1-{i}") for i in range(3, 6)]
+
+def test_failed_flush_forgets_the_batched_keys(swss_dbs, state) :
+    db = swss_dbs
+    state.set("FAN", "FAN-1-8", [("speed", "8000")])
+    pipeline = state.connector.pipeline().pipeline
+    flush = pipeline.flush
+
+    def broken() :
+        pipeline.pipe.reset()
+        raise RuntimeError("redis went away")
+
+    pipeline.flush = broken
+    with pytest.raises(RuntimeError) :
+        with db.write_batch() :
+            state.set("FAN", "FAN-1-7", [("speed", "9000")])
+            state.set("FAN", "FAN-1-8", [("speed", "9000")])
+    assert not stored(state, "FAN-1-7")
+    assert ("FAN", "FAN-1-7") not in state.connector.shadow.entries
+    assert ("FAN", "FAN-1-8") not in state.connector.shadow.entries
+
+    # the same values are written again, not suppressed
+    pipeline.flush = flush
+    with db.write_batch() :
+        state.set("FAN", "FAN-1-7", [("speed", "9000")])
+        state.set("FAN", "FAN-1-8", [("speed", "9000")])
+    assert stored(state, "FAN-1-7") == {"speed" : "9000"}
+    assert stored(state, "FAN-1-8") == {"speed" : "9000"}
+
+def test_failed_write_forgets_the_key(state) :
+    table = state.connector.table("FAN")
+
+    def broken(kname, fvs) :
+        raise RuntimeError("redis went away")
+
+    table.set = broken
+    with pytest.raises(RuntimeError) :
+        state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    del table.set
+    state.set("FAN", "FAN-1-7", [("speed", "9000")])
+    assert stored(state, "FAN-1-7") == {"speed" : "9000"}
@@ -0,0 +1,83 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+import otn_pmon.fan as fan
+import otn_pmon.cache as cache
+from otn_pmon.alarm import AlarmTypeIndex
+from otn_pmon.thrift_api.ttypes import periph_type
+
+FANS = 5
+LINECARDS = [1, 2]
+TYPES = ["HIGH_TEMPERATURE_ALARM", "SLOT_COMM_FAIL"]
+
+@pytest.fixture
+def control(swss_dbs, monkeypatch) :
+    """a FanControl of 5 present fans and 2 linecards whose alarm watchers are synced by hand"""
+    monkeypatch.setattr(fan.public, "get_inlet_temp", lambda : 30)
+    monkeypatch.setattr(fan.periph, "get_periph_number", lambda type : FANS)
+    monkeypatch.setattr(fan, "rpc_cache", cache.RpcCache())
+    c = object.__new__(fan.FanControl)
+    c.list = [object() for _ in range(FANS)]
+    c.alarm_index = AlarmTypeIndex(LINECARDS, TYPES)
+    return c
+
+def sync(control, *slots) :
+    for slot in slots :
+        control.alarm_index.watchers[slot].resync()
+
+def raise_alarm(control, slot, type) :
+    client = control.alarm_index.watchers[slot].client
+    client.set("CURALARM", f"LINECARD-1-{slot}#{type}", [("severity", "MAJOR")])
+
+def test_all_slots_synced_without_alarm(control) :
+    sync(control, *LINECARDS)
+    assert not control._need_full_speed()
+
+def test_unsynced_present_slot_needs_full_speed(control) :
+    sync(control, 1)
+    assert control._need_full_speed()
+    # present until known otherwise
+    fan.rpc_cache.update_presence((periph_type.LINECARD, 2), True)
+    assert control._need_full_speed()
+
+def test_unsynced_absent_slot_is_ignored(control) :
+    sync(control, 1)
+    fan.rpc_cache.update_presence((periph_type.LINECARD, 2), False)
+    assert not control._need_full_speed()
+
+@pytest.mark.parametrize("type", TYPES)
+def test_alarm_of_a_slot_needs_full_speed(control, type) :
+    raise_alarm(control, 2, type)
+    sync(control, *LINECARDS)
+    assert control._need_full_speed()
+
+    # the alarm is read from the redis of its slot only
+    assert control.alarm_index.watchers[1].count(f"*{type}*") == 0
+    assert control.alarm_index.watchers[2].count(f"*{type}*") == 1
+
+def test_missing_fan_or_temperature_needs_full_speed(control, monkeypatch) :
+    sync(control, *LINECARDS)
+    control.list.pop()
+    assert control._need_full_speed()
+
+    control.list.append(object())
+    monkeypatch.setattr(fan.public, "get_inlet_temp", lambda : None)
+    assert control._need_full_speed()
@@ -0,0 +1,137 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import io
+import os
+import types
+import pytest
+
+import otn_pmon.host as host
+
+STAT = """cpu  {u} 0 {s} {i} 0 0 0 0 0 0
+cpu0 {u} 0 {s} {i} 0 0 0 0 0 0
+cpu1 0 0 0 {i} 0 0 0 0 0 0
+intr 12345
+ctxt 678
+"""
+
+MEMINFO = """MemTotal:        1000 kB
+MemFree:          200 kB
+MemAvailable:     500 kB
+Buffers:           50 kB
+Cached:           150 kB
+SReclaimable:      50 kB
+"""
+
+CPUINFO = """processor	: 0
+physical id	: 0
+core id		: 0
+
+processor	: 1
+physical id	: 0
+core id		: 0
+
+processor	: 2
+physical id	: 0
+core id		: 1
+
+"""
+
+class Clock(object) :
+    def __init__(self) :
+        self.now = 100.0
+
+    def __call__(self) :
+        return self.now
+
+@pytest.fixture
+def proc(tmp_path) :
+    files = {name : tmp_path / name for name in ("stat", "meminfo", "cpuinfo")}
+    files["meminfo"].write_text(MEMINFO)
+    files["cpuinfo"].write_text(CPUINFO)
+    return files
+
+@pytest.fixture
+def clock(monkeypatch) :
+    c = Clock()
+    monkeypatch.setattr(host, "time", types.SimpleNamespace(monotonic = c))
+    return c
+
+@pytest.fixture
+def sampler(proc, clock) :
+    s = host.HostSampler()
+    s.stat = host.ProcFile(str(proc["stat"]), 64)
+    s.meminfo = host.ProcFile(str(proc["meminfo"]))
+    s.clk_tck = 100
+    return s
+
+def write_stat(proc, user, system, idle) :
+    proc["stat"].write_text(STAT.format(u = user, s = system, i = idle))
+
+def test_cpu_times_and_percent_between_samples(sampler, proc, clock) :
+    write_stat(proc, 100, 100, 800)
+    first = sampler.cpu()
+    assert first.total[:4] == (1.0, 0.0, 1.0, 8.0)
+    assert first.percpu == [(1.0, 0.0, 1.0, 8.0) + (0.0, ) * 6, (0.0, 0.0, 0.0, 8.0) + (0.0, ) * 6]
+    assert first.percent == 0.0
+
+    # 30 of the 100 ticks since are busy
+    write_stat(proc, 120, 110, 870)
+    clock.now += host.HOST_CPU_INTERVAL
+    assert sampler.cpu().percent == 30.0
+
+def test_snapshots_are_cached_for_their_interval(sampler, proc, clock) :
+    write_stat(proc, 100, 100, 800)
+    first = sampler.cpu()
+    write_stat(proc, 200, 100, 800)
+    clock.now += host.HOST_CPU_INTERVAL / 2
+    assert sampler.cpu() is first
+    clock.now += host.HOST_CPU_INTERVAL / 2
+    assert sampler.cpu() is not first
+    assert sampler.stats() == {"samples" : 2, "hits" : 1}
+
+def test_stat_larger_than_the_buffer_is_read_whole(sampler, proc) :
+    # the buffer of 64 bytes grows until the file fits
+    write_stat(proc, 100, 100, 800)
+    assert len(sampler.cpu().percpu) == 2
+    assert len(sampler.stat.buf) > len(proc["stat"].read_bytes())
+
+def test_memory_as_psutil(sampler, proc, clock) :
+    mem = sampler.memory()
+    assert (mem.total, mem.available, mem.free) == (1000 * 1024, 500 * 1024, 200 * 1024)
+    # total - free - cached - reclaimable - buffers
+    assert mem.used == 550 * 1024
+    assert mem.percent == 50.0
+
+    # without MemAvailable, free and cache are available
+    proc["meminfo"].write_text("\n".join(l for l in MEMINFO.splitlines() if "MemAvailable" not in l))
+    clock.now += host.HOST_MEMORY_INTERVAL
+    assert sampler.memory().available == 400 * 1024
+
+def test_disk_usage(sampler, clock, monkeypatch) :
+    st = types.SimpleNamespace(f_blocks = 1000, f_bfree = 300, f_bavail = 200, f_frsize = 4096)
+    monkeypatch.setattr(host.os, "statvfs", lambda path : st)
+    disk = sampler.disk("/")
+    assert (disk.total, disk.used, disk.free) == (1000 * 4096, 700 * 4096, 200 * 4096)
+    assert disk.percent == round(700 * 100 / 900, 1)
+    # sampled again only after HOST_DISK_INTERVAL
+    st.f_bfree = 0
+    clock.now += host.HOST_DISK_INTERVAL - 1
+    assert sampler.disk("/") is disk
+
+def test_physical_cores_from_cpuinfo(proc, monkeypatch) :
+    monkeypatch.setattr(host, "open", lambda path : io.open(proc["cpuinfo"]), raising = False)
+    assert host.get_cpu_count(logical = False) == 2
+    assert host.get_cpu_count(logical = True) == os.cpu_count()
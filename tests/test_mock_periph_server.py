@@ -0,0 +1,76 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import threading
+import pytest
+
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+from thrift.Thrift import TApplicationException
+import otn_pmon.thrift_client as thrift_client
+from otn_pmon.thrift_api.ttypes import periph_type
+
+def presence(client) :
+    return client.periph_presence(periph_type.FAN, 7)
+
+def temperature(client) :
+    return client.get_periph_temperature(periph_type.FAN, 7)
+
+def elapsed(func) :
+    start = time.monotonic()
+    func()
+    return time.monotonic() - start
+
+def test_latency_per_method(periph_server) :
+    periph_server({"latency" : {"*" : 0.01, "periph_presence" : 0.1}})
+    # open the pooled connection first
+    thrift_client.thrift_try(temperature)
+    assert 0.1 <= elapsed(lambda : thrift_client.thrift_try(presence)) < 0.2
+    assert 0.01 <= elapsed(lambda : thrift_client.thrift_try(temperature)) < 0.1
+
+def test_injected_errors_reach_thrift_try(periph_server) :
+    _, injector = periph_server({"error_rate" : {"periph_presence" : 1}})
+    with pytest.raises(TApplicationException) :
+        thrift_client.thrift_try(presence, attempts = 3)
+    assert injector.calls["periph_presence"] == injector.errors["periph_presence"] == 3
+    # other methods are not affected
+    assert thrift_client.thrift_try(temperature).temperature
+
+def test_counters_under_concurrent_calls(periph_server, monkeypatch) :
+    _, injector = periph_server({"error_rate" : {"*" : 0.2}}, seed = 7)
+    monkeypatch.setattr(thrift_client, "_breaker", thrift_client.CircuitBreaker(failure_threshold = 1000))
+    calls = 25
+
+    def poll() :
+        for _ in range(calls) :
+            assert thrift_client.thrift_try(presence, attempts = 20)
+
+    threads = [threading.Thread(target = poll) for _ in range(8)]
+    for t in threads :
+        t.start()
+    for t in threads :
+        t.join()
+
+    errors = injector.errors["periph_presence"]
+    assert errors > 0
+    assert injector.calls["periph_presence"] == 8 * calls + errors
+
+def test_hot_plug_events(periph_server) :
+    periph_server({"events" : [{"at" : 0.05, "type" : "FAN", "id" : 7, "presence" : False}]})
+    assert thrift_client.thrift_try(presence)
+    time.sleep(0.1)
+    assert not thrift_client.thrift_try(presence)
@@ -0,0 +1,69 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+import otn_pmon.periph as periph
+import otn_pmon.cache as cache
+from otn_pmon.thrift_api.ttypes import periph_type
+
+FAN = (periph_type.FAN, 7)
+
+@pytest.fixture
+def fan(periph_server, monkeypatch) :
+    handler, injector = periph_server()
+    monkeypatch.setattr(periph, "rpc_cache", cache.RpcCache())
+    p = object.__new__(periph.Periph)
+    p.type, p.id = FAN
+    p.name = "FAN-1-7"
+    return p, handler, injector
+
+def test_inventory_is_cached(fan) :
+    p, handler, injector = fan
+    for _ in range(3) :
+        assert p.presence()
+        assert periph.get_periph_inventory(*FAN).sn == "SN30007"
+    assert injector.calls["get_inventory"] == 1
+
+def test_swapped_card_is_read_again(fan, monkeypatch) :
+    p, handler, injector = fan
+    assert p.presence()
+    handler.slots[FAN].inv.sn = "SN-SWAPPED"
+    assert periph.get_periph_inventory(*FAN).sn == "SN30007"
+
+    monkeypatch.setattr(periph, "RPC_SERIAL_CHECK_INTERVAL", 0)
+    assert p.presence()
+    assert periph.get_periph_inventory(*FAN).sn == "SN-SWAPPED"
+
+def test_failed_serial_check_keeps_the_cached_inventory(fan, monkeypatch) :
+    p, handler, injector = fan
+    assert p.presence()
+    monkeypatch.setattr(periph, "RPC_SERIAL_CHECK_INTERVAL", 0)
+    injector.error_rate["get_inventory"] = 1
+
+    # the presence is still reported, synchronize goes on
+    assert p.presence()
+    assert injector.errors["get_inventory"] > 0
+    assert periph.get_periph_inventory(*FAN).sn == "SN30007"
+
+    # and the serial number is checked again once the server answers
+    injector.error_rate["get_inventory"] = 0
+    handler.slots[FAN].inv.sn = "SN-SWAPPED"
+    assert p.presence()
+    assert periph.get_periph_inventory(*FAN).sn == "SN-SWAPPED"
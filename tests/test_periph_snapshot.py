@@ -0,0 +1,84 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import threading
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+import otn_pmon.periph as periph
+from otn_pmon.thrift_api.ttypes import periph_type
+
+def make_periph(type, id) :
+    p = object.__new__(periph.Periph)
+    p.type = type
+    p.id = id
+    p.name = f"{periph_type._VALUES_TO_NAMES[type]}-1-{id}"
+    return p
+
+class Snapshot(object) :
+    def __init__(self, tag) :
+        self.tag = tag
+        self.presence = True
+
+def test_snapshot_is_seen_by_its_synchronizing_thread_only(monkeypatch) :
+    monkeypatch.setattr(periph, "thrift_available", lambda : True)
+    monkeypatch.setattr(periph, "check_periph_serial", lambda type, id : None)
+    fan = make_periph(periph_type.FAN, 1)
+    inside = threading.Barrier(3)
+    done = threading.Barrier(3)
+    seen = {}
+
+    def synchronize_presence(self) :
+        inside.wait()
+        seen[threading.current_thread().name] = self.current_snapshot().tag
+        done.wait()
+
+    monkeypatch.setattr(periph.Periph, "synchronize_presence", synchronize_presence)
+    threads = [threading.Thread(target = fan.synchronize, args = (Snapshot(n), ), name = n) for n in ("a", "b")]
+    for t in threads :
+        t.start()
+    # a thread not synchronizing, as the fan control, reads no snapshot
+    inside.wait()
+    assert fan.current_snapshot() is None
+    done.wait()
+    for t in threads :
+        t.join()
+
+    assert seen == {"a" : "a", "b" : "b"}
+    assert fan.current_snapshot() is None
+
+def test_snapshot_is_dropped_when_synchronize_fails(monkeypatch) :
+    monkeypatch.setattr(periph, "thrift_available", lambda : True)
+    fan = make_periph(periph_type.FAN, 2)
+
+    def presence(self) :
+        assert self.current_snapshot().tag == "x"
+        raise RuntimeError("rpc failed")
+
+    monkeypatch.setattr(periph.Periph, "presence", presence)
+    fan.synchronize(Snapshot("x"))
+    assert fan.current_snapshot() is None
+
+def test_snapshots_from_mock_server(periph_server) :
+    handler, _ = periph_server()
+    handler.plug(periph_type.FAN, 8, False)
+
+    snapshots = periph.get_all_periph_snapshots()
+    assert snapshots[(periph_type.FAN, 7)].presence
+    assert not snapshots[(periph_type.FAN, 8)].presence
+    assert periph.get_periph_snapshot(periph_type.FAN, 7).speed
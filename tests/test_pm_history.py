@@ -0,0 +1,99 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import types
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+import otn_pmon.db as db
+import otn_pmon.pm as pm
+
+BIN = pm.PmEngine.INTERVALS[pm.Pm.PM_TYPE_15]
+DAY = pm.PmEngine.INTERVALS[pm.Pm.PM_TYPE_24]
+START = 20000 * DAY # a day boundary, unit ns
+
+@pytest.fixture
+def packed(monkeypatch, pm_engine) :
+    monkeypatch.setattr(pm, "PM_HISTORY_FORMAT", "packed")
+    return pm_engine
+
+def feed(monkeypatch, pms, samples) :
+    # [(time since START, value)], each sample in its own cycle
+    for offset, value in samples :
+        monkeypatch.setattr(pm, "time", types.SimpleNamespace(time = lambda : (START + offset) / 1e9,
+                                                              monotonic = time.monotonic))
+        pm.update_pms(pms, [value] * len(pms))
+
+def query(start, end, **kw) :
+    return pm.query_pm_history("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15, start, end, **kw)
+
+def test_closed_bins_are_queried_from_the_packed_blob(monkeypatch, packed) :
+    p = pm.get_pm("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15)
+    feed(monkeypatch, [p], [(0, 1), (1, 2), (2, 3), (BIN, 10), (2 * BIN, 7)])
+
+    bins = query(START, START + DAY)
+
+    assert list(bins["starttime"]) == [START, START + BIN]
+    assert list(bins["avg"]) == [2.0, 10.0]
+    assert list(bins["min"]) == [1.0, 10.0] and list(bins["max"]) == [3.0, 10.0]
+    assert list(bins["count"]) == [3, 1]
+    # the bin still open is not history yet
+    assert list(query(START + 2 * BIN, START + DAY)["starttime"]) == []
+
+def test_query_keeps_to_its_range(monkeypatch, packed) :
+    p = pm.get_pm("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15)
+    # the bins span two day blobs
+    feed(monkeypatch, [p], [(DAY - BIN, 1), (DAY, 2), (DAY + BIN, 3)])
+
+    assert list(query(START + DAY - BIN, START + DAY)["starttime"]) == [START + DAY - BIN, START + DAY]
+    assert list(query(START + DAY, START + 2 * DAY)["starttime"]) == [START + DAY]
+
+def test_bins_closed_in_one_cycle_are_appended_in_one_round_trip(monkeypatch, packed) :
+    pms = [pm.get_pm("FAN", "FAN-1-7", name, pm.Pm.PM_TYPE_15) for name in ("Speed", "Speed_2", "Temperature")]
+    feed(monkeypatch, pms, [(0, 1)])
+    history = db.get_dbs("FAN-1-7", [db.HISTORY_DB])[db.HISTORY_DB]
+    pipelines = []
+    pipeline = history.connector.redis_bytes().pipeline
+    monkeypatch.setattr(history.connector.redis_bytes(), "pipeline",
+                        lambda **kw : pipelines.append(pipeline(**kw)) or pipelines[-1])
+
+    feed(monkeypatch, pms, [(BIN, 2)])
+
+    assert len(pipelines) == 1
+    assert len(history.get_keys("FAN")) == 3
+
+def test_day_blobs_expire(monkeypatch, packed) :
+    monkeypatch.setattr(pm, "PM_HISTORY_EXPIRE", 3600)
+    p = pm.get_pm("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15)
+    feed(monkeypatch, [p], [(0, 1), (BIN, 2)])
+    history = db.get_dbs("FAN-1-7", [db.HISTORY_DB])[db.HISTORY_DB]
+    r = history.connector.redis()
+    assert 0 < r.ttl(history.key_name("FAN", f"FAN-1-7_Speed:15_pm_packed_{START}")) <= 3600
+
+def test_hash_bins_are_read_on_demand_and_migrated(packed) :
+    history = db.get_dbs("FAN-1-7", [db.HISTORY_DB])[db.HISTORY_DB]
+    history.set("FAN", f"FAN-1-7_Speed:15_pm_history_{START}", [
+        ("starttime", str(START)), ("instant", "4"), ("avg", "4.0"), ("min", "4"), ("max", "4"),
+        ("min-time", str(START)), ("max-time", str(START)), ("validity", "complete")])
+
+    assert list(query(START, START + DAY)["starttime"]) == []
+    assert list(query(START, START + DAY, legacy = True)["starttime"]) == [START]
+
+    assert pm.migrate_pm_history("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15) == 1
+    assert list(query(START, START + DAY)["avg"]) == [4.0]
+    assert history.get_keys("FAN") == [f"FAN-1-7_Speed:15_pm_packed_{START}"]
@@ -0,0 +1,75 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+import otn_pmon.db as db
+import otn_pmon.pm as pm
+
+@pytest.fixture
+def counters(pm_engine) :
+    return db.get_dbs("FAN-1-7", [db.COUNTERS_DB])[db.COUNTERS_DB]
+
+def feed(name, metric = "Speed", value = 9000) :
+    pms = pm.get_pms("FAN", name, metric)
+    pm.update_pms(pms, [value] * len(pms))
+
+def test_written_keys_are_indexed_per_resource(counters) :
+    feed("FAN-1-7")
+    feed("FAN-1-7", "Temperature", 30)
+    feed("FAN-1-70")
+
+    assert pm.list_pm_keys("FAN-1-7") == [
+        ("FAN", "FAN-1-7_Speed:15_pm_current"), ("FAN", "FAN-1-7_Speed:24_pm_current"),
+        ("FAN", "FAN-1-7_Temperature:15_pm_current"), ("FAN", "FAN-1-7_Temperature:24_pm_current")]
+    exported = pm.export_pm("FAN-1-70")
+    assert sorted(exported) == ["FAN-1-70_Speed:15_pm_current", "FAN-1-70_Speed:24_pm_current"]
+    assert exported["FAN-1-70_Speed:15_pm_current"]["instant"] == "9000"
+
+def test_clear_keeps_the_keys_of_other_resources(counters) :
+    feed("FAN-1-7")
+    feed("FAN-1-70")
+
+    pm.clearPmByName("FAN-1-7")
+
+    assert pm.list_pm_keys("FAN-1-7") == []
+    assert sorted(counters.get_keys("FAN")) == ["FAN-1-70_Speed:15_pm_current", "FAN-1-70_Speed:24_pm_current"]
+    assert not counters.exists(db.Table.PM_INDEX, "FAN-1-7")
+
+def test_keys_written_before_the_index_are_scanned_once(counters) :
+    counters.set("FAN", "FAN-1-7_Speed:15_pm_current", [("instant", "9000")])
+    counters.set("FAN", "FAN-1-8_Speed:15_pm_current", [("instant", "8000")])
+
+    assert pm.list_pm_keys("FAN-1-7") == [("FAN", "FAN-1-7_Speed:15_pm_current")]
+    pm.clearPmByName("FAN-1-8")
+    assert counters.get_keys("FAN") == ["FAN-1-7_Speed:15_pm_current"]
+
+def test_clear_finds_keys_written_around_the_index(counters) :
+    # the table was scanned for unindexed keys before this one was written
+    pm.list_pm_keys("FAN-1-7")
+    counters.set("FAN", "FAN-1-7_Speed:15_pm_current", [("instant", "9000")])
+
+    pm.clearPmByName("FAN-1-7")
+
+    assert counters.get_keys("FAN") == []
+
+def test_clear_of_an_empty_slot_skips_the_db(counters, monkeypatch) :
+    feed("FAN-1-7")
+    pm.clearPmByName("FAN-1-7")
+    monkeypatch.setattr(db, "get_dbs", lambda name, types : pytest.fail("cleared again"))
+    pm.clearPmByName("FAN-1-7")
@@ -0,0 +1,121 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import types
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+import otn_pmon.db as db
+import otn_pmon.pm as pm
+
+BIN = 15 * 60 * 1000000000
+START = 1700000000000000000 // (24 * 60 * 60 * 1000000000) * (24 * 60 * 60 * 1000000000)
+
+@pytest.fixture
+def engine(monkeypatch, pm_engine) :
+    monkeypatch.setattr(pm, "PM_REGISTRY_MAX", 4)
+    return pm_engine
+
+def at(monkeypatch, ns) :
+    monkeypatch.setattr(pm, "time", types.SimpleNamespace(time = lambda : ns / 1000000000,
+                                                          monotonic = time.monotonic))
+
+def fill(count, first = 0) :
+    return [pm.get_pm("FAN", f"FAN-1-{i}", "Speed", pm.Pm.PM_TYPE_15) for i in range(first, first + count)]
+
+def test_least_recently_used_pm_is_evicted(engine) :
+    pms = fill(4)
+    # FAN-1-0 used again, FAN-1-1 is the least recently used one now
+    assert pm.get_pm("FAN", "FAN-1-0", "Speed", pm.Pm.PM_TYPE_15) is pms[0]
+
+    pm.get_pm("FAN", "FAN-1-4", "Speed", pm.Pm.PM_TYPE_15)
+
+    stats = pm.get_pm_stats()
+    assert stats["pms"] == 4 and stats["evictions"] == 1
+    assert pm.get_pms_of("FAN-1-1") == []
+    assert pm.get_pms_of("FAN-1-0") == [pms[0]]
+    # the evicted row is kept for the next new pm
+    assert stats["engine"]["rows"] == 4 and stats["engine"]["free"] == 1
+
+def test_update_of_an_evicted_pm_is_dropped(engine) :
+    old = pm.get_pm("FAN", "FAN-1-0", "Speed", pm.Pm.PM_TYPE_15)
+    fill(4, 1)
+    # the row of the evicted pm goes to the next new one
+    new = pm.get_pm("FAN", "FAN-1-5", "Speed", pm.Pm.PM_TYPE_15)
+    assert new.row == old.row
+
+    pm.update_pms([old], [100])
+    pm.update_pms([new], [5])
+
+    assert engine.stale == 1
+    assert engine.value(new.row, "count") == 1 and engine.value(new.row, "max") == 5
+
+def test_eviction_mid_bin_keeps_its_samples(engine, monkeypatch) :
+    monkeypatch.setattr(pm, "PM_FLUSH_INTERVAL", 3600)
+    engine.last_flush = time.monotonic()
+    old = pm.get_pm("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15)
+    for i, value in enumerate([1, 2, 3]) :
+        at(monkeypatch, START + i * 1000000000)
+        pm.update_pms([old], [value])
+    counters, history = [db.get_dbs("FAN-1-7", [db.COUNTERS_DB, db.HISTORY_DB])[t]
+                         for t in (db.COUNTERS_DB, db.HISTORY_DB)]
+    # not flushed yet
+    assert not counters.exists("FAN", "FAN-1-7_Speed:15_pm_current")
+
+    fill(4, 8)
+
+    assert pm.get_pms_of("FAN-1-7") == []
+    _, fvs = counters.get_entry("FAN", "FAN-1-7_Speed:15_pm_current")
+    current = dict(fvs)
+    assert current["avg"] == "2.0" and current["max"] == "3" and current["validity"] == "incomplete"
+    _, fvs = history.get_entry("FAN", f"FAN-1-7_Speed:15_pm_history_{START}")
+    his = dict(fvs)
+    assert his["starttime"] == str(START) and his["avg"] == "2.0" and his["validity"] == "incomplete"
+    assert engine.stats()["dirty"] == 0
+
+def test_eviction_mid_bin_rolls_the_bin_up(engine, monkeypatch) :
+    monkeypatch.setattr(pm, "PM_DERIVE_24", True)
+    pm15, = pm.get_pms("FAN", "FAN-1-7", "Speed")
+    pm24 = pm.get_pm("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_24)
+    # the last bin of the day, its eviction does not close the day
+    at(monkeypatch, START + 95 * BIN)
+    pm.update_pms([pm15], [4])
+    pm.update_pms([pm15], [6])
+
+    fill(3, 8)
+
+    assert pm.get_pms_of("FAN-1-7") == [pm24]
+    assert engine.value(pm24.row, "count") == 2 and pm24.avg == 5.0
+    assert engine.value(pm24.row, "starttime") == START
+
+def test_clear_drops_the_pms_and_keys_of_one_resource(engine, monkeypatch) :
+    monkeypatch.setattr(pm, "PM_REGISTRY_MAX", 0)
+    counters = db.get_dbs("FAN-1-7", [db.COUNTERS_DB])[db.COUNTERS_DB]
+    for name in ("FAN-1-7", "FAN-1-70") :
+        pms = pm.get_pms("FAN", name, "Speed")
+        pm.update_pms(pms, [9000] * len(pms))
+    assert len(pm.list_pm_keys("FAN-1-7")) == 2
+
+    pm.clearPmByName("FAN-1-7")
+
+    assert pm.get_pms_of("FAN-1-7") == []
+    assert pm.list_pm_keys("FAN-1-7") == []
+    assert sorted(counters.get_keys("FAN")) == ["FAN-1-70_Speed:15_pm_current", "FAN-1-70_Speed:24_pm_current"]
+    # dropped, not flushed to history
+    history = db.get_dbs("FAN-1-7", [db.HISTORY_DB])[db.HISTORY_DB]
+    assert history.get_keys("FAN") == []
@@ -0,0 +1,76 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import math
+import time
+import types
+import random
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+import otn_pmon.db as db
+import otn_pmon.pm as pm
+
+SEC = 1000000000
+BIN = 15 * 60 * SEC
+DAY = 24 * 60 * 60 * SEC
+START = 1700000000 * SEC // DAY * DAY
+
+def at(monkeypatch, ns) :
+    monkeypatch.setattr(pm, "time", types.SimpleNamespace(time = lambda : ns / SEC, monotonic = time.monotonic))
+
+def feed_day(monkeypatch, monitored) :
+    # samples in the last three bins of a day, then one in the next day to close it
+    rnd = random.Random(3)
+    for b in (93, 94, 95) :
+        for i in range(40) :
+            at(monkeypatch, START + b * BIN + i * 20 * SEC)
+            value = rnd.gauss(40, 5) if b != 94 else rnd.gauss(60, 2)
+            pm.update_pms(monitored, [value] * len(monitored))
+    at(monkeypatch, START + DAY)
+    pm.update_pms(monitored, [0.0] * len(monitored))
+
+def pms(monkeypatch, name, derive) :
+    monkeypatch.setattr(pm, "PM_DERIVE_24", derive)
+    return pm.get_pms("FAN", name, "Temperature")
+
+def test_rolled_up_day_matches_the_direct_one(pm_engine, monkeypatch) :
+    derived = pms(monkeypatch, "FAN-1-7", True)
+    direct = pms(monkeypatch, "FAN-1-8", False)
+    feed_day(monkeypatch, derived + direct)
+
+    history = db.get_dbs("FAN-1-7", [db.HISTORY_DB])[db.HISTORY_DB]
+    day = lambda name : dict(history.get_entry("FAN", f"{name}_Temperature:24_pm_history_{START}")[1])
+    rolled, computed = day("FAN-1-7"), day("FAN-1-8")
+    assert rolled["starttime"] == computed["starttime"] == str(START)
+    for field in ("avg", "min", "max", "min-time", "max-time", "stddev", "validity") :
+        assert rolled[field] == computed[field], field
+    # estimated from the samples of the whole day only
+    assert "p99" in computed
+    assert not [f for f in rolled if f.startswith("p")]
+
+def test_rolled_up_day_has_no_packed_percentiles(pm_engine, monkeypatch) :
+    monkeypatch.setattr(pm, "PM_HISTORY_FORMAT", "packed")
+    derived = pms(monkeypatch, "FAN-1-7", True)
+    direct = pms(monkeypatch, "FAN-1-8", False)
+    feed_day(monkeypatch, derived + direct)
+
+    day = lambda name : pm.query_pm_history("FAN", name, "Temperature", pm.Pm.PM_TYPE_24, START, START)
+    rolled, computed = day("FAN-1-7"), day("FAN-1-8")
+    assert list(rolled["count"]) == list(computed["count"]) == [120]
+    assert list(rolled["stddev"]) == list(computed["stddev"])
+    assert math.isnan(rolled["p50"][0]) and not math.isnan(computed["p50"][0])
@@ -0,0 +1,64 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import types
+import random
+import statistics
+from array import array
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+
+import otn_pmon.db as db
+import otn_pmon.pm as pm
+
+def estimate(values) :
+    q = array('d', [0.0] * pm._P2_MARKERS)
+    n = array('d', [0.0] * pm._P2_MARKERS)
+    for count, v in enumerate(values, 1) :
+        pm._p2_add(q, n, 0, v, count)
+    return [pm._p2_quantile(q, n, 0, len(values), i) for i in range(len(pm.PM_PERCENTILES))]
+
+def exact(values) :
+    cuts = statistics.quantiles(values, n = 100, method = "inclusive")
+    return [cuts[round(p * 100) - 1] for p in pm.PM_PERCENTILES]
+
+def test_as_many_samples_as_markers_are_exact() :
+    assert pm._P2_MARKERS == 9
+    assert estimate(range(1, 10)) == pytest.approx([5, 8.6, 8.92])
+    # whatever their order
+    assert estimate([9, 1, 8, 2, 7, 3, 6, 4, 5]) == pytest.approx([5, 8.6, 8.92])
+
+@pytest.mark.parametrize("size, tolerance", [(9, 0), (10, 0.1), (30, 0.2), (1000, 0.05)])
+def test_estimates_follow_the_exact_quantiles(size, tolerance) :
+    rnd = random.Random(size)
+    values = [rnd.gauss(40, 5) for _ in range(size)]
+    spread = max(values) - min(values)
+    # relative to the spread of the samples
+    assert estimate(values) == pytest.approx(exact(values), abs = tolerance * spread + 1e-9)
+
+def test_bin_statistics_are_written(pm_engine, monkeypatch) :
+    # all in one bin
+    monkeypatch.setattr(pm, "time", types.SimpleNamespace(time = lambda : 1700000000.0, monotonic = time.monotonic))
+    p = pm.get_pm("FAN", "FAN-1-7", "Speed", pm.Pm.PM_TYPE_15)
+    for v in range(1, 10) :
+        pm.update_pms([p], [v])
+    counters = db.get_dbs("FAN-1-7", [db.COUNTERS_DB])[db.COUNTERS_DB]
+    _, fvs = counters.get_entry("FAN", "FAN-1-7_Speed:15_pm_current")
+    fields = dict(fvs)
+    assert (fields["p50"], fields["p95"], fields["p99"]) == ("5.0", "8.6", "8.9")
+    assert fields["stddev"] == str(round(statistics.pstdev(range(1, 10)), 1))
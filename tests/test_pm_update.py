@@ -0,0 +1,83 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import pytest
+
+pytest.importorskip("swsscommon")
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+import otn_pmon.pm as pm
+import otn_pmon.fan as fan
+import otn_pmon.psu as psu
+from otn_pmon.thrift_api.ttypes import fan_speed
+
+@pytest.fixture
+def updates(pm_engine, monkeypatch) :
+    # the rows of each engine update
+    calls = []
+    update = pm_engine.update
+
+    def recorded(rows, generations, values) :
+        calls.append(list(zip(rows, values)))
+        update(rows, generations, values)
+
+    monkeypatch.setattr(pm_engine, "update", recorded)
+    return calls
+
+def build(cls, name, **attrs) :
+    p = object.__new__(getattr(cls, "__wrapped__", cls))
+    p.name = name
+    p.table_name = name.split("-")[0]
+    p.__dict__.update(attrs)
+    return p
+
+def current(swss_dbs, table, key) :
+    counters = swss_dbs.get_dbs(key.split("_")[0], [swss_dbs.COUNTERS_DB])[swss_dbs.COUNTERS_DB]
+    return dict(counters.get_entry(table, key)[1])
+
+def test_fan_cycle_is_one_update(swss_dbs, pm_engine, updates) :
+    f = build(fan.Fan, "FAN-1-7", get_temperature = lambda : 31.5,
+              _Fan__get_speed = lambda : fan_speed(front = 9000, behind = 8800))
+    f.update_pm()
+
+    # the 15 minute and 24 hour pms of the 3 metrics
+    assert len(updates) == 1 and len(updates[0]) == 6
+    assert sorted(v for _, v in updates[0]) == [31.5, 31.5, 8800, 8800, 9000, 9000]
+    assert current(swss_dbs, "FAN", "FAN-1-7_Speed:15_pm_current")["instant"] == "9000"
+    assert current(swss_dbs, "FAN", "FAN-1-7_Speed_2:24_pm_current")["instant"] == "8800"
+    assert current(swss_dbs, "FAN", "FAN-1-7_Temperature:15_pm_current")["instant"] == "31.5"
+
+def test_fan_without_speed_still_updates_its_temperature(swss_dbs, pm_engine, updates) :
+    f = build(fan.Fan, "FAN-1-7", get_temperature = lambda : 31.5, _Fan__get_speed = lambda : None)
+    f.update_pm()
+    assert len(updates) == 1 and len(updates[0]) == 2
+    assert current(swss_dbs, "FAN", "FAN-1-7_Speed:15_pm_current") == {}
+
+def test_psu_cycle_is_one_update(swss_dbs, pm_engine, updates) :
+    from otn_pmon.thrift_api.ttypes import psu_info
+    info = psu_info(iin = 1.5, vin = 220, pin = 330, iout = 25, pout = 300, vout = 12,
+                    ambient_temp = 30, primary_temp = 40, secondary_temp = 35, fan = 6000)
+    p = build(psu.Psu, "PSU-1-5", get_temperature = lambda : 33.0, _Psu__get_psu_info = lambda : info)
+    p.update_pm()
+    assert len(updates) == 1 and len(updates[0]) == 22
+    assert current(swss_dbs, "PSU", "PSU-1-5_InputVoltage:15_pm_current")["instant"] == "220"
+
+def test_derived_24_hour_pms_are_not_fed(swss_dbs, pm_engine, updates, monkeypatch) :
+    monkeypatch.setattr(pm, "PM_DERIVE_24", True)
+    f = build(fan.Fan, "FAN-1-7", get_temperature = lambda : 31.5,
+              _Fan__get_speed = lambda : fan_speed(front = 9000, behind = 8800))
+    f.update_pm()
+    assert len(updates) == 1 and len(updates[0]) == 3
@@ -0,0 +1,98 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import threading
+import pytest
+
+import otn_pmon.cache as cache
+from otn_pmon.cache import SingleFlight
+
+class Slow(object) :
+    """blocks its callers until released, counts the calls made"""
+    def __init__(self, error = None) :
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+
+    def __call__(self) :
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error :
+            raise self.error
+        return self.calls
+
+def run_concurrently(sf, key, func, callers) :
+    results = []
+    errors = []
+
+    def call() :
+        try :
+            results.append(sf.do(key, func))
+        except Exception as e :
+            errors.append(e)
+
+    leader = threading.Thread(target = call)
+    leader.start()
+    func.started.wait(5)
+    followers = [threading.Thread(target = call) for _ in range(callers - 1)]
+    for t in followers :
+        t.start()
+    # the followers are waiting once they are counted as shared
+    while sf.stats()["shared"] < callers - 1 :
+        time.sleep(0.001)
+    func.release.set()
+    for t in [leader] + followers :
+        t.join()
+    return results, errors
+
+def test_concurrent_callers_share_one_call() :
+    sf = SingleFlight()
+    func = Slow()
+    results, errors = run_concurrently(sf, ("no-window", 1), func, 5)
+    assert results == [1] * 5 and not errors
+    assert func.calls == 1
+    assert sf.stats() == {"executed" : 1, "shared" : 4}
+
+    # without a freshness window a later caller calls again
+    assert sf.do(("no-window", 1), func) == 2
+
+def test_error_is_shared_with_waiters_only() :
+    sf = SingleFlight()
+    func = Slow(RuntimeError("rpc failed"))
+    results, errors = run_concurrently(sf, ("temperature", 1), func, 3)
+    assert not results and len(errors) == 3
+    assert all(e is errors[0] for e in errors)
+    assert func.calls == 1
+
+    # a failure is not served from the freshness window
+    func.error = None
+    assert sf.do(("temperature", 1), func) == 2
+
+def test_result_is_shared_within_the_freshness_window(monkeypatch) :
+    monkeypatch.setitem(cache.SINGLE_FLIGHT_FRESHNESS, "temperature", 0.05)
+    sf = SingleFlight()
+    func = Slow()
+    func.release.set()
+    assert sf.do(("temperature", 1), func) == 1
+    assert sf.do(("temperature", 1), func) == 1
+    # other keys are not coalesced
+    assert sf.do(("temperature", 2), func) == 2
+
+    time.sleep(0.06)
+    assert sf.do(("temperature", 1), func) == 3
+    assert sf.stats() == {"executed" : 3, "shared" : 1}
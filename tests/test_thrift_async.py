@@ -0,0 +1,66 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import asyncio
+import pytest
+
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+import otn_pmon.thrift_client as thrift_client
+from otn_pmon.thrift_api.ttypes import periph_type
+
+LATENCY = 0.2
+
+@pytest.fixture
+def executor(monkeypatch) :
+    # the executor is sized from the pool at first use, give each test its own
+    monkeypatch.setattr(thrift_client, "_executor", None)
+    yield
+    if thrift_client._executor :
+        thrift_client._executor.shutdown()
+
+def test_calls_are_concurrent(periph_server, executor) :
+    periph_server({"latency" : {"periph_presence" : LATENCY}})
+    client = thrift_client.AsyncThriftClient()
+
+    async def poll() :
+        return await asyncio.gather(*[client.periph_presence(periph_type.FAN, id) for id in range(7, 12)])
+
+    start = time.monotonic()
+    assert asyncio.run(poll()) == [True] * 5
+    # five calls in flight at once take about one latency, not five
+    assert time.monotonic() - start < 3 * LATENCY
+    assert thrift_client.get_pool_stats()["connects"] == 5
+
+def test_executor_is_bounded_by_the_pool(periph_server, executor, monkeypatch) :
+    periph_server()
+    monkeypatch.setattr(thrift_client, "_pool", thrift_client.ThriftClientPool(size = 2))
+    assert thrift_client.get_executor()._max_workers == 2
+    assert thrift_client.get_executor() is thrift_client.get_executor()
+
+def test_run_blocking(executor) :
+    async def run() :
+        return await thrift_client.run_blocking(sum, [1, 2, 3])
+
+    assert asyncio.run(run()) == 6
+
+def test_unknown_method() :
+    client = thrift_client.AsyncThriftClient()
+    with pytest.raises(AttributeError) :
+        client.no_such_rpc
+    with pytest.raises(AttributeError) :
+        client._private
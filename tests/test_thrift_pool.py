@@ -0,0 +1,71 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import threading
+import pytest
+
+pytest.importorskip("sonic_py_common")
+pytest.importorskip("otn_pmon.thrift_api.periph_rpc")
+
+from thrift.Thrift import TException
+import otn_pmon.thrift_client as thrift_client
+from otn_pmon.thrift_api.ttypes import periph_type
+
+def presence(client) :
+    return client.periph_presence(periph_type.FAN, 9)
+
+def test_connection_is_reused(periph_server) :
+    periph_server()
+    for _ in range(10) :
+        assert thrift_client.thrift_try(presence)
+
+    stats = thrift_client.get_pool_stats()
+    assert stats["connects"] == 1 and stats["reuses"] == 9
+    assert stats["idle"] == 1 and stats["in-use"] == 0
+
+def test_concurrent_calls_stay_within_the_pool_size(periph_server, monkeypatch) :
+    periph_server({"latency" : {"*" : 0.05}})
+    monkeypatch.setattr(thrift_client, "_pool", thrift_client.ThriftClientPool(size = 2))
+    threads = [threading.Thread(target = thrift_client.thrift_try, args = (presence, )) for _ in range(6)]
+    for t in threads :
+        t.start()
+    for t in threads :
+        t.join()
+
+    stats = thrift_client.get_pool_stats()
+    assert stats["connects"] == 2 and stats["reuses"] == 4 and stats["in-use"] == 0
+
+def test_failed_connection_is_not_reused(periph_server) :
+    periph_server()
+    thrift_client.thrift_try(presence)
+
+    def fail(client) :
+        raise TException("broken")
+
+    with pytest.raises(TException) :
+        thrift_client.thrift_try(fail, attempts = 1)
+    assert thrift_client.thrift_try(presence)
+
+    stats = thrift_client.get_pool_stats()
+    assert stats["discards"] == 1 and stats["connects"] == 2
+
+def test_codec_change_reopens_pooled_connections(periph_server) :
+    periph_server()
+    thrift_client.thrift_try(presence)
+    thrift_client.set_thrift_codec()
+    thrift_client.thrift_try(presence)
+
+    stats = thrift_client.get_pool_stats()
+    assert stats["connects"] == 2 and stats["reuses"] == 0
@@ -0,0 +1,179 @@
+##
+#   Copyright (c) 2021 Alibaba Group and Accelink Technologies
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   THIS CODE IS PROVIDED ON AN *AS IS* BASIS, WITHOUT WARRANTIES OR
+#   CONDITIONS OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT
+#   LIMITATION ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS
+#   FOR A PARTICULAR PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+#   See the Apache Version 2.0 License for specific language governing
+#   permissions and limitations under the License.
+##
+
+import time
+import threading
+import pytest
+
+pytest.importorskip("sonic_py_common")
+
+from thrift.Thrift import TException
+import otn_pmon.thrift_client as thrift_client
+from otn_pmon.thrift_client import RetryPolicy, CircuitBreaker, CircuitOpenError, PoolExhaustedError
+
+def presence(client) :
+    return client.periph_presence(3, 7)
+
+def failing(times) :
+    # fails the first times calls with a server error, then asks the server
+    calls = []
+
+    def func(client) :
+        calls.append(1)
+        if len(calls) <= times :
+            raise TException("injected")
+        return presence(client)
+    return func, calls
+
+def test_delay_backs_off_up_to_max() :
+    policy = RetryPolicy(backoff = 0.1, backoff_max = 1, jitter = 0)
+    assert [policy.delay(a) for a in range(6)] == pytest.approx([0.1, 0.2, 0.4, 0.8, 1, 1])
+
+def test_delay_jitter_stays_in_bounds() :
+    policy = RetryPolicy(backoff = 1, backoff_max = 1, jitter = 0.2)
+    delays = [policy.delay(0) for _ in range(200)]
+    assert all(0.8 <= d <= 1.2 for d in delays)
+    assert len(set(delays)) > 1
+
+def test_retries_until_success(periph_server) :
+    periph_server()
+    func, calls = failing(2)
+    assert thrift_client.thrift_try(func)
+    assert len(calls) == 3
+    assert thrift_client.get_breaker().stats() == {"state" : "closed", "failures" : 0, "opens" : 0, "rejects" : 0}
+
+def test_gives_up_after_attempts(periph_server) :
+    periph_server()
+    func, calls = failing(10)
+    with pytest.raises(TException) :
+        thrift_client.thrift_try(func, attempts = 2)
+    assert len(calls) == 2
+
+def test_gives_up_when_budget_is_spent(periph_server) :
+    periph_server()
+    func, calls = failing(10)
+    policy = RetryPolicy(attempts = 10, backoff = 0.1, backoff_max = 0.1, jitter = 0, budget = 0.35)
+    start = time.monotonic()
+    with pytest.raises(TException) :
+        thrift_client.thrift_try(func, policy = policy)
+    # attempts at 0, 0.1, 0.2 and 0.3s, the retry which would start past the budget is not made
+    assert len(calls) == 4
+    assert time.monotonic() - start < 0.35
+
+def test_injected_errors_are_retried(periph_server, monkeypatch) :
+    _, injector = periph_server({"error_rate" : {"periph_presence" : 0.3}}, seed = 1)
+    monkeypatch.setattr(thrift_client, "_breaker", CircuitBreaker(failure_threshold = 100))
+    for _ in range(20) :
+        assert thrift_client.thrift_try(presence, attempts = 10)
+    assert injector.errors["periph_presence"] > 0
+    assert injector.calls["periph_presence"] == 20 + injector.errors["periph_presence"]
+
+def test_breaker_opens_probes_and_closes() :
+    breaker = CircuitBreaker(failure_threshold = 3, recovery_timeout = 0.05)
+    for _ in range(3) :
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.stats()["state"] == CircuitBreaker.OPEN
+    assert not breaker.allow() and not breaker.available()
+
+    time.sleep(0.06)
+    assert breaker.available()
+    # a single probe is let through
+    assert breaker.allow()
+    assert breaker.stats()["state"] == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.stats() == {"state" : "closed", "failures" : 0, "opens" : 1, "rejects" : 2}
+
+def test_failed_probe_reopens() :
+    breaker = CircuitBreaker(failure_threshold = 1, recovery_timeout = 0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.stats()["state"] == CircuitBreaker.OPEN
+    assert breaker.stats()["opens"] == 2
+    # the recovery timeout starts again
+    assert not breaker.allow()
+
+def test_released_probe_lets_the_next_call_probe() :
+    breaker = CircuitBreaker(failure_threshold = 1, recovery_timeout = 0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.stats()["state"] == CircuitBreaker.OPEN
+    assert breaker.allow()
+
+def test_open_circuit_rejects_calls(periph_server, monkeypatch) :
+    periph_server()
+    breaker = CircuitBreaker(failure_threshold = 2, recovery_timeout = 0.05)
+    monkeypatch.setattr(thrift_client, "_breaker", breaker)
+    func, calls = failing(2)
+    with pytest.raises(TException) :
+        thrift_client.thrift_try(func, attempts = 2)
+    assert not thrift_client.thrift_available()
+    with pytest.raises(CircuitOpenError) :
+        thrift_client.thrift_try(func)
+    assert len(calls) == 2
+
+    # the probe reaches the recovered server and closes the circuit
+    time.sleep(0.06)
+    assert thrift_client.thrift_try(func)
+    assert thrift_client.get_breaker_state() == CircuitBreaker.CLOSED
+
+def test_local_error_gives_the_probe_back(periph_server, monkeypatch) :
+    periph_server()
+    breaker = CircuitBreaker(failure_threshold = 1, recovery_timeout = 0)
+    monkeypatch.setattr(thrift_client, "_breaker", breaker)
+    breaker.record_failure()
+
+    def bug(client) :
+        raise KeyError("local")
+
+    with pytest.raises(KeyError) :
+        thrift_client.thrift_try(bug)
+    assert breaker.stats()["state"] == CircuitBreaker.OPEN
+    assert breaker.stats()["failures"] == 1
+
+def test_pool_exhaustion_is_not_a_server_failure(periph_server, monkeypatch) :
+    periph_server()
+    pool = thrift_client.ThriftClientPool(size = 1)
+    monkeypatch.setattr(thrift_client, "_pool", pool)
+    breaker = CircuitBreaker(failure_threshold = 1)
+    monkeypatch.setattr(thrift_client, "_breaker", breaker)
+    held = threading.Event()
+    done = threading.Event()
+
+    def hold(client) :
+        held.set()
+        done.wait(5)
+        return presence(client)
+
+    holder = threading.Thread(target = thrift_client.thrift_try, args = (hold, ))
+    holder.start()
+    held.wait(5)
+    policy = RetryPolicy(attempts = 3, budget = 0.1)
+    start = time.monotonic()
+    with pytest.raises(PoolExhaustedError) :
+        thrift_client.thrift_try(presence, policy = policy)
+    # the wait for a connection is bounded by the budget, not the pool acquire timeout
+    assert time.monotonic() - start < 1
+    done.set()
+    holder.join()
+
+    assert pool.stats()["exhausted"] == 1
+    assert breaker.stats() == {"state" : "closed", "failures" : 0, "opens" : 0, "rejects" : 0}